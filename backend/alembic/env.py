@@ -16,6 +16,11 @@ from app.models.user import User, TopicCandidate, EraMemoryPreset  # noqa: F401
 from app.models.conversation import Conversation, Message  # noqa: F401
 from app.models.memoir import Memoir  # noqa: F401
 from app.models.audit_log import AuditLog  # noqa: F401
+from app.models.llm_cache import LLMCacheEntry  # noqa: F401
+from app.models.llm_usage import LLMUsage  # noqa: F401
+from app.models.job import Job  # noqa: F401
+from app.models.user_activity import UserDailyActivity  # noqa: F401
+from app.models.memoir_progress import MemoirProgressState  # noqa: F401
 
 config = context.config
 
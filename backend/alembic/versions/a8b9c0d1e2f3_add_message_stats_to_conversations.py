@@ -0,0 +1,68 @@
+"""add message stats to conversations
+
+Revision ID: a8b9c0d1e2f3
+Revises: f7a8b9c0d1e2
+Create Date: 2026-03-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8b9c0d1e2f3'
+down_revision: Union[str, None] = 'f7a8b9c0d1e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('conversations', sa.Column('first_message_at', sa.DateTime(), nullable=True))
+    op.add_column('conversations', sa.Column('last_message_at', sa.DateTime(), nullable=True))
+    op.add_column('conversations', sa.Column('message_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('conversations', sa.Column('user_chars', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('conversations', sa.Column('assistant_chars', sa.Integer(), nullable=False, server_default='0'))
+
+    # 回填已有对话的统计
+    if op.get_bind().dialect.name == 'postgresql':
+        # 一次聚合所有消息再批量更新
+        op.execute("""
+            UPDATE conversations AS c SET
+                first_message_at = s.first_at,
+                last_message_at = s.last_at,
+                message_count = s.cnt,
+                user_chars = s.user_chars,
+                assistant_chars = s.assistant_chars
+            FROM (
+                SELECT conversation_id,
+                       MIN(created_at) AS first_at,
+                       MAX(created_at) AS last_at,
+                       COUNT(*) AS cnt,
+                       COALESCE(SUM(CASE WHEN role = 'user' THEN LENGTH(content) END), 0) AS user_chars,
+                       COALESCE(SUM(CASE WHEN role <> 'user' THEN LENGTH(content) END), 0) AS assistant_chars
+                FROM messages
+                GROUP BY conversation_id
+            ) AS s
+            WHERE c.id = s.conversation_id
+        """)
+    else:
+        op.execute("""
+            UPDATE conversations SET
+                first_message_at = (SELECT MIN(created_at) FROM messages m WHERE m.conversation_id = conversations.id),
+                last_message_at = (SELECT MAX(created_at) FROM messages m WHERE m.conversation_id = conversations.id),
+                message_count = (SELECT COUNT(*) FROM messages m WHERE m.conversation_id = conversations.id),
+                user_chars = (SELECT COALESCE(SUM(LENGTH(content)), 0) FROM messages m
+                              WHERE m.conversation_id = conversations.id AND m.role = 'user'),
+                assistant_chars = (SELECT COALESCE(SUM(LENGTH(content)), 0) FROM messages m
+                                   WHERE m.conversation_id = conversations.id AND m.role <> 'user')
+        """)
+
+
+def downgrade() -> None:
+    op.drop_column('conversations', 'assistant_chars')
+    op.drop_column('conversations', 'user_chars')
+    op.drop_column('conversations', 'message_count')
+    op.drop_column('conversations', 'last_message_at')
+    op.drop_column('conversations', 'first_message_at')
@@ -0,0 +1,58 @@
+"""add user daily activity rollup
+
+Revision ID: b9c0d1e2f3a4
+Revises: a8b9c0d1e2f3
+Create Date: 2026-03-20 10:00:00.000000
+
+汇总表的数据由 analytics_rollup 定时任务填充（表为空时第一次运行会全量回填）。
+两个辅助索引在 PostgreSQL 上用 CREATE INDEX CONCURRENTLY 建，不锁表。
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b9c0d1e2f3a4'
+down_revision: Union[str, None] = 'a8b9c0d1e2f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (索引名, 表名, 列)
+INDEXES = [
+    ('ix_conversations_last_message_at', 'conversations', ['last_message_at']),
+    ('ix_memoirs_created_at', 'memoirs', ['created_at']),
+]
+
+
+def upgrade() -> None:
+    op.create_table(
+        'user_daily_activity',
+        sa.Column('user_id', sa.String(36), sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('conversations', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('messages', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('memoirs', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_user_daily_activity_day', 'user_daily_activity', ['day'])
+
+    is_postgres = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False, if_not_exists=True,
+                postgresql_concurrently=is_postgres,
+            )
+
+
+def downgrade() -> None:
+    is_postgres = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=is_postgres)
+
+    op.drop_index('ix_user_daily_activity_day', table_name='user_daily_activity')
+    op.drop_table('user_daily_activity')
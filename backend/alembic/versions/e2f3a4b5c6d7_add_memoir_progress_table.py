@@ -0,0 +1,38 @@
+"""add memoir progress table
+
+Revision ID: e2f3a4b5c6d7
+Revises: d1e2f3a4b5c6
+Create Date: 2026-03-26 10:00:00.000000
+
+回忆录生成进度快照，供其他 worker 进程的 SSE 订阅方轮询（见 memoir_progress）。
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2f3a4b5c6d7'
+down_revision: Union[str, None] = 'd1e2f3a4b5c6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'memoir_progress',
+        sa.Column('memoir_id', sa.String(36), sa.ForeignKey('memoirs.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('stage', sa.String(20), nullable=False, server_default=''),
+        sa.Column('detail', sa.String(200), nullable=False, server_default=''),
+        sa.Column('draft', sa.Text(), nullable=False, server_default=''),
+        sa.Column('draft_round', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('error_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('memoir_progress')
@@ -0,0 +1,52 @@
+"""add hot path indexes
+
+Revision ID: f7a8b9c0d1e2
+Revises: e6f7a8b9c0d1
+Create Date: 2026-03-16 10:00:00.000000
+
+PostgreSQL 上用 CREATE INDEX CONCURRENTLY 建索引，不锁表（需在事务外执行）。
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7a8b9c0d1e2'
+down_revision: Union[str, None] = 'e6f7a8b9c0d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+COMPLETED_ACTIVE = "status = 'completed' AND deleted_at IS NULL"
+
+# (索引名, 表名, 列, 部分索引条件)
+INDEXES = [
+    ('ix_messages_conversation_created', 'messages', ['conversation_id', 'created_at'], None),
+    ('ix_conversations_user_created', 'conversations', ['user_id', 'created_at'], None),
+    ('ix_memoirs_user_order', 'memoirs', ['user_id', 'order_index'], None),
+    ('ix_memoirs_user_completed', 'memoirs', ['user_id', 'created_at'], COMPLETED_ACTIVE),
+    ('ix_memoirs_conversation', 'memoirs', ['conversation_id'], None),
+    ('ix_topic_candidates_user_id', 'topic_candidates', ['user_id'], None),
+    ('ix_era_memories_preset_years', 'era_memories_preset', ['start_year', 'end_year'], None),
+]
+
+
+def upgrade() -> None:
+    is_postgres = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False, if_not_exists=True,
+                postgresql_concurrently=is_postgres,
+                postgresql_where=sa.text(where) if where else None,
+                sqlite_where=sa.text(where) if where else None,
+            )
+
+
+def downgrade() -> None:
+    is_postgres = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=is_postgres)
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api import user, conversation, memoir, asr, realtime, realtime_enhanced, topic, auth
+from app.api import user, conversation, memoir, asr, realtime, realtime_enhanced, topic, auth, job
 
 router = APIRouter()
 
@@ -12,3 +12,4 @@ router.include_router(asr.router, prefix="/asr", tags=["语音识别"])
 router.include_router(realtime.router, prefix="/realtime", tags=["实时对话"])
 router.include_router(realtime_enhanced.router, prefix="/realtime-enhanced", tags=["实时对话-增强模式"])
 router.include_router(topic.router, prefix="/topic", tags=["话题"])
+router.include_router(job.router, prefix="/job", tags=["任务"])
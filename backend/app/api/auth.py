@@ -1,22 +1,36 @@
 """认证相关路由：登录、管理员创建用户、用户管理"""
+import csv
+import io
+import json
 import logging
 import secrets
 import string
-from datetime import datetime
-from typing import Optional, List
-
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
-from sqlalchemy import func
+import uuid
+from datetime import date, datetime
+from typing import Any, Dict, Optional, List, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import and_, case, distinct, func, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from app.database import get_db
-from app.models import User, TopicCandidate, WelcomeMessage, PresetTopic
+from app.database import get_db, SessionLocal
+from app.models import User, TopicCandidate, WelcomeMessage, PresetTopic, Job
 from app.models.conversation import Conversation, Message
 from app.models.memoir import Memoir
 from app.models.audit_log import AuditLog
-from app.auth import hash_password, verify_password, create_token, verify_admin_key
+from app.models.user_activity import UserDailyActivity
+from app.auth import (
+    hash_password, hash_passwords, verify_and_update_password, create_token, verify_admin_key,
+    auth_cache, bump_auth_version, password_hasher,
+)
+from app.api.job import accepted, job_event_stream
+from app.api.pagination import clamp_limit, decode_cursor, list_response, page, page_params
+from app.services.job_queue import job_queue, PRIORITY_HIGH
 from app.services.profile_service import auto_set_preferred_name
+from app.services.analytics_rollup import analytics_rollup, to_date
 
 logger = logging.getLogger(__name__)
 
@@ -50,10 +64,15 @@ def login(req: LoginRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=401, detail="手机号或密码错误")
     if not user.password_hash:
         raise HTTPException(status_code=401, detail="该账号未设置密码")
-    if not verify_password(req.password, user.password_hash):
+    ok, new_hash = verify_and_update_password(req.password, user.password_hash)
+    if not ok:
         raise HTTPException(status_code=401, detail="手机号或密码错误")
     if not user.is_active:
         raise HTTPException(status_code=403, detail="该账号已被禁用")
+    if new_hash:
+        # bcrypt_rounds 调整过：用这次登录的明文换成新 cost 的哈希
+        user.password_hash = new_hash
+        db.commit()
 
     token = create_token(user.id)
     return LoginResponse(
@@ -123,6 +142,329 @@ def admin_create_user(
     return AdminCreateUserResponse(user_id=user.id, phone=user.phone)
 
 
+# ========== 管理员：批量创建用户 ==========
+# 社区活动一次开一批账号：整批先校验、一次查手机号冲突、密码并行哈希、分批事务写入。
+# 哈希和写库放在任务队列里跑，接口立即返回任务 ID，结果（每行的报告）在任务 result 里
+
+BULK_MAX_ROWS = 1000
+BULK_BATCH_SIZE = 200
+
+# CSV 表头（支持中文表头，方便直接从 Excel 导出）
+_BULK_CSV_COLUMNS = {
+    "phone": "phone", "手机号": "phone",
+    "password": "password", "密码": "password",
+    "nickname": "nickname", "姓名": "nickname",
+    "gender": "gender", "性别": "gender",
+    "birth_year": "birth_year", "出生年份": "birth_year",
+    "hometown": "hometown", "家乡": "hometown",
+    "main_city": "main_city", "常住城市": "main_city",
+}
+
+
+class AdminBulkUserRow(BaseModel):
+    phone: str
+    password: Optional[str] = None  # 留空则自动生成，在提交的响应里返回
+    nickname: str
+    gender: str
+    birth_year: Optional[int] = None
+    hometown: Optional[str] = None
+    main_city: Optional[str] = None
+
+
+class AdminBulkUserResult(BaseModel):
+    row: int  # 第几条数据（从 1 开始，不含表头）
+    phone: Optional[str] = None
+    status: str  # created / invalid / conflict
+    user_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class AdminBulkPassword(BaseModel):
+    row: int
+    phone: str
+    password: str  # 自动生成的密码，只在提交时返回这一次
+
+
+class AdminBulkCreateResponse(BaseModel):
+    total: int
+    created: int
+    failed: int
+    dry_run: bool
+    results: List[AdminBulkUserResult]
+
+
+def _random_password(length: int = 8) -> str:
+    alphabet = string.ascii_letters + string.digits
+    return ''.join(secrets.choice(alphabet) for _ in range(length))
+
+
+def _parse_bulk_rows(content_type: str, body: bytes) -> List[Dict[str, Any]]:
+    """请求体解析成原始行：text/csv 按表头读，否则按 JSON（数组或 {"users": [...]}）"""
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="请使用 UTF-8 编码")
+
+    if "csv" in content_type:
+        reader = csv.DictReader(io.StringIO(text))
+        unknown = [h for h in (reader.fieldnames or []) if h and h.strip() not in _BULK_CSV_COLUMNS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"无法识别的表头：{'、'.join(unknown)}")
+        return [
+            {
+                _BULK_CSV_COLUMNS[k.strip()]: (v.strip() or None) if isinstance(v, str) else v
+                for k, v in record.items() if k
+            }
+            for record in reader
+        ]
+
+    try:
+        data = json.loads(text)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="请求体不是合法的 JSON 或 CSV")
+    if isinstance(data, dict):
+        data = data.get("users")
+    if not isinstance(data, list):
+        raise HTTPException(status_code=400, detail="JSON 格式应为用户数组或 {\"users\": [...]}")
+    return data
+
+
+def _bulk_phone(raw: Any) -> Optional[str]:
+    """原始行里的手机号转成字符串（JSON 里可能写成数字）；没有或不是字符串 / 整数时返回 None"""
+    value = raw.get("phone") if isinstance(raw, dict) else None
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        return None
+    return str(value).strip()[:32]
+
+
+def _validate_bulk_rows(db: Session, raw_rows: List[Any]) -> Tuple[List[Tuple[int, AdminBulkUserRow]], List[AdminBulkUserResult]]:
+    """逐行校验 + 一次查库比对手机号，返回 (可创建的行, 失败结果)"""
+    valid, failed, seen = [], [], set()
+    for index, raw in enumerate(raw_rows, start=1):
+        # 失败结果里只放转换过的手机号，不直接用原始输入构造结果
+        phone = _bulk_phone(raw)
+        try:
+            if not isinstance(raw, dict):
+                raise ValueError("格式不正确")
+            if phone is None and raw.get("phone") is not None:
+                raise ValueError("手机号应为字符串或数字")
+            row = AdminBulkUserRow(**{**raw, "phone": phone or ""})
+            row.phone = row.phone.strip()
+            if not row.phone:
+                raise ValueError("手机号不能为空")
+            if row.gender not in ("男", "女"):
+                raise ValueError("性别应为 男 或 女")
+        except ValidationError as e:
+            err = e.errors()[0]
+            failed.append(AdminBulkUserResult(
+                row=index, phone=phone, status="invalid",
+                error=f"{'.'.join(str(x) for x in err['loc'])}: {err['msg']}",
+            ))
+            continue
+        except ValueError as e:
+            failed.append(AdminBulkUserResult(row=index, phone=phone, status="invalid", error=str(e)))
+            continue
+        if row.phone in seen:
+            failed.append(AdminBulkUserResult(row=index, phone=row.phone, status="conflict", error="与前面的行手机号重复"))
+            continue
+        seen.add(row.phone)
+        valid.append((index, row))
+
+    # 已注册的手机号：分块一次性查出
+    phones = [row.phone for _, row in valid]
+    registered = set()
+    for start in range(0, len(phones), 500):
+        registered.update(
+            p for (p,) in db.query(User.phone).filter(User.phone.in_(phones[start:start + 500])).all()
+        )
+    if registered:
+        failed.extend(
+            AdminBulkUserResult(row=index, phone=row.phone, status="conflict", error="该手机号已注册")
+            for index, row in valid if row.phone in registered
+        )
+        valid = [(index, row) for index, row in valid if row.phone not in registered]
+    return valid, failed
+
+
+def _bulk_build_user(row: AdminBulkUserRow, password_hash: str) -> User:
+    user = User(
+        phone=row.phone,
+        password_hash=password_hash,
+        nickname=row.nickname,
+        gender=row.gender,
+        birth_year=row.birth_year,
+        hometown=row.hometown,
+        main_city=row.main_city,
+    )
+    # 和单个创建一致：基础信息齐全则标记 profile_completed
+    if row.nickname and row.birth_year and row.hometown:
+        user.profile_completed = True
+    auto_set_preferred_name(user)
+    return user
+
+
+def _bulk_audit(user: User) -> AuditLog:
+    return AuditLog(
+        action="create_user", target_user_id=user.id, target_label=user.phone,
+        detail=f"批量创建用户 {user.phone}" + (f"（{user.nickname}）" if user.nickname else ""),
+    )
+
+
+def _bulk_insert(db: Session, rows: List[Tuple[int, AdminBulkUserRow]], hashes: List[str]) -> Dict[int, Optional[str]]:
+    """
+    分批写入用户和审计日志，每批一个事务
+
+    某一批撞上唯一约束（并发创建了同一手机号）时，这一批退回逐条写入，只有冲突的那行失败。
+    返回 {行号: user_id}，冲突的行为 None
+    """
+    outcome: Dict[int, Optional[str]] = {}
+    pairs = list(zip(rows, hashes))
+    for start in range(0, len(pairs), BULK_BATCH_SIZE):
+        batch = pairs[start:start + BULK_BATCH_SIZE]
+        users = [(index, _bulk_build_user(row, hashed)) for (index, row), hashed in batch]
+        try:
+            db.add_all([user for _, user in users])
+            db.flush()
+            db.add_all([_bulk_audit(user) for _, user in users])
+            db.commit()
+            outcome.update((index, user.id) for index, user in users)
+            continue
+        except IntegrityError:
+            db.rollback()
+
+        for (index, row), hashed in batch:
+            user = _bulk_build_user(row, hashed)
+            try:
+                db.add(user)
+                db.flush()
+                db.add(_bulk_audit(user))
+                db.commit()
+                outcome[index] = user.id
+            except IntegrityError:
+                db.rollback()
+                outcome[index] = None
+    return outcome
+
+
+def _bulk_report(results: List[AdminBulkUserResult], dry_run: bool) -> AdminBulkCreateResponse:
+    results.sort(key=lambda r: r.row)
+    created = sum(1 for r in results if r.status == "created")
+    return AdminBulkCreateResponse(
+        total=len(results), created=created, failed=len(results) - created, dry_run=dry_run, results=results,
+    )
+
+
+def _bulk_dry_run(db: Session, raw_rows: List[Any]) -> AdminBulkCreateResponse:
+    """只校验：能创建的行标记为 created，但不写库"""
+    valid, results = _validate_bulk_rows(db, raw_rows)
+    results.extend(AdminBulkUserResult(row=index, phone=row.phone, status="created") for index, row in valid)
+    return _bulk_report(results, dry_run=True)
+
+
+def _bulk_prepare(db: Session, raw_rows: List[Any]) -> Tuple[Dict[str, Any], List[AdminBulkPassword]]:
+    """
+    提交任务前校验并哈希密码，返回 (任务 payload, 自动生成的密码)
+
+    payload 里只有密码哈希，不落明文；自动生成的密码只随提交的响应返回一次
+    """
+    valid, failed = _validate_bulk_rows(db, raw_rows)
+    generated = {index: _random_password() for index, row in valid if not row.password}
+    hashes = hash_passwords([row.password or generated[index] for index, row in valid])
+    payload = {
+        "rows": [
+            {"row": index, **row.model_dump(exclude={"password"}), "password_hash": hashed}
+            for (index, row), hashed in zip(valid, hashes)
+        ],
+        "failed": [r.model_dump() for r in failed],
+    }
+    passwords = [
+        AdminBulkPassword(row=index, phone=row.phone, password=generated[index])
+        for index, row in valid if index in generated
+    ]
+    return payload, passwords
+
+
+@job_queue.handler("admin_bulk_users")
+def _bulk_create_users_job(payload: dict) -> dict:
+    """批量创建用户（任务队列执行），返回每一行的报告"""
+    db = SessionLocal()
+    try:
+        rows = [
+            (item["row"], AdminBulkUserRow(**{k: v for k, v in item.items() if k not in ("row", "password_hash")}))
+            for item in payload["rows"]
+        ]
+        outcome = _bulk_insert(db, rows, [item["password_hash"] for item in payload["rows"]])
+        results = [AdminBulkUserResult(**r) for r in payload["failed"]]
+        for index, row in rows:
+            user_id = outcome[index]
+            if user_id is None:
+                results.append(AdminBulkUserResult(row=index, phone=row.phone, status="conflict", error="该手机号已注册"))
+            else:
+                results.append(AdminBulkUserResult(row=index, phone=row.phone, status="created", user_id=user_id))
+        report = _bulk_report(results, dry_run=False)
+    finally:
+        # 成功与否都删掉 payload 里的用户信息和密码哈希（任务不重试，用不到了）
+        try:
+            db.query(Job).filter(Job.dedup_key == payload["dedup_key"]).update(
+                {"payload": {"dedup_key": payload["dedup_key"], "rows": len(payload["rows"])}},
+                synchronize_session=False,
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning("[Admin] 清理批量创建任务的 payload 失败: %s", e)
+        db.close()
+    logger.info("[Admin] 批量创建用户：共 %d 行，成功 %d，失败 %d", report.total, report.created, report.failed)
+    return report.model_dump()
+
+
+@admin_router.post("/users/bulk")
+async def admin_bulk_create_users(
+    request: Request,
+    dry_run: bool = False,
+    db: Session = Depends(get_db),
+    _: None = Depends(verify_admin_key),
+):
+    """
+    管理员批量创建用户
+
+    请求体二选一：
+    - Content-Type: text/csv，表头 phone,password,nickname,gender,birth_year,hometown,main_city
+      （或 手机号,密码,姓名,性别,出生年份,家乡,常住城市）
+    - JSON：用户数组，或 {"users": [...]}，字段同单个创建，password 可省略
+    单行失败不影响其他行。
+
+    dry_run=true 只校验不写库，直接返回每一行的结果（AdminBulkCreateResponse）；
+    否则校验、哈希密码后提交到任务队列，返回 202 + 任务 ID，完成后 GET /admin/jobs/{id} 的 result
+    为同样格式的报告。密码留空时自动生成，只在这个 202 响应的 passwords 里返回一次（任务里不存明文）。
+    任务不自动重试（已写入的行重试时会变成“已注册”），失败后请重新提交。
+    """
+    raw_rows = _parse_bulk_rows(request.headers.get("content-type", ""), await request.body())
+    if not raw_rows:
+        raise HTTPException(status_code=400, detail="没有要创建的用户")
+    if len(raw_rows) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"单次最多 {BULK_MAX_ROWS} 个用户")
+
+    if dry_run:
+        # 只校验：一次查库，放到线程池里
+        return await run_in_threadpool(_bulk_dry_run, db, raw_rows)
+
+    # 校验一次查库，哈希在密码进程池里并行，都放到线程池里
+    payload, passwords = await run_in_threadpool(_bulk_prepare, db, raw_rows)
+    dedup_key = f"admin_bulk_users:{uuid.uuid4()}"
+    job_id = await run_in_threadpool(
+        job_queue.enqueue,
+        "admin_bulk_users",
+        {"dedup_key": dedup_key, **payload},
+        priority=PRIORITY_HIGH,
+        dedup_key=dedup_key,
+        max_attempts=1,
+    )
+    return await run_in_threadpool(
+        accepted, job_id, "/api/admin/jobs", {"passwords": [p.model_dump() for p in passwords]},
+    )
+
+
 # ========== 管理员：用户列表 ==========
 
 class AdminUserItem(BaseModel):
@@ -142,25 +484,53 @@ class AdminUserItem(BaseModel):
 
 @admin_router.get("/users", response_model=List[AdminUserItem])
 def admin_list_users(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
     db: Session = Depends(get_db),
     _: None = Depends(verify_admin_key),
 ):
-    """管理员获取所有用户列表"""
-    users = db.query(User).order_by(User.created_at.desc()).all()
-
-    # 批量查询对话和回忆录计数
-    conv_counts = dict(
-        db.query(Conversation.user_id, func.count(Conversation.id))
-        .group_by(Conversation.user_id)
-        .all()
-    )
-    memoir_counts = dict(
-        db.query(Memoir.user_id, func.count(Memoir.id))
-        .group_by(Memoir.user_id)
-        .all()
+    """
+    管理员获取用户列表（新注册的在前）
+
+    带 limit 或 cursor 时游标翻页，下一页游标在 X-Next-Cursor 头；都不带时返回全部
+    """
+    after, limit = page_params(cursor, limit, 2, default=50, maximum=200)
+
+    query = db.query(
+        User.id, User.phone, User.nickname, User.gender, User.birth_year, User.hometown,
+        User.main_city, User.profile_completed, User.is_active, User.created_at,
     )
+    if after:
+        created_at, user_id = after
+        query = query.filter(or_(
+            User.created_at < created_at,
+            and_(User.created_at == created_at, User.id < user_id),
+        ))
+    query = query.order_by(User.created_at.desc(), User.id.desc())
+    if limit:
+        query = query.limit(limit + 1)
+    rows = query.all()
+    users, next_cursor = page(rows, limit, key=lambda u: (u.created_at, u.id))
+
+    # 只统计本页用户的对话和回忆录数
+    user_ids = [u.id for u in users]
+    conv_counts, memoir_counts = {}, {}
+    if user_ids:
+        conv_counts = dict(
+            db.query(Conversation.user_id, func.count(Conversation.id))
+            .filter(Conversation.user_id.in_(user_ids))
+            .group_by(Conversation.user_id)
+            .all()
+        )
+        memoir_counts = dict(
+            db.query(Memoir.user_id, func.count(Memoir.id))
+            .filter(Memoir.user_id.in_(user_ids))
+            .group_by(Memoir.user_id)
+            .all()
+        )
 
-    return [
+    items = [
         AdminUserItem(
             id=u.id,
             phone=u.phone,
@@ -177,6 +547,7 @@ def admin_list_users(
         )
         for u in users
     ]
+    return list_response(request, items, next_cursor)
 
 
 # ========== 管理员：编辑用户 ==========
@@ -217,8 +588,10 @@ def admin_update_user(
         user.profile_completed = True
 
     auto_set_preferred_name(user)
+    bump_auth_version(user)
     db.commit()
     db.refresh(user)
+    auth_cache.invalidate(user.id)
 
     _log_action(db, "edit_user", user.id, user.phone or user.nickname,
                 f"编辑用户信息：{user.phone or user.nickname}")
@@ -252,8 +625,7 @@ def admin_reset_password(
         raise HTTPException(status_code=404, detail="用户不存在")
 
     # 生成 8 位随机密码
-    alphabet = string.ascii_letters + string.digits
-    new_password = ''.join(secrets.choice(alphabet) for _ in range(8))
+    new_password = _random_password()
 
     user.password_hash = hash_password(new_password)
     db.commit()
@@ -291,9 +663,12 @@ def admin_delete_user(
     db.query(Conversation).filter(Conversation.user_id == user_id).delete()
     # 4. 话题候选（有 cascade，但显式删除更安全）
     db.query(TopicCandidate).filter(TopicCandidate.user_id == user_id).delete()
-    # 5. 删除用户
+    # 5. 看板活动汇总
+    db.query(UserDailyActivity).filter(UserDailyActivity.user_id == user_id).delete()
+    # 6. 删除用户
     db.delete(user)
     db.commit()
+    auth_cache.invalidate(user_id)
 
     _log_action(db, "delete_user", user_id, user_label, f"删除用户 {user_label} 及所有关联数据")
 
@@ -316,8 +691,10 @@ def admin_toggle_user_active(
         raise HTTPException(status_code=404, detail="用户不存在")
 
     user.is_active = not user.is_active
+    bump_auth_version(user)
     db.commit()
     db.refresh(user)
+    auth_cache.invalidate(user.id)
 
     status_text = "启用" if user.is_active else "禁用"
     user_label = user.phone or user.nickname or user_id
@@ -328,6 +705,7 @@ def admin_toggle_user_active(
 
 
 # ========== 管理员：获取用户详情 ==========
+# 详情页先拿概要（资料 + 数量 + 统计，都是聚合查询），回忆录 / 对话 / 消息按游标分页另外加载
 
 
 class AdminMemoirDetailItem(BaseModel):
@@ -358,7 +736,9 @@ class AdminConversationItem(BaseModel):
     summary: Optional[str] = None
     status: str
     created_at: Optional[datetime] = None
-    messages: List[AdminMessageItem] = []
+    message_count: int = 0
+    first_message_at: Optional[datetime] = None
+    last_message_at: Optional[datetime] = None
 
 
 class AdminTopicItem(BaseModel):
@@ -401,76 +781,46 @@ class AdminUserDetail(BaseModel):
     is_active: bool = True
     created_at: Optional[datetime] = None
     era_memories: Optional[str] = None  # 时代记忆
-    memoirs: List[AdminMemoirDetailItem] = []
-    conversations: List[AdminConversationItem] = []
+    conversation_count: int = 0  # 对话数（列表见 /user/{id}/conversations）
+    memoir_count: int = 0  # 回忆录数，含已删除（列表见 /user/{id}/memoirs）
+    active_days: int = 0  # 有对话的天数
+    last_active_at: Optional[datetime] = None  # 最近一次对话时间
     topic_pool: List[AdminTopicItem] = []  # 话题池
     stats: Optional[AdminUserStats] = None  # 使用统计
 
 
+class AdminMemoirPage(BaseModel):
+    items: List[AdminMemoirDetailItem] = []
+    next_cursor: Optional[str] = None
+
+
+class AdminConversationPage(BaseModel):
+    items: List[AdminConversationItem] = []
+    next_cursor: Optional[str] = None
+
+
+class AdminMessagePage(BaseModel):
+    items: List[AdminMessageItem] = []
+    next_cursor: Optional[str] = None
+
+
+def _get_user_or_404(db: Session, user_id: str) -> User:
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    return user
+
+
 @admin_router.get("/user/{user_id}/detail", response_model=AdminUserDetail)
 def admin_get_user_detail(
     user_id: str,
     db: Session = Depends(get_db),
     _: None = Depends(verify_admin_key),
 ):
-    """管理员获取用户详情，包括回忆录、对话记录、话题池和使用统计"""
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
+    """管理员获取用户概要：资料、话题池和使用统计（回忆录 / 对话列表分页另取）"""
+    user = _get_user_or_404(db, user_id)
 
-    # 获取用户的回忆录列表
-    memoirs = db.query(Memoir).filter(Memoir.user_id == user_id).order_by(Memoir.order_index.asc()).all()
-    memoir_items = []
-    for m in memoirs:
-        item = AdminMemoirDetailItem(
-            id=m.id,
-            title=m.title,
-            content=m.content,
-            status=m.status or "completed",
-            year_start=m.year_start,
-            year_end=m.year_end,
-            time_period=m.time_period,
-            conversation_id=m.conversation_id,
-            conversation_start=None,
-            conversation_end=None,
-            created_at=m.created_at,
-        )
-        # 获取关联对话的时间范围
-        if m.conversation and m.conversation.messages:
-            messages = m.conversation.messages
-            if messages:
-                first_msg = messages[0]
-                if first_msg.created_at:
-                    item.conversation_start = first_msg.created_at.strftime("%Y-%m-%d %H:%M")
-                last_msg = messages[-1]
-                if last_msg.created_at:
-                    item.conversation_end = last_msg.created_at.strftime("%Y-%m-%d %H:%M")
-        memoir_items.append(item)
-
-    # 获取用户的对话列表及消息
-    conversations = db.query(Conversation).filter(Conversation.user_id == user_id).order_by(Conversation.created_at.desc()).all()
-    conversation_items = []
-    for c in conversations:
-        conv_item = AdminConversationItem(
-            id=c.id,
-            title=c.title,
-            topic=c.topic,
-            summary=c.summary,
-            status=c.status,
-            created_at=c.created_at,
-            messages=[
-                AdminMessageItem(
-                    id=msg.id,
-                    role=msg.role,
-                    content=msg.content,
-                    created_at=msg.created_at,
-                )
-                for msg in (c.messages or [])
-            ],
-        )
-        conversation_items.append(conv_item)
-
-    # 获取话题池
+    # 获取话题池（候选话题只保留少量，直接带上）
     topic_candidates = db.query(TopicCandidate).filter(TopicCandidate.user_id == user_id).all()
     topic_pool = [
         AdminTopicItem(
@@ -485,7 +835,7 @@ def admin_get_user_detail(
     ]
 
     # 计算使用统计
-    stats = _calculate_user_stats(user, memoirs, conversations)
+    stats, counts = _calculate_user_stats(db, user)
 
     return AdminUserDetail(
         id=user.id,
@@ -500,86 +850,232 @@ def admin_get_user_detail(
         is_active=user.is_active if user.is_active is not None else True,
         created_at=user.created_at,
         era_memories=user.era_memories,
-        memoirs=memoir_items,
-        conversations=conversation_items,
         topic_pool=topic_pool,
         stats=stats,
+        **counts,
+    )
+
+
+@admin_router.get("/user/{user_id}/memoirs", response_model=AdminMemoirPage)
+def admin_list_user_memoirs(
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    _: None = Depends(verify_admin_key),
+):
+    """管理员分页获取用户的回忆录（含已删除，按 order_index 排序）"""
+    from app.services.memoir_service import memoir_service
+
+    _get_user_or_404(db, user_id)
+    limit = clamp_limit(limit, default=20, maximum=100)
+    after = decode_cursor(cursor, 2)
+
+    # 对话时间范围来自对话上的统计列，一次查询
+    rows = memoir_service.get_user_memoirs_with_times(
+        db, user_id, include_deleted=True, with_content=True,
+        after=tuple(after) if after else None, limit=limit + 1,
     )
+    rows, next_cursor = page(rows, limit, key=lambda row: (row[0].order_index, row[0].id))
+    items = [
+        AdminMemoirDetailItem(
+            id=m.id,
+            title=m.title,
+            content=m.content,
+            status=m.status or "completed",
+            year_start=m.year_start,
+            year_end=m.year_end,
+            time_period=m.time_period,
+            conversation_id=m.conversation_id,
+            conversation_start=start.strftime("%Y-%m-%d %H:%M") if start else None,
+            conversation_end=end.strftime("%Y-%m-%d %H:%M") if end else None,
+            created_at=m.created_at,
+        )
+        for m, start, end in rows
+    ]
+    return AdminMemoirPage(items=items, next_cursor=next_cursor)
 
 
-def _calculate_user_stats(user: User, memoirs: list, conversations: list) -> AdminUserStats:
-    """计算用户使用统计"""
+@admin_router.get("/user/{user_id}/conversations", response_model=AdminConversationPage)
+def admin_list_user_conversations(
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    _: None = Depends(verify_admin_key),
+):
+    """管理员分页获取用户的对话（新的在前，不带消息，消息数 / 时间来自统计列）"""
+    _get_user_or_404(db, user_id)
+    limit = clamp_limit(limit, default=20, maximum=100)
+    after = decode_cursor(cursor, 2)
+
+    query = db.query(Conversation).filter(Conversation.user_id == user_id)
+    if after:
+        created_at, conversation_id = after
+        query = query.filter(or_(
+            Conversation.created_at < created_at,
+            and_(Conversation.created_at == created_at, Conversation.id < conversation_id),
+        ))
+    rows = query.order_by(Conversation.created_at.desc(), Conversation.id.desc()).limit(limit + 1).all()
+    rows, next_cursor = page(rows, limit, key=lambda c: (c.created_at, c.id))
+
+    items = [
+        AdminConversationItem(
+            id=c.id,
+            title=c.title,
+            topic=c.topic,
+            summary=c.summary,
+            status=c.status,
+            created_at=c.created_at,
+            message_count=c.message_count or 0,
+            first_message_at=c.first_message_at,
+            last_message_at=c.last_message_at,
+        )
+        for c in rows
+    ]
+    return AdminConversationPage(items=items, next_cursor=next_cursor)
+
+
+@admin_router.get("/conversation/{conversation_id}/messages", response_model=AdminMessagePage)
+def admin_list_conversation_messages(
+    conversation_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    _: None = Depends(verify_admin_key),
+):
+    """管理员分页获取对话记录（按时间正序）"""
+    exists = db.query(Conversation.id).filter(Conversation.id == conversation_id).first()
+    if not exists:
+        raise HTTPException(status_code=404, detail="对话不存在")
+    limit = clamp_limit(limit, default=100, maximum=500)
+    after = decode_cursor(cursor, 2)
+
+    query = db.query(Message).filter(Message.conversation_id == conversation_id)
+    if after:
+        created_at, message_id = after
+        query = query.filter(or_(
+            Message.created_at > created_at,
+            and_(Message.created_at == created_at, Message.id > message_id),
+        ))
+    rows = query.order_by(Message.created_at, Message.id).limit(limit + 1).all()
+    rows, next_cursor = page(rows, limit, key=lambda msg: (msg.created_at, msg.id))
+
+    items = [
+        AdminMessageItem(
+            id=msg.id,
+            role=msg.role,
+            content=msg.content,
+            created_at=msg.created_at,
+        )
+        for msg in rows
+    ]
+    return AdminMessagePage(items=items, next_cursor=next_cursor)
+
+
+def _life_stage(user: User, year_start: int) -> Optional[str]:
+    """根据年龄推断人生阶段"""
+    if not user.birth_year:
+        return None
+    age = year_start - user.birth_year
+    if age < 12:
+        return '童年'
+    if age < 18:
+        return '少年'
+    if age < 30:
+        return '青年'
+    if age < 50:
+        return '中年'
+    return '晚年'
+
+
+def _calculate_user_stats(db: Session, user: User) -> Tuple[AdminUserStats, dict]:
+    """
+    计算用户使用统计（全部是聚合查询，不加载回忆录正文和消息）
+
+    Returns:
+        (统计, 概要里的数量字段)
+    """
     stats = AdminUserStats()
+    completed = Memoir.status == 'completed'
+
+    # 对话：只取统计列（消息数、首末消息时间在写消息时维护）
+    conversations = db.query(
+        Conversation.created_at,
+        Conversation.message_count,
+        Conversation.first_message_at,
+        Conversation.last_message_at,
+    ).filter(Conversation.user_id == user.id).all()
+
+    # 回忆录：数量、字数、首篇完成时间一次聚合
+    memoir_total, completed_count, total_length, first_memoir_at = db.query(
+        func.count(Memoir.id),
+        func.sum(case((completed, 1), else_=0)),
+        func.sum(case((completed, func.length(Memoir.content)), else_=0)),
+        func.min(case((completed, Memoir.created_at))),
+    ).filter(Memoir.user_id == user.id).one()
+    completed_count = completed_count or 0
+    total_length = total_length or 0
 
     # 累计数据
     stats.total_conversations = len(conversations)
-    stats.total_memoirs = len([m for m in memoirs if m.status == 'completed'])
+    stats.total_memoirs = completed_count
 
     # 对话相关统计
     if conversations:
         # 总消息数和平均消息数
-        total_messages = sum(len(c.messages or []) for c in conversations)
+        total_messages = sum(c.message_count or 0 for c in conversations)
         stats.total_messages = total_messages
         stats.avg_messages_per_conversation = round(total_messages / len(conversations), 1)
 
         # 对话时长统计
         durations = []
         for c in conversations:
-            if c.messages and len(c.messages) >= 2:
-                first_msg = c.messages[0]
-                last_msg = c.messages[-1]
-                if first_msg.created_at and last_msg.created_at:
-                    duration = (last_msg.created_at - first_msg.created_at).total_seconds() / 60
-                    if duration > 0:
-                        durations.append(duration)
+            if (c.message_count or 0) >= 2 and c.first_message_at and c.last_message_at:
+                duration = (c.last_message_at - c.first_message_at).total_seconds() / 60
+                if duration > 0:
+                    durations.append(duration)
         if durations:
             stats.total_duration_mins = round(sum(durations), 1)
             stats.avg_conversation_duration_mins = round(sum(durations) / len(durations), 1)
 
     # 回忆录相关统计
-    completed_memoirs = [m for m in memoirs if m.status == 'completed']
-    if completed_memoirs:
+    if completed_count:
         # 回忆录总字数和平均字数
-        total_length = sum(len(m.content or '') for m in completed_memoirs)
         stats.total_memoir_chars = total_length
-        stats.avg_memoir_length = round(total_length / len(completed_memoirs))
+        stats.avg_memoir_length = round(total_length / completed_count)
 
         # 人生阶段覆盖
         stages = {}
-        for m in completed_memoirs:
-            if m.time_period:
-                stages[m.time_period] = stages.get(m.time_period, 0) + 1
-            elif m.year_start:
-                # 根据年龄推断阶段
-                if user.birth_year:
-                    age = m.year_start - user.birth_year
-                    if age < 12:
-                        stage = '童年'
-                    elif age < 18:
-                        stage = '少年'
-                    elif age < 30:
-                        stage = '青年'
-                    elif age < 50:
-                        stage = '中年'
-                    else:
-                        stage = '晚年'
-                    stages[stage] = stages.get(stage, 0) + 1
+        rows = db.query(
+            Memoir.time_period, Memoir.year_start, func.count(Memoir.id)
+        ).filter(Memoir.user_id == user.id, completed).group_by(Memoir.time_period, Memoir.year_start).all()
+        for time_period, year_start, count in rows:
+            stage = time_period or (_life_stage(user, year_start) if year_start else None)
+            if stage:
+                stages[stage] = stages.get(stage, 0) + count
         stats.life_stages_coverage = stages
 
     # 对话转化率
     if conversations:
-        memoir_conv_ids = {m.conversation_id for m in memoirs if m.conversation_id}
-        converted = len([c for c in conversations if c.id in memoir_conv_ids])
+        converted = db.query(func.count(func.distinct(Memoir.conversation_id))).join(
+            Conversation, Conversation.id == Memoir.conversation_id
+        ).filter(Memoir.user_id == user.id, Conversation.user_id == user.id).scalar() or 0
         stats.conversation_to_memoir_rate = round(converted / len(conversations), 2)
 
     # 首篇回忆录耗时
-    if completed_memoirs and user.created_at:
-        first_memoir = min(completed_memoirs, key=lambda m: m.created_at or datetime.max)
-        if first_memoir.created_at:
-            days = (first_memoir.created_at - user.created_at).days
-            stats.first_memoir_days = max(0, days)
-
-    return stats
+    if first_memoir_at and user.created_at:
+        days = (first_memoir_at - user.created_at).days
+        stats.first_memoir_days = max(0, days)
+
+    created = [c.created_at for c in conversations if c.created_at]
+    counts = {
+        "conversation_count": len(conversations),
+        "memoir_count": memoir_total or 0,
+        "active_days": len({d.date() for d in created}),
+        "last_active_at": max(created) if created else None,
+    }
+    return stats, counts
 
 
 # ========== 管理员：操作日志 ==========
@@ -594,13 +1090,29 @@ class AuditLogItem(BaseModel):
 
 @admin_router.get("/logs", response_model=List[AuditLogItem])
 def admin_list_logs(
+    request: Request,
+    cursor: Optional[str] = None,
     limit: int = 100,
     db: Session = Depends(get_db),
     _: None = Depends(verify_admin_key),
 ):
-    """管理员获取操作日志"""
-    logs = db.query(AuditLog).order_by(AuditLog.created_at.desc()).limit(limit).all()
-    return [
+    """管理员获取操作日志（新的在前，游标翻页，下一页游标在 X-Next-Cursor 头）"""
+    limit = clamp_limit(limit, default=100, maximum=500)
+    after = decode_cursor(cursor, 2)
+
+    query = db.query(
+        AuditLog.id, AuditLog.action, AuditLog.target_label, AuditLog.detail, AuditLog.created_at,
+    )
+    if after:
+        created_at, log_id = after
+        query = query.filter(or_(
+            AuditLog.created_at < created_at,
+            and_(AuditLog.created_at == created_at, AuditLog.id < log_id),
+        ))
+    rows = query.order_by(AuditLog.created_at.desc(), AuditLog.id.desc()).limit(limit + 1).all()
+    logs, next_cursor = page(rows, limit, key=lambda log: (log.created_at, log.id))
+
+    items = [
         AuditLogItem(
             id=log.id,
             action=log.action,
@@ -610,6 +1122,211 @@ def admin_list_logs(
         )
         for log in logs
     ]
+    return list_response(request, items, next_cursor)
+
+
+# ========== 管理员：LLM 响应缓存 ==========
+
+
+@admin_router.get("/llm-cache/stats")
+def admin_get_llm_cache_stats(
+    _: None = Depends(verify_admin_key),
+):
+    """管理员查看 LLM 响应缓存命中率（命中/未命中计数为当前 worker 进程）"""
+    from app.services.llm_cache import llm_cache
+    return llm_cache.stats()
+
+
+@admin_router.post("/llm-cache/evict")
+def admin_evict_llm_cache(
+    _: None = Depends(verify_admin_key),
+):
+    """管理员手动触发缓存淘汰（过期 + 超出上限的条目）"""
+    from app.services.llm_cache import llm_cache
+    removed = llm_cache.evict()
+    return {"removed": removed}
+
+
+@admin_router.get("/transcript-cache/stats")
+def admin_get_transcript_cache_stats(
+    _: None = Depends(verify_admin_key),
+):
+    """管理员查看访谈记录缓存命中率（当前 worker 进程）"""
+    from app.services.transcript_service import transcript_service
+    return transcript_service.stats()
+
+
+@admin_router.get("/auth-cache/stats")
+def admin_get_auth_cache_stats(
+    _: None = Depends(verify_admin_key),
+):
+    """管理员查看已认证用户缓存命中率（当前 worker 进程）"""
+    return auth_cache.stats()
+
+
+@admin_router.get("/password-hasher/stats")
+def admin_get_password_hasher_stats(
+    _: None = Depends(verify_admin_key),
+):
+    """管理员查看密码哈希进程池的排队情况（当前 worker 进程）"""
+    return password_hasher.stats()
+
+
+# ========== 管理员：LLM 调度 ==========
+
+
+@admin_router.get("/llm-scheduler/stats")
+def admin_get_llm_scheduler_stats(
+    _: None = Depends(verify_admin_key),
+):
+    """管理员查看 LLM 调度排队情况（当前 worker 进程）"""
+    from app.services.llm_scheduler import llm_scheduler
+    return llm_scheduler.stats()
+
+
+@admin_router.get("/llm-breaker/stats")
+def admin_get_llm_breaker_stats(
+    _: None = Depends(verify_admin_key),
+):
+    """管理员查看各模型熔断状态和对冲请求计数（当前 worker 进程）"""
+    from app.services.llm_breaker import llm_breaker
+    from app.services.llm_gateway import hedge_stats
+    return {"models": llm_breaker.snapshot(), "hedge": hedge_stats()}
+
+
+# ========== 管理员：后台任务队列 ==========
+
+
+@admin_router.get("/jobs/stats")
+def admin_get_job_stats(
+    _: None = Depends(verify_admin_key),
+):
+    """管理员查看任务队列深度、最早排队时间和最近失败的任务"""
+    from app.services.job_queue import job_queue
+    return job_queue.stats()
+
+
+@admin_router.get("/jobs/{job_id}")
+def admin_get_job(
+    job_id: str,
+    _: None = Depends(verify_admin_key),
+):
+    """管理员查询任务状态和结果（如批量创建用户的报告）"""
+    job = job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
+@admin_router.get("/jobs/{job_id}/stream")
+def admin_stream_job(
+    job_id: str,
+    _: None = Depends(verify_admin_key),
+):
+    """管理员订阅任务状态（SSE，事件同 /job/{id}/stream）"""
+    if not job_queue.get(job_id):
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job_event_stream(job_id)
+
+
+@admin_router.post("/jobs/{job_id}/retry")
+def admin_retry_job(
+    job_id: str,
+    _: None = Depends(verify_admin_key),
+):
+    """管理员手动重试失败的任务"""
+    from app.services.job_queue import job_queue
+    if not job_queue.retry(job_id):
+        raise HTTPException(status_code=404, detail="任务不存在、未失败，或已有同类任务在排队")
+    return {"status": "queued", "job_id": job_id}
+
+
+@admin_router.get("/memoir-speculation/stats")
+def admin_get_memoir_speculation_stats(
+    days: int = 7,
+    db: Session = Depends(get_db),
+    _: None = Depends(verify_admin_key),
+):
+    """管理员对比开启 / 未开启预先起草时，对话结束到回忆录完成的耗时和总 token"""
+    from app.services.memoir_speculation import memoir_speculation
+    return memoir_speculation.report(db, days)
+
+
+# ========== 管理员：LLM 用量台账 ==========
+
+
+class LLMUsageRow(BaseModel):
+    day: Optional[str] = None
+    feature: Optional[str] = None
+    user_id: Optional[str] = None
+    model: Optional[str] = None
+    calls: int
+    errors: int
+    cache_hits: int
+    prompt_tokens: int
+    completion_tokens: int
+    avg_latency_ms: Optional[int] = None
+
+
+LLM_USAGE_GROUP_FIELDS = ("day", "feature", "user", "model")
+
+
+@admin_router.get("/llm-usage", response_model=List[LLMUsageRow])
+def admin_get_llm_usage(
+    days: int = 7,
+    group_by: str = "day,feature",
+    user_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+    _: None = Depends(verify_admin_key),
+):
+    """管理员按 天/功能/用户/模型 汇总 LLM 用量（group_by 逗号分隔）"""
+    from datetime import timedelta
+    from sqlalchemy import case
+    from app.models import LLMUsage
+
+    fields = [f.strip() for f in group_by.split(",") if f.strip()]
+    invalid = [f for f in fields if f not in LLM_USAGE_GROUP_FIELDS]
+    if invalid or not fields:
+        raise HTTPException(status_code=400, detail=f"group_by 仅支持: {', '.join(LLM_USAGE_GROUP_FIELDS)}")
+
+    columns = {
+        "day": func.date(LLMUsage.created_at).label("day"),
+        "feature": LLMUsage.feature.label("feature"),
+        "user": LLMUsage.user_id.label("user_id"),
+        "model": LLMUsage.model.label("model"),
+    }
+    group_cols = [columns[f] for f in fields]
+
+    query = db.query(
+        *group_cols,
+        func.count(LLMUsage.id).label("calls"),
+        func.sum(case((LLMUsage.outcome == "error", 1), else_=0)).label("errors"),
+        func.sum(case((LLMUsage.outcome == "cache_hit", 1), else_=0)).label("cache_hits"),
+        func.coalesce(func.sum(LLMUsage.prompt_tokens), 0).label("prompt_tokens"),
+        func.coalesce(func.sum(LLMUsage.completion_tokens), 0).label("completion_tokens"),
+        func.avg(case((LLMUsage.outcome == "ok", LLMUsage.latency_ms), else_=None)).label("avg_latency_ms"),
+    ).filter(LLMUsage.created_at >= datetime.utcnow() - timedelta(days=days))
+
+    if user_id:
+        query = query.filter(LLMUsage.user_id == user_id)
+
+    rows = query.group_by(*group_cols).order_by(*group_cols).all()
+
+    return [
+        LLMUsageRow(
+            day=str(r.day) if "day" in fields and r.day is not None else None,
+            feature=r.feature if "feature" in fields else None,
+            user_id=r.user_id if "user" in fields else None,
+            model=r.model if "model" in fields else None,
+            calls=r.calls,
+            errors=r.errors or 0,
+            cache_hits=r.cache_hits or 0,
+            prompt_tokens=r.prompt_tokens or 0,
+            completion_tokens=r.completion_tokens or 0,
+            avg_latency_ms=int(r.avg_latency_ms) if r.avg_latency_ms is not None else None,
+        )
+        for r in rows
+    ]
 
 
 # ========== 管理员：数据监控 ==========
@@ -672,72 +1389,92 @@ def admin_get_monitoring_data(
     db: Session = Depends(get_db),
     _: None = Depends(verify_admin_key),
 ):
-    """管理员获取数据监控统计"""
+    """管理员获取数据监控统计（活动数据来自 user_daily_activity 汇总表，结果短时间缓存）"""
+    return analytics_rollup.cached("monitoring", lambda: _build_monitoring_data(db))
+
+
+def _bucket_per_user(db: Session, column, total_users: int) -> List[DistributionItem]:
+    """按用户汇总 column（对话数 / 回忆录数）后分桶，没有记录的用户算 0"""
+    per_user = db.query(
+        UserDailyActivity.user_id,
+        func.sum(column).label('cnt'),
+    ).group_by(UserDailyActivity.user_id).having(func.sum(column) > 0).subquery()
+
+    dist_raw = db.query(
+        case(
+            (per_user.c.cnt <= 2, '1-2'),
+            (per_user.c.cnt <= 5, '3-5'),
+            else_='6+'
+        ).label('range'),
+        func.count().label('count')
+    ).select_from(per_user).group_by('range').all()
+
+    dist = {r.range: r.count for r in dist_raw}
+    dist['0'] = max(0, total_users - sum(dist.values()))
+    return [DistributionItem(label=label, count=dist.get(label, 0)) for label in ('0', '1-2', '3-5', '6+')]
+
+
+def _build_monitoring_data(db: Session) -> MonitoringData:
     from datetime import timedelta
-    from sqlalchemy import func, case, and_, distinct
 
-    now = datetime.now()
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_ago = today_start - timedelta(days=7)
-    month_ago = today_start - timedelta(days=30)
+    today = datetime.utcnow().date()
+    activity_rows = db.query(UserDailyActivity)
 
     # ===== 总体概览 =====
-    total_users = db.query(func.count(User.id)).scalar() or 0
-    profile_completed_users = db.query(func.count(User.id)).filter(User.profile_completed == True).scalar() or 0
-    total_conversations = db.query(func.count(Conversation.id)).scalar() or 0
-    total_memoirs = db.query(func.count(Memoir.id)).scalar() or 0
+    total_users, profile_completed_users = db.query(
+        func.count(User.id),
+        func.sum(case((User.profile_completed == True, 1), else_=0)),
+    ).one()
+    total_users = total_users or 0
+    profile_completed_users = profile_completed_users or 0
+    total_conversations, total_memoirs = db.query(
+        func.sum(UserDailyActivity.conversations),
+        func.sum(UserDailyActivity.memoirs),
+    ).one()
 
     overview = OverviewStats(
         total_users=total_users,
         profile_completed_users=profile_completed_users,
         profile_completion_rate=round(profile_completed_users / total_users, 2) if total_users > 0 else 0,
-        total_conversations=total_conversations,
-        total_memoirs=total_memoirs,
+        total_conversations=total_conversations or 0,
+        total_memoirs=total_memoirs or 0,
     )
 
     # ===== 活跃度 =====
-    # 活跃用户：有对话消息的用户
-    today_active = db.query(func.count(distinct(Conversation.user_id))).filter(
-        Conversation.created_at >= today_start
-    ).scalar() or 0
-
-    week_active = db.query(func.count(distinct(Conversation.user_id))).filter(
-        Conversation.created_at >= week_ago
-    ).scalar() or 0
-
-    month_active = db.query(func.count(distinct(Conversation.user_id))).filter(
-        Conversation.created_at >= month_ago
-    ).scalar() or 0
-
-    today_new_conversations = db.query(func.count(Conversation.id)).filter(
-        Conversation.created_at >= today_start
-    ).scalar() or 0
+    # 活跃用户：当天开了对话的用户
+    def active_users(since) -> int:
+        return activity_rows.with_entities(func.count(distinct(UserDailyActivity.user_id))).filter(
+            UserDailyActivity.day >= since,
+            UserDailyActivity.conversations > 0,
+        ).scalar() or 0
 
-    today_new_memoirs = db.query(func.count(Memoir.id)).filter(
-        Memoir.created_at >= today_start
-    ).scalar() or 0
+    today_new_conversations, today_new_memoirs = activity_rows.with_entities(
+        func.sum(UserDailyActivity.conversations),
+        func.sum(UserDailyActivity.memoirs),
+    ).filter(UserDailyActivity.day == today).one()
 
     activity = ActivityStats(
-        today_active_users=today_active,
-        week_active_users=week_active,
-        month_active_users=month_active,
-        today_new_conversations=today_new_conversations,
-        today_new_memoirs=today_new_memoirs,
+        today_active_users=active_users(today),
+        week_active_users=active_users(today - timedelta(days=7)),
+        month_active_users=active_users(today - timedelta(days=30)),
+        today_new_conversations=today_new_conversations or 0,
+        today_new_memoirs=today_new_memoirs or 0,
     )
 
     # ===== 留存率 =====
     def calc_retention(days: int) -> Optional[float]:
-        """计算 N 日留存率"""
-        cutoff_date = today_start - timedelta(days=days)
-        # 在 cutoff_date 之前注册的用户
-        eligible_users = db.query(User.id).filter(User.created_at < cutoff_date).subquery()
-        eligible_count = db.query(func.count()).select_from(eligible_users).scalar() or 0
+        """计算 N 日留存率：N 天前注册的用户里，最近 N 天开过对话的比例"""
+        cutoff = today - timedelta(days=days)
+        cutoff_start = datetime.combine(cutoff, datetime.min.time())
+        eligible_count = db.query(func.count(User.id)).filter(User.created_at < cutoff_start).scalar() or 0
         if eligible_count == 0:
             return None
-        # 这些用户中，在注册 N 天后仍有活动的用户
-        retained_count = db.query(func.count(distinct(Conversation.user_id))).filter(
-            Conversation.user_id.in_(db.query(eligible_users)),
-            Conversation.created_at >= cutoff_date
+        retained_count = db.query(func.count(distinct(UserDailyActivity.user_id))).join(
+            User, User.id == UserDailyActivity.user_id
+        ).filter(
+            User.created_at < cutoff_start,
+            UserDailyActivity.day >= cutoff,
+            UserDailyActivity.conversations > 0,
         ).scalar() or 0
         return round(retained_count / eligible_count, 2)
 
@@ -749,78 +1486,21 @@ def admin_get_monitoring_data(
 
     # ===== 分布统计 =====
 
-    # 用户对话数分布
-    conv_counts = db.query(
-        Conversation.user_id,
-        func.count(Conversation.id).label('cnt')
-    ).group_by(Conversation.user_id).subquery()
-
-    conv_dist_raw = db.query(
-        case(
-            (conv_counts.c.cnt == 0, '0'),
-            (conv_counts.c.cnt <= 2, '1-2'),
-            (conv_counts.c.cnt <= 5, '3-5'),
-            else_='6+'
-        ).label('range'),
-        func.count().label('count')
-    ).select_from(conv_counts).group_by('range').all()
-
-    # 包含没有对话的用户
-    users_with_conv = db.query(func.count(distinct(Conversation.user_id))).scalar() or 0
-    users_without_conv = total_users - users_with_conv
-
-    conv_dist = {r.range: r.count for r in conv_dist_raw}
-    conv_dist['0'] = conv_dist.get('0', 0) + users_without_conv
-    conversations_per_user = [
-        DistributionItem(label='0', count=conv_dist.get('0', 0)),
-        DistributionItem(label='1-2', count=conv_dist.get('1-2', 0)),
-        DistributionItem(label='3-5', count=conv_dist.get('3-5', 0)),
-        DistributionItem(label='6+', count=conv_dist.get('6+', 0)),
-    ]
-
-    # 用户回忆录数分布
-    memoir_counts = db.query(
-        Memoir.user_id,
-        func.count(Memoir.id).label('cnt')
-    ).group_by(Memoir.user_id).subquery()
-
-    memoir_dist_raw = db.query(
-        case(
-            (memoir_counts.c.cnt == 0, '0'),
-            (memoir_counts.c.cnt <= 2, '1-2'),
-            (memoir_counts.c.cnt <= 5, '3-5'),
-            else_='6+'
-        ).label('range'),
-        func.count().label('count')
-    ).select_from(memoir_counts).group_by('range').all()
-
-    users_with_memoir = db.query(func.count(distinct(Memoir.user_id))).scalar() or 0
-    users_without_memoir = total_users - users_with_memoir
-
-    memoir_dist = {r.range: r.count for r in memoir_dist_raw}
-    memoir_dist['0'] = memoir_dist.get('0', 0) + users_without_memoir
-    memoirs_per_user = [
-        DistributionItem(label='0', count=memoir_dist.get('0', 0)),
-        DistributionItem(label='1-2', count=memoir_dist.get('1-2', 0)),
-        DistributionItem(label='3-5', count=memoir_dist.get('3-5', 0)),
-        DistributionItem(label='6+', count=memoir_dist.get('6+', 0)),
-    ]
+    # 用户对话数 / 回忆录数分布
+    conversations_per_user = _bucket_per_user(db, UserDailyActivity.conversations, total_users)
+    memoirs_per_user = _bucket_per_user(db, UserDailyActivity.memoirs, total_users)
 
     # 每次对话消息数分布
-    msg_counts = db.query(
-        Message.conversation_id,
-        func.count(Message.id).label('cnt')
-    ).group_by(Message.conversation_id).subquery()
-
+    # 直接用对话上的消息数（统计列），不再扫 messages 表
     msg_dist_raw = db.query(
         case(
-            (msg_counts.c.cnt <= 5, '1-5'),
-            (msg_counts.c.cnt <= 10, '6-10'),
-            (msg_counts.c.cnt <= 20, '11-20'),
+            (Conversation.message_count <= 5, '1-5'),
+            (Conversation.message_count <= 10, '6-10'),
+            (Conversation.message_count <= 20, '11-20'),
             else_='20+'
         ).label('range'),
         func.count().label('count')
-    ).select_from(msg_counts).group_by('range').all()
+    ).filter(Conversation.message_count > 0).group_by('range').all()
 
     msg_dist = {r.range: r.count for r in msg_dist_raw}
     messages_per_conversation = [
@@ -833,6 +1513,7 @@ def admin_get_monitoring_data(
     # 出生年代分布
     decade_dist_raw = db.query(
         case(
+            (User.birth_year.is_(None), '未填写'),
             (User.birth_year < 1950, '40前'),
             (User.birth_year < 1960, '50后'),
             (User.birth_year < 1970, '60后'),
@@ -841,35 +1522,29 @@ def admin_get_monitoring_data(
             else_='90后'
         ).label('decade'),
         func.count().label('count')
-    ).filter(User.birth_year.isnot(None)).group_by('decade').all()
+    ).group_by('decade').all()
 
-    birth_decade = [DistributionItem(label=r.decade, count=r.count) for r in decade_dist_raw]
+    birth_decade = [DistributionItem(label=r.decade, count=r.count) for r in decade_dist_raw if r.decade != '未填写']
     # 添加未填写的用户
-    users_without_birth = db.query(func.count(User.id)).filter(User.birth_year.is_(None)).scalar() or 0
+    users_without_birth = sum(r.count for r in decade_dist_raw if r.decade == '未填写')
     if users_without_birth > 0:
         birth_decade.append(DistributionItem(label='未填写', count=users_without_birth))
 
-    # 家乡省份分布（提取省份）
-    # 简单处理：取 hometown 的前2-3个字作为省份
-    hometown_raw = db.query(User.hometown).filter(User.hometown.isnot(None), User.hometown != '').all()
-    province_counts = {}
-    for (hometown,) in hometown_raw:
-        if not hometown:
-            continue
-        # 提取省份（简单处理：取前2-3个字）
-        province = hometown[:2] if len(hometown) >= 2 else hometown
-        # 处理特殊情况
-        if province in ['内蒙', '黑龙']:
-            province = hometown[:3] if len(hometown) >= 3 else province
-        province_counts[province] = province_counts.get(province, 0) + 1
+    # 家乡省份分布（简单处理：取 hometown 的前2个字，内蒙古 / 黑龙江取前3个字），在库里分组
+    prefix = func.substr(User.hometown, 1, 2)
+    province = case(
+        (prefix.in_(['内蒙', '黑龙']), func.substr(User.hometown, 1, 3)),
+        else_=prefix,
+    ).label('province')
+    has_hometown = (User.hometown.isnot(None)) & (User.hometown != '')
 
     # 排序取 Top 10
-    sorted_provinces = sorted(province_counts.items(), key=lambda x: x[1], reverse=True)[:10]
-    hometown_province = [DistributionItem(label=p, count=c) for p, c in sorted_provinces]
+    province_raw = db.query(province, func.count().label('count')).filter(has_hometown).group_by(
+        province
+    ).order_by(func.count().desc()).limit(10).all()
+    hometown_province = [DistributionItem(label=r.province, count=r.count) for r in province_raw]
 
-    users_without_hometown = db.query(func.count(User.id)).filter(
-        (User.hometown.is_(None)) | (User.hometown == '')
-    ).scalar() or 0
+    users_without_hometown = db.query(func.count(User.id)).filter(~has_hometown).scalar() or 0
     if users_without_hometown > 0:
         hometown_province.append(DistributionItem(label='未填写', count=users_without_hometown))
 
@@ -895,51 +1570,48 @@ def admin_get_retention_matrix(
     db: Session = Depends(get_db),
     _: None = Depends(verify_admin_key),
 ):
-    """管理员获取留存矩阵数据"""
-    from datetime import timedelta
-    from sqlalchemy import func, distinct
+    """管理员获取留存矩阵数据（一次查询：每个新用户最后一次开对话的日期）"""
+    return analytics_rollup.cached(f"retention-matrix:{days}", lambda: _build_retention_matrix(db, days))
 
-    now = datetime.now()
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
-    result = []
-
-    # 按注册日期分组，计算每天的留存
-    for i in range(days, 0, -1):
-        target_date = today_start - timedelta(days=i)
-        next_date = target_date + timedelta(days=1)
-
-        # 当天注册的用户
-        new_users_query = db.query(User.id).filter(
-            User.created_at >= target_date,
-            User.created_at < next_date
-        )
-        new_user_ids = [u.id for u in new_users_query.all()]
-        new_users_count = len(new_user_ids)
+def _build_retention_matrix(db: Session, days: int) -> List[RetentionMatrixRow]:
+    from datetime import timedelta
 
-        if new_users_count == 0:
-            continue
+    today = datetime.utcnow().date()
+    window_start = datetime.combine(today - timedelta(days=days), datetime.min.time())
+    today_start = datetime.combine(today, datetime.min.time())
+
+    # 窗口内注册的用户：注册日 + 最后一次开对话的日期
+    cohort_day = func.date(User.created_at)
+    rows = db.query(
+        cohort_day, User.id, func.max(UserDailyActivity.day)
+    ).outerjoin(
+        UserDailyActivity,
+        and_(UserDailyActivity.user_id == User.id, UserDailyActivity.conversations > 0),
+    ).filter(
+        User.created_at >= window_start,
+        User.created_at < today_start,
+    ).group_by(cohort_day, User.id).all()
+
+    # 第 N 天留存：注册 N 天后（含当天）还开过对话
+    cohorts: Dict[date, List[Optional[date]]] = {}
+    for day, _, last_active in rows:
+        cohorts.setdefault(to_date(day), []).append(to_date(last_active))
 
+    result = []
+    for cohort in sorted(cohorts):
+        last_days = cohorts[cohort]
         row = RetentionMatrixRow(
-            date=target_date.strftime('%m-%d'),
-            new_users=new_users_count,
+            date=cohort.strftime('%m-%d'),
+            new_users=len(last_days),
         )
-
-        # 计算各天留存
         for retention_day, attr_name in [(1, 'day1'), (3, 'day3'), (7, 'day7'), (14, 'day14'), (30, 'day30')]:
-            retention_date = target_date + timedelta(days=retention_day)
-            if retention_date > today_start:
+            retention_date = cohort + timedelta(days=retention_day)
+            if retention_date > today:
                 # 还没到这一天
                 continue
-
-            # 在 retention_date 当天或之后有活动的用户数
-            retained = db.query(func.count(distinct(Conversation.user_id))).filter(
-                Conversation.user_id.in_(new_user_ids),
-                Conversation.created_at >= retention_date
-            ).scalar() or 0
-
-            setattr(row, attr_name, round(retained / new_users_count, 2) if new_users_count > 0 else 0)
-
+            retained = sum(1 for d in last_days if d and d >= retention_date)
+            setattr(row, attr_name, round(retained / len(last_days), 2))
         result.append(row)
 
     return result
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
@@ -7,12 +9,14 @@ from typing import List, Optional
 from app.database import get_db, SessionLocal
 from app.services.chat_service import chat_service
 from app.services.llm_service import llm_service
-from app.services.summary_service import summary_service
-from app.services.memoir_service import memoir_service
-from app.services.topic_service import topic_service
 from app.services.profile_service import profile_service
-from app.models import Conversation, Memoir, User
-from app.auth import get_current_user
+from app.services.post_conversation import post_conversation
+from app.services.llm_ledger import llm_context
+from app.services.job_queue import job_queue, PRIORITY_HIGH
+from app.api.job import accepted
+from app.api.pagination import list_response, page, page_params
+from app.models import Conversation, User
+from app.auth import AuthUser, get_auth_user
 
 router = APIRouter()
 
@@ -63,7 +67,7 @@ def _check_ownership(db: Session, conversation_id: str, user_id: str) -> Convers
 
 @router.post("/start", response_model=StartResponse)
 def start_conversation(
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_auth_user),
     db: Session = Depends(get_db),
 ):
     """开始新对话"""
@@ -78,7 +82,7 @@ def start_conversation(
 def chat(
     conversation_id: str,
     request: ChatRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_auth_user),
     db: Session = Depends(get_db),
 ):
     """发送消息"""
@@ -95,7 +99,7 @@ def chat(
 def chat_stream(
     conversation_id: str,
     request: ChatRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_auth_user),
 ):
     """流式发送消息"""
     db = SessionLocal()
@@ -126,74 +130,71 @@ def chat_stream(
         raise e
 
 
-@router.post("/{conversation_id}/end", response_model=ConversationResponse)
+@router.post("/{conversation_id}/end", status_code=202)
 def end_conversation(
     conversation_id: str,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_auth_user),
     db: Session = Depends(get_db),
 ):
-    """结束对话（生成摘要）"""
+    """结束对话（提交生成摘要的任务，返回任务 ID；完成后 result 里是摘要）"""
     _check_ownership(db, conversation_id, current_user.id)
-    conversation = chat_service.end_conversation(db, conversation_id)
-    if not conversation:
-        raise HTTPException(status_code=404, detail="对话不存在")
-    return conversation
+    job_id = job_queue.enqueue(
+        "conversation_summary",
+        {"conversation_id": conversation_id, "user_id": current_user.id},
+        priority=PRIORITY_HIGH,
+        dedup_key=f"conversation_summary:{conversation_id}",
+        coalesce_running=True,
+    )
+    return accepted(job_id)
 
 
-def process_conversation_end(conversation_id: str, user_id: str):
-    """后台处理对话结束后的任务"""
+@job_queue.handler("conversation_summary")
+def process_conversation_summary(payload: dict):
+    """结束对话并生成摘要（任务队列执行）"""
+    conversation_id = payload["conversation_id"]
     db = SessionLocal()
     try:
-        print(f"[Conversation] 开始处理对话结束任务: {conversation_id}")
-
-        user = db.query(User).filter(User.id == user_id).first()
-
-        if user and not user.profile_completed:
-            print(f"[Conversation] 用户未完成信息收集，尝试提取...")
-            profile_service.extract_and_update_profile(db, conversation_id, user_id)
-        else:
-            summary_service.generate_summary(db, conversation_id)
-
-            # 自动生成回忆录（如果该对话尚未生成过）
-            existing_memoir = db.query(Memoir).filter(
-                Memoir.conversation_id == conversation_id
-            ).first()
-            if not existing_memoir:
-                print(f"[Conversation] 自动生成回忆录: {conversation_id}")
-                memoir_service.generate_from_conversation(db, user_id, conversation_id)
-            else:
-                print(f"[Conversation] 该对话已有回忆录，跳过自动生成")
-
-            # 根据已完成回忆录数量决定话题池操作
-            completed_memoir_count = db.query(Memoir).filter(
-                Memoir.user_id == user_id,
-                Memoir.status == "completed",
-                Memoir.deleted_at == None,
-            ).count()
-
-            if completed_memoir_count == 1:
-                # 刚完成第一篇回忆录，首次生成个性化话题
-                print(f"[Conversation] 用户完成第一篇回忆录，生成个性化话题")
-                topic_service.generate_topic_options(db, user)
-            elif completed_memoir_count > 1:
-                # 已有多篇回忆录，审查话题池
-                topic_service.review_topic_pool_async(user_id)
-            # completed_memoir_count == 0: 回忆录生成失败，不处理话题
-
-        print(f"[Conversation] 对话结束任务完成: {conversation_id}")
-    except Exception as e:
-        print(f"[Conversation] 对话结束任务失败: {e}")
-        import traceback
-        traceback.print_exc()
+        with llm_context(user_id=payload["user_id"], conversation_id=conversation_id, lane="interactive"):
+            conversation = chat_service.end_conversation(db, conversation_id)
+        if not conversation:
+            raise RuntimeError("对话不存在")
+        return {"conversation_id": conversation.id, "status": conversation.status, "summary": conversation.summary}
     finally:
         db.close()
 
 
+@job_queue.handler("conversation_end")
+def process_conversation_end(payload: dict):
+    """后台处理对话结束后的任务（任务队列执行，失败会重试）"""
+    conversation_id, user_id = payload["conversation_id"], payload["user_id"]
+    db = SessionLocal()
+    try:
+        with llm_context(user_id=user_id, conversation_id=conversation_id):
+            _run_conversation_end_tasks(db, conversation_id, user_id, payload.get("ended_at"))
+    finally:
+        db.close()
+
+
+def _run_conversation_end_tasks(db: Session, conversation_id: str, user_id: str, ended_at: Optional[float] = None):
+    """对话结束后的任务：信息提取 / 摘要 + 回忆录 + 话题池"""
+    print(f"[Conversation] 开始处理对话结束任务: {conversation_id}")
+
+    user = db.query(User).filter(User.id == user_id).first()
+
+    if user and not user.profile_completed:
+        print(f"[Conversation] 用户未完成信息收集，尝试提取...")
+        profile_service.extract_and_update_profile(db, conversation_id, user_id)
+    else:
+        # 摘要与回忆录并行，完成后处理话题池
+        post_conversation.run(conversation_id, user_id, ended_at)
+
+    print(f"[Conversation] 对话结束任务完成: {conversation_id}")
+
+
 @router.post("/{conversation_id}/end-quick")
 def end_conversation_quick(
     conversation_id: str,
-    background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_auth_user),
     db: Session = Depends(get_db),
 ):
     """快速结束对话（后台生成摘要和刷新开场白）"""
@@ -202,10 +203,10 @@ def end_conversation_quick(
     if not conversation:
         raise HTTPException(status_code=404, detail="对话不存在")
 
-    background_tasks.add_task(
-        process_conversation_end,
-        conversation_id,
-        conversation.user_id,
+    job_queue.enqueue(
+        "conversation_end",
+        {"conversation_id": conversation_id, "user_id": conversation.user_id, "ended_at": time.time()},
+        dedup_key=f"conversation_end:{conversation_id}",
     )
 
     return {"status": "ok", "conversation_id": conversation_id}
@@ -213,12 +214,25 @@ def end_conversation_quick(
 
 @router.get("/list")
 def list_conversations(
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    current_user: AuthUser = Depends(get_auth_user),
     db: Session = Depends(get_db),
 ):
-    """获取用户的对话列表"""
-    conversations = chat_service.get_user_conversations(db, current_user.id)
-    return [
+    """
+    获取用户的对话列表（新的在前）
+
+    带 limit 或 cursor 时游标翻页，下一页游标在 X-Next-Cursor 头；都不带时返回全部
+    """
+    after, limit = page_params(cursor, limit, 2, default=50, maximum=200)
+    rows = chat_service.get_user_conversations(
+        db, current_user.id, after=tuple(after) if after else None,
+        limit=limit + 1 if limit else None,
+    )
+    rows, next_cursor = page(rows, limit, key=lambda c: (c.created_at, c.id))
+
+    items = [
         {
             "id": c.id,
             "title": c.title,
@@ -226,14 +240,15 @@ def list_conversations(
             "status": c.status,
             "created_at": c.created_at.isoformat(),
         }
-        for c in conversations
+        for c in rows
     ]
+    return list_response(request, items, next_cursor)
 
 
 @router.get("/{conversation_id}", response_model=ConversationResponse)
 def get_conversation(
     conversation_id: str,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_auth_user),
     db: Session = Depends(get_db),
 ):
     """获取对话详情"""
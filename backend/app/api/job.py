@@ -0,0 +1,121 @@
+"""
+任务状态 API
+耗时的操作（重新生成回忆录 / 时代记忆、结束对话生成摘要……）提交到任务队列后立即返回任务 ID，
+前端轮询 GET /job/{id} 或订阅 GET /job/{id}/stream 等待结果。
+"""
+import asyncio
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.auth import AuthUser, get_auth_user
+from app.services.job_queue import job_queue, SUCCEEDED, FAILED
+
+# SSE 连接上查询任务状态的间隔（任务可能在别的进程里跑，只能查库）
+STREAM_POLL_SECONDS = 1.0
+# 多久没有状态变化发一次心跳
+STREAM_KEEPALIVE_SECONDS = 15
+
+router = APIRouter()
+
+
+def _view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """返回给前端的字段"""
+    return {k: v for k, v in job.items() if k != "owner"}
+
+
+def accepted(job_id: str, base_url: str = "/api/job", extra: Optional[Dict[str, Any]] = None) -> JSONResponse:
+    """
+    提交类接口的响应：202 + 任务 ID（重复提交时是已在排队 / 运行的那个任务）
+
+    Args:
+        base_url: 查询任务状态的接口前缀（管理员接口用 /api/admin/jobs）
+        extra: 附加到响应里的字段（只在提交时返回、不存进任务的内容）
+    """
+    job = job_queue.get(job_id)
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job_id,
+            "status": job["status"] if job else "queued",
+            "status_url": f"{base_url}/{job_id}",
+            "stream_url": f"{base_url}/{job_id}/stream",
+            **(extra or {}),
+        },
+    )
+
+
+def _get_own_job(job_id: str, user_id: str) -> Dict[str, Any]:
+    job = job_queue.get(job_id)
+    if not job or job["owner"] != user_id:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
+@router.get("/{job_id}")
+def get_job(
+    job_id: str,
+    current_user: AuthUser = Depends(get_auth_user),
+):
+    """查询任务状态：queued / running / succeeded / failed，完成后 result 为结果"""
+    return _view(_get_own_job(job_id, current_user.id))
+
+
+@router.get("/{job_id}/stream")
+def stream_job(
+    job_id: str,
+    current_user: AuthUser = Depends(get_auth_user),
+):
+    """
+    任务状态（SSE）
+
+    事件：
+    - status：状态变化（排队 → 运行 → 失败重试排队……）
+    - done：成功或最终失败，之后服务端关闭连接
+    """
+    _get_own_job(job_id, current_user.id)
+    return job_event_stream(job_id)
+
+
+def job_event_stream(job_id: str) -> StreamingResponse:
+    """任务状态 SSE 响应（调用方先做权限检查；管理员接口也用）"""
+
+    async def events():
+        last: Optional[tuple] = None
+        idle = 0.0
+        while True:
+            job = await run_in_threadpool(job_queue.get, job_id)
+            if job is None:
+                yield _sse("done", {"id": job_id, "status": "deleted"})
+                return
+            if job["status"] in (SUCCEEDED, FAILED):
+                yield _sse("done", _view(job))
+                return
+
+            state = (job["status"], job["attempts"])
+            if state != last:
+                last, idle = state, 0.0
+                yield _sse("status", _view(job))
+            elif idle >= STREAM_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+
+            await asyncio.sleep(STREAM_POLL_SECONDS)
+            idle += STREAM_POLL_SECONDS
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
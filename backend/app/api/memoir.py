@@ -1,4 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+import asyncio
+import json
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
@@ -6,8 +12,16 @@ from typing import List, Optional
 from app.database import get_db, SessionLocal
 from app.config import settings
 from app.services.memoir_service import memoir_service
-from app.models import User, Memoir
-from app.auth import get_current_user
+from app.models import Memoir
+from app.auth import AuthUser, get_auth_user
+from app.services.llm_ledger import llm_context
+from app.services.job_queue import job_queue, PRIORITY_HIGH
+from app.services.memoir_progress import memoir_progress, ProgressCursor, DONE, POLL_SECONDS
+from app.api.job import accepted
+from app.api.pagination import list_response, page, page_params
+
+# SSE 连接上多久查一次回忆录状态、发一次保活（生成任务还没开始或已在别的进程里结束时兜底）
+STREAM_STATUS_CHECK_SECONDS = 5
 
 router = APIRouter()
 
@@ -62,41 +76,64 @@ def _check_memoir_ownership(db: Session, memoir_id: str, user_id: str) -> Memoir
     return memoir
 
 
-@router.post("/generate", response_model=MemoirResponse)
+@router.post("/generate", status_code=202)
 def generate_memoir(
     request: GenerateRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: AuthUser = Depends(get_auth_user),
 ):
-    """从对话生成回忆录（仅 debug 模式，会覆盖已有回忆录）"""
+    """从对话生成回忆录（仅 debug 模式，会覆盖已有回忆录）；提交任务，完成后 result 里是 memoir_id"""
     if not settings.debug:
         raise HTTPException(status_code=403, detail="手动生成回忆录仅在 debug 模式下可用")
 
-    # 删除该对话已有的回忆录
-    db.query(Memoir).filter(Memoir.conversation_id == request.conversation_id).delete()
-    db.commit()
-
-    memoir = memoir_service.generate_from_conversation(
-        db=db,
-        user_id=current_user.id,
-        conversation_id=request.conversation_id,
-        title=request.title,
-        perspective=request.perspective,
+    job_id = job_queue.enqueue(
+        "memoir_generate",
+        {
+            "conversation_id": request.conversation_id, "title": request.title,
+            "perspective": request.perspective, "user_id": current_user.id,
+        },
+        priority=PRIORITY_HIGH,
+        dedup_key=f"memoir_generate:{request.conversation_id}",
+        coalesce_running=True,
     )
-    return memoir
+    return accepted(job_id)
 
 
-def complete_memoir_background(memoir_id: str, perspective: str):
-    """后台完成回忆录内容生成"""
+@job_queue.handler("memoir_generate")
+def generate_memoir_background(payload: dict):
+    """从对话生成回忆录（任务队列执行）"""
+    conversation_id, user_id = payload["conversation_id"], payload["user_id"]
+    db = SessionLocal()
+    try:
+        # 删除该对话已有的回忆录
+        db.query(Memoir).filter(Memoir.conversation_id == conversation_id).delete()
+        db.commit()
+
+        with llm_context(user_id=user_id, conversation_id=conversation_id, lane="interactive"):
+            memoir = memoir_service.generate_from_conversation(
+                db=db,
+                user_id=user_id,
+                conversation_id=conversation_id,
+                title=payload.get("title"),
+                perspective=payload.get("perspective") or "第一人称",
+            )
+        return {"memoir_id": memoir.id}
+    finally:
+        db.close()
+
+
+@job_queue.handler("memoir_complete")
+def complete_memoir_background(payload: dict):
+    """后台完成回忆录内容生成（任务队列执行）"""
+    memoir_id = payload["memoir_id"]
     db = SessionLocal()
     try:
         print(f"[Memoir] 开始生成回忆录内容: memoir_id={memoir_id}")
-        memoir_service.complete_generation(db, memoir_id, perspective)
+        # 出错时 track 会发布 error 事件
+        with llm_context(user_id=payload.get("user_id"), lane="interactive"), memoir_progress.track(memoir_id):
+            memoir = memoir_service.complete_generation(db, memoir_id, payload["perspective"])
         print(f"[Memoir] 回忆录生成完成: memoir_id={memoir_id}")
-    except Exception as e:
-        print(f"[Memoir] 回忆录生成失败: {e}")
-        import traceback
-        traceback.print_exc()
+        if memoir:
+            memoir_progress.done(memoir_id, memoir.status, memoir.title, memoir.content or "")
     finally:
         db.close()
 
@@ -104,8 +141,7 @@ def complete_memoir_background(memoir_id: str, perspective: str):
 @router.post("/generate-async")
 def generate_memoir_async(
     request: GenerateRequest,
-    background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_auth_user),
     db: Session = Depends(get_db),
 ):
     """异步生成回忆录（仅 debug 模式，会覆盖已有回忆录）"""
@@ -116,16 +152,18 @@ def generate_memoir_async(
     db.query(Memoir).filter(Memoir.conversation_id == request.conversation_id).delete()
     db.commit()
 
-    memoir = memoir_service.create_generating(
-        db=db,
-        user_id=current_user.id,
-        conversation_id=request.conversation_id,
-    )
-
-    background_tasks.add_task(
-        complete_memoir_background,
-        memoir.id,
-        request.perspective,
+    with llm_context(user_id=current_user.id, conversation_id=request.conversation_id, lane="interactive"):
+        memoir = memoir_service.create_generating(
+            db=db,
+            user_id=current_user.id,
+            conversation_id=request.conversation_id,
+        )
+
+    job_queue.enqueue(
+        "memoir_complete",
+        {"memoir_id": memoir.id, "perspective": request.perspective, "user_id": current_user.id},
+        priority=PRIORITY_HIGH,
+        dedup_key=f"memoir:{memoir.id}",
     )
 
     return {"status": "started", "memoir_id": memoir.id, "title": memoir.title}
@@ -133,45 +171,135 @@ def generate_memoir_async(
 
 @router.get("/list")
 def list_memoirs(
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    current_user: AuthUser = Depends(get_auth_user),
     db: Session = Depends(get_db),
 ):
-    """获取用户的回忆录列表"""
-    memoirs = memoir_service.get_user_memoirs(db, current_user.id)
-
-    result = []
-    for memoir in memoirs:
-        item = {
-            "id": memoir.id,
-            "title": memoir.title,
-            "status": memoir.status or "completed",
-            "order_index": memoir.order_index,
-            "conversation_start": None,
-            "conversation_end": None,
-            "year_start": memoir.year_start,
-            "year_end": memoir.year_end,
-            "time_period": memoir.time_period,
+    """
+    获取用户的回忆录列表（按 order_index 排序）
+
+    带 limit 或 cursor 时游标翻页，下一页游标在 X-Next-Cursor 头；都不带时返回全部
+    """
+    after, limit = page_params(cursor, limit, 2, default=100, maximum=500)
+    rows = memoir_service.get_user_memoir_list(
+        db, current_user.id, after=tuple(after) if after else None,
+        limit=limit + 1 if limit else None,
+    )
+    rows, next_cursor = page(rows, limit, key=lambda m: (m.order_index, m.id))
+
+    items = [
+        {
+            "id": m.id,
+            "title": m.title,
+            "status": m.status or "completed",
+            "order_index": m.order_index,
+            "conversation_start": m.first_message_at.strftime("%Y-%m-%d %H:%M") if m.first_message_at else None,
+            "conversation_end": m.last_message_at.strftime("%Y-%m-%d %H:%M") if m.last_message_at else None,
+            "year_start": m.year_start,
+            "year_end": m.year_end,
+            "time_period": m.time_period,
         }
+        for m in rows
+    ]
+    return list_response(request, items, next_cursor)
+
 
-        if memoir.conversation and memoir.conversation.messages:
-            messages = memoir.conversation.messages
-            if messages:
-                first_msg = messages[0]
-                if first_msg.created_at:
-                    item["conversation_start"] = first_msg.created_at.strftime("%Y-%m-%d %H:%M")
-                last_msg = messages[-1]
-                if last_msg.created_at:
-                    item["conversation_end"] = last_msg.created_at.strftime("%Y-%m-%d %H:%M")
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-        result.append(item)
 
-    return result
+def _memoir_snapshot(memoir_id: str) -> Optional[dict]:
+    """只查状态、标题和正文，不加载对话"""
+    db = SessionLocal()
+    try:
+        row = db.query(Memoir.status, Memoir.title, Memoir.content).filter(Memoir.id == memoir_id).first()
+        return {"status": row[0], "title": row[1], "content": row[2] or ""} if row else None
+    finally:
+        db.close()
+
+
+@router.get("/{memoir_id}/stream")
+def stream_memoir(
+    memoir_id: str,
+    current_user: AuthUser = Depends(get_auth_user),
+    db: Session = Depends(get_db),
+):
+    """
+    回忆录生成进度（SSE）
+
+    事件：
+    - stage：当前步骤 {"stage": analyzing/drafting/checking/revising/merging, "detail"}
+    - draft：草稿增量 {"text", "reset"}，reset=true 时先清空再追加
+    - error：本次生成出错，任务队列会重试，连接不断开
+    - done：生成结束 {"status", "title", "content"}，之后服务端关闭连接
+    """
+    _check_memoir_ownership(db, memoir_id, current_user.id)
+
+    async def events():
+        queue = memoir_progress.subscribe(memoir_id)
+        cursor = ProgressCursor()
+        try:
+            # 订阅之后再查库，避免两者之间刚好完成而错过 done
+            current = await run_in_threadpool(_memoir_snapshot, memoir_id)
+            if current is None or current["status"] != "generating":
+                yield _sse(DONE, current or {"status": "deleted", "title": "", "content": ""})
+                return
+
+            tracked = False
+            last_check = time.monotonic()
+            while True:
+                # 本进程在生成时读内存快照，否则读其他进程写进库里的快照
+                state = memoir_progress.local_state(memoir_id)
+                if state is None:
+                    state = await run_in_threadpool(memoir_progress.load_state, memoir_id)
+                if state is not None and state["version"] != cursor.version:
+                    for message in cursor.diff(state):
+                        yield _sse(message["event"], message["data"])
+
+                # 快照消失（生成结束）时立即查状态，否则定期查
+                now = time.monotonic()
+                if (tracked and state is None) or now - last_check >= STREAM_STATUS_CHECK_SECONDS:
+                    current = await run_in_threadpool(_memoir_snapshot, memoir_id)
+                    if current is None or current["status"] != "generating":
+                        yield _sse(DONE, current or {"status": "deleted", "title": "", "content": ""})
+                        return
+                    if now - last_check >= STREAM_STATUS_CHECK_SECONDS:
+                        yield ": keep-alive\n\n"
+                    last_check = now
+                tracked = state is not None
+
+                # 本进程发布进度时立即醒来，否则 POLL_SECONDS 后再读一次库
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    continue
+                while True:
+                    if message["event"] == DONE:
+                        yield _sse(DONE, message["data"])
+                        return
+                    if queue.empty():
+                        break
+                    message = queue.get_nowait()
+        finally:
+            memoir_progress.unsubscribe(memoir_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
 
 
 @router.get("/{memoir_id}", response_model=MemoirResponse)
 def get_memoir(
     memoir_id: str,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_auth_user),
     db: Session = Depends(get_db),
 ):
     """获取回忆录详情"""
@@ -183,7 +311,7 @@ def get_memoir(
 def update_memoir(
     memoir_id: str,
     request: UpdateRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_auth_user),
     db: Session = Depends(get_db),
 ):
     """更新回忆录"""
@@ -202,7 +330,7 @@ def update_memoir(
 @router.delete("/{memoir_id}")
 def delete_memoir(
     memoir_id: str,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_auth_user),
     db: Session = Depends(get_db),
 ):
     """删除回忆录"""
@@ -217,20 +345,62 @@ class RegenerateRequest(BaseModel):
     perspective: Optional[str] = "第一人称"
 
 
-@router.post("/{memoir_id}/regenerate", response_model=MemoirResponse)
+@router.post("/{memoir_id}/regenerate", status_code=202)
 def regenerate_memoir(
     memoir_id: str,
     request: RegenerateRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_auth_user),
     db: Session = Depends(get_db),
 ):
-    """重新生成回忆录内容"""
-    _check_memoir_ownership(db, memoir_id, current_user.id)
-    memoir = memoir_service.regenerate(
-        db=db,
-        memoir_id=memoir_id,
-        perspective=request.perspective,
+    """
+    重新生成回忆录内容（提交任务，返回任务 ID；重复提交合并进正在进行的任务）
+
+    提交后回忆录状态为 generating，可以订阅 /{memoir_id}/stream 看生成进度；
+    失败时保留原来的内容，状态恢复为 completed
+    """
+    memoir = _check_memoir_ownership(db, memoir_id, current_user.id)
+    if not memoir.conversation_id:
+        raise HTTPException(status_code=400, detail="该回忆录没有关联的对话，无法重新生成")
+
+    # 提交前就标记为生成中，提交后马上订阅进度的客户端不会直接收到 done
+    memoir.status = "generating"
+    db.commit()
+
+    job_id = job_queue.enqueue(
+        "memoir_regenerate",
+        {"memoir_id": memoir_id, "perspective": request.perspective, "user_id": current_user.id},
+        priority=PRIORITY_HIGH,
+        dedup_key=f"memoir:{memoir_id}",
+        max_attempts=1,
+        coalesce_running=True,
     )
-    if not memoir:
-        raise HTTPException(status_code=404, detail="回忆录不存在或无法重新生成")
-    return memoir
+    return accepted(job_id)
+
+
+@job_queue.handler("memoir_regenerate")
+def regenerate_memoir_background(payload: dict):
+    """重新生成回忆录内容（任务队列执行）"""
+    memoir_id = payload["memoir_id"]
+    db = SessionLocal()
+    try:
+        # 和生成一样发布进度；重新生成从头开始，不沿用上一次生成留下的快照
+        with llm_context(user_id=payload.get("user_id"), lane="interactive"), memoir_progress.track(memoir_id, reset=True):
+            memoir = memoir_service.regenerate(db=db, memoir_id=memoir_id, perspective=payload["perspective"])
+            if not memoir:
+                raise RuntimeError("回忆录不存在或对话内容为空，无法重新生成")
+    except Exception:
+        # 任务不重试：保留原来的内容，恢复为已完成，并结束订阅方的进度流
+        db.rollback()
+        db.query(Memoir).filter(Memoir.id == memoir_id, Memoir.status == "generating").update(
+            {"status": "completed"}, synchronize_session=False,
+        )
+        db.commit()
+        current = _memoir_snapshot(memoir_id)
+        if current:
+            memoir_progress.done(memoir_id, current["status"], current["title"], current["content"])
+        raise
+    else:
+        memoir_progress.done(memoir_id, memoir.status, memoir.title, memoir.content or "")
+        return {"memoir_id": memoir.id}
+    finally:
+        db.close()
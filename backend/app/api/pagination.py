@@ -0,0 +1,105 @@
+"""
+游标分页（keyset）
+列表按固定的排序键（如 created_at + id）翻页，游标是上一页最后一条的排序键，
+下一页直接从索引上接着读，不用 OFFSET，翻到多深都一样快。
+
+原来不分页的列表接口（对话、回忆录、用户列表），请求既不带 limit 也不带 cursor 时
+仍返回完整列表，不认识 X-Next-Cursor 头的老客户端拿到的数据不会变少。
+"""
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+
+# 下一页游标所在的响应头（原来直接返回数组的列表接口，body 保持数组不变）
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# 游标里的时间字段带这个前缀，解码时还原成 datetime
+_DATETIME_PREFIX = "dt:"
+
+
+def clamp_limit(limit: int, default: int, maximum: int) -> int:
+    """每页条数：非法值用默认值，超过上限按上限"""
+    if limit is None or limit < 1:
+        return default
+    return min(limit, maximum)
+
+
+def page_params(
+    cursor: Optional[str], limit: Optional[int], size: int, default: int, maximum: int,
+) -> Tuple[Optional[List[Any]], Optional[int]]:
+    """
+    解析游标和每页条数，返回 (排序键列表或 None, 每页条数)
+
+    limit 和 cursor 都没传时每页条数为 None，表示不分页、返回全部
+    """
+    if limit is None and not cursor:
+        return None, None
+    return decode_cursor(cursor, size), clamp_limit(limit, default, maximum)
+
+
+def encode_cursor(*values: Any) -> str:
+    """把排序键编码成不透明的游标字符串"""
+    payload = [
+        _DATETIME_PREFIX + v.isoformat() if isinstance(v, datetime) else v
+        for v in values
+    ]
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[List[Any]]:
+    """解析游标，返回排序键列表；没有游标返回 None，格式不对返回 400"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw.decode("utf-8"))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError(cursor)
+        return [
+            datetime.fromisoformat(v[len(_DATETIME_PREFIX):])
+            if isinstance(v, str) and v.startswith(_DATETIME_PREFIX) else v
+            for v in values
+        ]
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+def page(rows: Sequence[Any], limit: Optional[int], key) -> tuple:
+    """
+    rows 按 limit + 1 条查出，多出来的一条说明还有下一页；limit 为 None 时 rows 就是全部
+
+    Returns:
+        (本页数据, 下一页游标或 None)
+    """
+    if limit is None:
+        return list(rows), None
+    items = list(rows[:limit])
+    next_cursor = encode_cursor(*key(items[-1])) if len(rows) > limit else None
+    return items, next_cursor
+
+
+def list_response(request: Request, items: List[Any], next_cursor: Optional[str]) -> Response:
+    """
+    数组形式的分页响应：下一页游标放在 X-Next-Cursor 头
+
+    带 ETag（本页内容 + 游标的哈希），客户端带 If-None-Match 且内容没变时返回 304，不重发 body
+    """
+    body = json.dumps(jsonable_encoder(items), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    digest = hashlib.sha1(body)
+    digest.update((next_cursor or "").encode("ascii"))
+    etag = f'"{digest.hexdigest()[:20]}"'
+
+    # no-cache：浏览器每次都带 If-None-Match 回来校验，内容没变拿到 304
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -9,33 +9,31 @@ from urllib.parse import parse_qs
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
 from app.services.doubao_realtime import DoubaoRealtimeClient
-from app.database import SessionLocal
-from app.models import Message, User
+from app.database import SessionLocal, AsyncSessionLocal
+from app.models import User
 from app.auth import decode_token
+from app.services.memoir_speculation import memoir_speculation
+from app.services.rolling_digest import rolling_digest
+from app.services.transcript_service import transcript_service
+from app.services.chat_service import chat_service
 
 router = APIRouter()
 
 
-def save_message(conversation_id: str, role: str, content: str):
+async def save_message(conversation_id: str, role: str, content: str):
     """保存消息到数据库"""
     if not conversation_id or not content or not content.strip():
         return
 
-    db = SessionLocal()
-    try:
-        message = Message(
-            conversation_id=conversation_id,
-            role=role,
-            content=content.strip()
-        )
-        db.add(message)
-        db.commit()
-        print(f"[Realtime] 保存消息: {role} - {content[:50]}...")
-    except Exception as e:
-        print(f"[Realtime] 保存消息失败: {e}")
-        db.rollback()
-    finally:
-        db.close()
+    async with AsyncSessionLocal() as db:
+        try:
+            await db.run_sync(chat_service.add_message, conversation_id, role, content.strip())
+            print(f"[Realtime] 保存消息: {role} - {content[:50]}...")
+            await memoir_speculation.on_message_saved(conversation_id)
+            await rolling_digest.on_message_saved(conversation_id)
+        except Exception as e:
+            print(f"[Realtime] 保存消息失败: {e}")
+            await db.rollback()
 
 
 def authenticate_ws(query_params: dict) -> str:
@@ -46,28 +44,30 @@ def authenticate_ws(query_params: dict) -> str:
     return decode_token(token)
 
 
-async def validate_profile_completion(conversation_id: str, websocket: WebSocket):
+async def validate_profile_completion(conversation_id: str, websocket: WebSocket, user_id: str = None):
     """异步验证信息收集是否真正完成，完成则通知前端"""
     try:
-        db = SessionLocal()
-        try:
-            messages = db.query(Message).filter(
-                Message.conversation_id == conversation_id
-            ).order_by(Message.created_at).all()
-
-            # 构建对话文本
-            conversation_text = "\n".join(
-                f"{'记录师' if m.role == 'assistant' else '用户'}: {m.content}"
-                for m in messages
-            )
-        finally:
-            db.close()
-
-        # 调用 Qwen 验证
         from app.services.llm_service import llm_service
-        complete = await asyncio.get_event_loop().run_in_executor(
-            None, llm_service.check_profile_completion, conversation_text
-        )
+        from app.services.llm_ledger import llm_context
+
+        # 滚动摘要合并和验证都要调 LLM，整体放到线程池里跑，这里用同步会话
+        def _check():
+            db = SessionLocal()
+            try:
+                # 优先用滚动摘要：只需合并最后几轮
+                digest = rolling_digest.fold(db, conversation_id)
+                if digest is not None:
+                    return bool(digest.get("profile_complete"))
+
+                conversation_text = transcript_service.text(db, conversation_id)
+            finally:
+                db.close()
+
+            # 调用 Qwen 验证
+            with llm_context(user_id=user_id, conversation_id=conversation_id):
+                return llm_service.check_profile_completion(conversation_text)
+
+        complete = await asyncio.get_event_loop().run_in_executor(None, _check)
 
         if complete:
             print(f"[Realtime] Qwen 确认信息收集完成，通知前端")
@@ -134,14 +134,11 @@ async def realtime_dialog(websocket: WebSocket):
     # 自由聊天模式：动态构建背景信息
     if custom_topic == "__free__" and user_id:
         from app.services.topic_service import topic_service
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.id == user_id).first()
+        async with AsyncSessionLocal() as db:
+            user = await db.get(User, user_id)
             if user:
-                custom_context = topic_service.build_free_topic_context(db, user)
+                custom_context = await db.run_sync(topic_service.build_free_topic_context, user)
                 print(f"[Realtime] 自由聊天模式，已构建背景信息 ({len(custom_context)} 字)")
-        finally:
-            db.close()
 
     client = None
     receive_task = None
@@ -149,6 +146,13 @@ async def realtime_dialog(websocket: WebSocket):
     # 用于累积文本内容
     current_asr_text = ""
     current_response_text = ""
+    pause_task = None  # 停顿计时（预先起草回忆录）
+
+    def restart_pause_watch():
+        nonlocal pause_task
+        if pause_task and not pause_task.done():
+            pause_task.cancel()
+        pause_task = asyncio.create_task(memoir_speculation.watch_pause(conversation_id))
 
     async def on_audio(audio_data: bytes):
         """收到音频回复"""
@@ -200,8 +204,9 @@ async def realtime_dialog(websocket: WebSocket):
             elif event == 459:
                 # 用户说完 - 保存用户消息
                 if current_asr_text and conversation_id:
-                    save_message(conversation_id, "user", current_asr_text)
-                    current_asr_text = ""
+                    asr_text, current_asr_text = current_asr_text, ""
+                    await save_message(conversation_id, "user", asr_text)
+                    restart_pause_watch()
 
             elif event == 359:
                 # TTS 结束 - 保存 AI 回复
@@ -210,17 +215,17 @@ async def realtime_dialog(websocket: WebSocket):
                     has_completion_marker = '【信息收集完成】' in current_response_text
                     # 保存时去掉标记
                     clean_text = current_response_text.replace('【信息收集完成】', '').strip()
-                    save_message(conversation_id, "assistant", clean_text)
+                    current_response_text = ""  # 先清空，保存期间到达的新回复不会被误清
+                    await save_message(conversation_id, "assistant", clean_text)
+                    restart_pause_watch()
 
                     # 如果是信息收集模式且检测到标记，启动 Qwen 二次验证
                     if has_completion_marker and actual_mode == "profile_collection":
                         print(f"[Realtime] 检测到信息收集完成标记，启动 Qwen 验证")
                         asyncio.create_task(
-                            validate_profile_completion(conversation_id, websocket)
+                            validate_profile_completion(conversation_id, websocket, user_id)
                         )
 
-                    current_response_text = ""
-
         except Exception as e:
             print(f"发送事件失败: {e}")
 
@@ -232,9 +237,8 @@ async def realtime_dialog(websocket: WebSocket):
         user_gender = None  # 性别
 
         if user_id:
-            db = SessionLocal()
-            try:
-                user = db.query(User).filter(User.id == user_id).first()
+            async with AsyncSessionLocal() as db:
+                user = await db.get(User, user_id)
                 if user:
                     user_nickname = user.nickname
                     user_preferred_name = user.preferred_name
@@ -246,8 +250,6 @@ async def realtime_dialog(websocket: WebSocket):
                         print(f"[Realtime] 已知信息: nickname={user_nickname}, gender={user_gender}")
                     else:
                         print(f"[Realtime] 用户信息: nickname={user_nickname}, preferred_name={user_preferred_name}")
-            finally:
-                db.close()
 
         # 对话中使用的称呼：优先用 preferred_name，否则用 nickname
         display_name = user_preferred_name or user_nickname
@@ -306,15 +308,12 @@ async def realtime_dialog(websocket: WebSocket):
         elif user_id:
             # 正常模式，从话题候选池获取
             from app.services.topic_service import topic_service
-            db = SessionLocal()
-            try:
-                topics = topic_service.get_topic_options(db, user_id)
-                if topics:
-                    import random
-                    topic = random.choice(topics)
-                    greeting = topic.get('greeting')
-            finally:
-                db.close()
+            async with AsyncSessionLocal() as db:
+                topics = await db.run_sync(topic_service.get_topic_options, user_id)
+            if topics:
+                import random
+                topic = random.choice(topics)
+                greeting = topic.get('greeting')
 
         # 发送开场白
         await client.say_hello(greeting)
@@ -365,6 +364,11 @@ async def realtime_dialog(websocket: WebSocket):
 
     finally:
         # 清理
+        if pause_task and not pause_task.done():
+            pause_task.cancel()
+        memoir_speculation.forget(conversation_id)
+        rolling_digest.forget(conversation_id)
+
         if receive_task:
             receive_task.cancel()
             try:
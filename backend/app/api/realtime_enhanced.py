@@ -10,34 +10,32 @@ from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
 from app.services.doubao_realtime_enhanced import DoubaoRealtimeEnhancedClient
 from app.services.intervention_service import intervention_service
-from app.database import SessionLocal
-from app.models import Message, User
+from app.database import AsyncSessionLocal
+from app.models import User
 from app.auth import decode_token
+from app.services.memoir_speculation import memoir_speculation
+from app.services.rolling_digest import rolling_digest
+from app.services.chat_service import chat_service
 from app.services.era_memory_service import era_memory_service
+from app.services.llm_ledger import llm_context
 
 router = APIRouter()
 
 
-def save_message(conversation_id: str, role: str, content: str):
+async def save_message(conversation_id: str, role: str, content: str):
     """保存消息到数据库"""
     if not conversation_id or not content or not content.strip():
         return
 
-    db = SessionLocal()
-    try:
-        message = Message(
-            conversation_id=conversation_id,
-            role=role,
-            content=content.strip()
-        )
-        db.add(message)
-        db.commit()
-        print(f"[Enhanced] 保存消息: {role} - {content[:50]}...")
-    except Exception as e:
-        print(f"[Enhanced] 保存消息失败: {e}")
-        db.rollback()
-    finally:
-        db.close()
+    async with AsyncSessionLocal() as db:
+        try:
+            await db.run_sync(chat_service.add_message, conversation_id, role, content.strip())
+            print(f"[Enhanced] 保存消息: {role} - {content[:50]}...")
+            await memoir_speculation.on_message_saved(conversation_id)
+            await rolling_digest.on_message_saved(conversation_id)
+        except Exception as e:
+            print(f"[Enhanced] 保存消息失败: {e}")
+            await db.rollback()
 
 
 def authenticate_ws(query_params: dict) -> str:
@@ -114,14 +112,20 @@ async def realtime_dialog_enhanced(websocket: WebSocket):
     recent_messages = []  # 最近几轮对话，用于干预判断
     era_memories = ""  # 时代记忆
     intervention_task = None  # 正在执行的干预判断任务
+    pause_task = None  # 停顿计时（预先起草回忆录）
+
+    def restart_pause_watch():
+        nonlocal pause_task
+        if pause_task and not pause_task.done():
+            pause_task.cancel()
+        pause_task = asyncio.create_task(memoir_speculation.watch_pause(conversation_id))
 
     # 获取用户信息和时代记忆
     user_nickname = None
     user_brief = ""  # 用户背景简介（给干预模型用）
     if user_id:
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.id == user_id).first()
+        async with AsyncSessionLocal() as db:
+            user = await db.get(User, user_id)
             if user:
                 user_nickname = user.preferred_name or user.nickname
                 # 构建用户背景简介
@@ -137,12 +141,10 @@ async def realtime_dialog_enhanced(websocket: WebSocket):
                 user_brief = "，".join(parts) + "。" if parts else ""
                 # 获取时代记忆
                 if user.birth_year:
-                    era_memories = era_memory_service.get_for_user(db, user.birth_year)
+                    era_memories = await db.run_sync(era_memory_service.get_for_user, user.birth_year)
                 if not era_memories:
                     era_memories = user.era_memories or ""
                 print(f"[Enhanced] 用户: {user_nickname}, 时代记忆: {len(era_memories)} 字")
-        finally:
-            db.close()
 
     # 构建干预模型用的话题背景（话题名 + context + 用户简介）
     topic_brief = custom_topic or "自由聊天"
@@ -154,11 +156,12 @@ async def realtime_dialog_enhanced(websocket: WebSocket):
     async def _run_intervention_and_inject(topic_info: str, messages: list, era_mem: str):
         """异步执行干预判断，完成后立即注入510（不等459）"""
         try:
-            result = await intervention_service.judge_and_intervene(
-                topic=topic_info,
-                recent_messages=messages,
-                era_memories=era_mem
-            )
+            with llm_context(user_id=user_id, conversation_id=conversation_id):
+                result = await intervention_service.judge_and_intervene(
+                    topic=topic_info,
+                    recent_messages=messages,
+                    era_memories=era_mem
+                )
 
             if result and result["type"] == "timeout":
                 # 超时：不注入，但通知前端
@@ -242,8 +245,10 @@ async def realtime_dialog_enhanced(websocket: WebSocket):
 
             elif event == 359:  # TTS 结束 - 保存 AI 回复，然后启动干预判断+即时注入
                 ai_reply = current_response_text
+                current_response_text = ""  # 先清空，保存期间到达的新回复不会被误清
                 if ai_reply and conversation_id:
-                    save_message(conversation_id, "assistant", ai_reply)
+                    await save_message(conversation_id, "assistant", ai_reply)
+                    restart_pause_watch()
                     recent_messages.append({
                         "role": "assistant",
                         "content": ai_reply
@@ -269,8 +274,6 @@ async def realtime_dialog_enhanced(websocket: WebSocket):
                         )
                         print(f"[Enhanced] TTS结束，启动干预判断...")
 
-                current_response_text = ""
-
         except Exception as e:
             print(f"[Enhanced] 发送事件失败: {e}")
 
@@ -283,7 +286,8 @@ async def realtime_dialog_enhanced(websocket: WebSocket):
 
         # 保存用户消息
         if conversation_id:
-            save_message(conversation_id, "user", asr_text)
+            await save_message(conversation_id, "user", asr_text)
+            restart_pause_watch()
 
         recent_messages.append({
             "role": "user",
@@ -368,9 +372,13 @@ async def realtime_dialog_enhanced(websocket: WebSocket):
             pass
 
     finally:
-        # 取消干预判断任务
+        # 取消干预判断任务和停顿计时
         if intervention_task and not intervention_task.done():
             intervention_task.cancel()
+        if pause_task and not pause_task.done():
+            pause_task.cancel()
+        memoir_speculation.forget(conversation_id)
+        rolling_digest.forget(conversation_id)
 
         if receive_task:
             receive_task.cancel()
@@ -4,9 +4,8 @@ from pydantic import BaseModel
 from typing import List
 
 from app.database import get_db
-from app.models import User
 from app.services.topic_service import topic_service
-from app.auth import get_current_user
+from app.auth import AuthUser, get_auth_user
 
 router = APIRouter()
 
@@ -24,7 +23,7 @@ class TopicOptionsResponse(BaseModel):
 
 @router.get("/options", response_model=TopicOptionsResponse)
 def get_topic_options(
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_auth_user),
     db: Session = Depends(get_db),
 ):
     """获取用户的话题选项"""
@@ -46,7 +45,7 @@ def get_topic_options(
 @router.get("/{topic_id}")
 def get_topic(
     topic_id: str,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_auth_user),
     db: Session = Depends(get_db),
 ):
     """获取单个话题详情"""
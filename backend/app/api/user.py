@@ -1,14 +1,16 @@
 from datetime import datetime
+from urllib.parse import quote
 
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 
-from app.database import get_db
-from app.models import User, Conversation, Message, Memoir, WelcomeMessage, AuditLog
-from app.auth import get_current_user, verify_password, hash_password
+from app.database import get_db, SessionLocal
+from app.models import User, Conversation, Memoir, WelcomeMessage, AuditLog
+from app.auth import get_current_user, verify_password, hash_password, auth_cache, bump_auth_version
+from app.services.export_service import export_service
 
 router = APIRouter()
 
@@ -132,27 +134,19 @@ def get_era_memories(
     )
 
 
-@router.post("/me/era-memories/regenerate", response_model=EraMemoriesResponse)
+@router.post("/me/era-memories/regenerate", status_code=202)
 def regenerate_era_memories(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
-    """重新生成时代记忆"""
+    """重新生成时代记忆（提交任务，返回任务 ID；完成后 GET /me/era-memories 读取）"""
     from app.services.profile_service import profile_service
+    from app.api.job import accepted
 
     if not current_user.birth_year:
         raise HTTPException(status_code=400, detail="缺少出生年份信息")
 
-    era_memories = profile_service.regenerate_era_memories(db, current_user.id)
-    db.refresh(current_user)
-
-    return EraMemoriesResponse(
-        era_memories=era_memories,
-        era_memories_status=current_user.era_memories_status or 'completed',
-        birth_year=current_user.birth_year,
-        hometown=current_user.hometown,
-        main_city=current_user.main_city,
-    )
+    job_id = profile_service.regenerate_era_memories(current_user)
+    return accepted(job_id)
 
 
 @router.post("/me/complete-profile")
@@ -162,7 +156,9 @@ def complete_profile(
 ):
     """标记用户信息收集已完成"""
     current_user.profile_completed = True
+    bump_auth_version(current_user)
     db.commit()
+    auth_cache.invalidate(current_user.id)
     return {"message": "已完成"}
 
 
@@ -178,15 +174,30 @@ def get_welcome_messages(
     return [{"id": m.id, "content": m.content, "show_greeting": m.show_greeting} for m in messages]
 
 
+# 导出格式 -> (媒体类型, 文件扩展名)
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "zip": ("application/zip", "zip"),
+}
+
+
 @router.get("/me/export")
 def export_user_data(
+    format: str = "ndjson",
+    book: bool = False,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
-    """导出用户的所有数据（个人信息、对话记录、回忆录）"""
-    user_id = current_user.id
+    """
+    导出用户的所有数据（个人信息、对话记录、回忆录），边查边发，不在内存里攒整份数据
+
+    - format=ndjson：每行一条记录（profile / conversation / message / memoir）
+    - format=zip：data.ndjson + 每个对话一份 Markdown 访谈记录；book=true 时附带按年代排序的回忆录成书
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="导出格式只支持 ndjson 或 zip")
+    media_type, ext = EXPORT_FORMATS[format]
 
-    # 用户基本信息
+    user_id = current_user.id
     profile = {
         "nickname": current_user.nickname,
         "preferred_name": current_user.preferred_name,
@@ -197,57 +208,26 @@ def export_user_data(
         "created_at": current_user.created_at.isoformat() if current_user.created_at else None,
     }
 
-    # 对话记录（含消息）
-    conversations = db.query(Conversation).filter(
-        Conversation.user_id == user_id,
-        Conversation.deleted_at == None,
-    ).order_by(Conversation.created_at).all()
-
-    conversations_data = []
-    for conv in conversations:
-        messages = db.query(Message).filter(
-            Message.conversation_id == conv.id
-        ).order_by(Message.created_at).all()
-
-        conversations_data.append({
-            "title": conv.title,
-            "topic": conv.topic,
-            "summary": conv.summary,
-            "status": conv.status,
-            "created_at": conv.created_at.isoformat() if conv.created_at else None,
-            "messages": [
-                {
-                    "role": msg.role,
-                    "content": msg.content,
-                    "created_at": msg.created_at.isoformat() if msg.created_at else None,
-                }
-                for msg in messages
-            ],
-        })
-
-    # 回忆录
-    memoirs = db.query(Memoir).filter(
-        Memoir.user_id == user_id,
-        Memoir.deleted_at == None,
-    ).order_by(Memoir.order_index).all()
-
-    memoirs_data = [
-        {
-            "title": m.title,
-            "content": m.content,
-            "year_start": m.year_start,
-            "year_end": m.year_end,
-            "time_period": m.time_period,
-            "created_at": m.created_at.isoformat() if m.created_at else None,
-        }
-        for m in memoirs
-    ]
-
-    return JSONResponse(content={
-        "profile": profile,
-        "conversations": conversations_data,
-        "memoirs": memoirs_data,
-    })
+    def generate():
+        # 响应开始发送前依赖里的会话就关了，流式读取用自己的会话
+        db = SessionLocal()
+        try:
+            if format == "zip":
+                yield from export_service.iter_zip(db, user_id, profile, include_book=book)
+            else:
+                yield from export_service.iter_ndjson_bytes(db, user_id, profile)
+        finally:
+            db.close()
+
+    filename = f"我的回忆录数据.{ext}"
+    return StreamingResponse(
+        generate(),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename=export.{ext}; filename*=UTF-8''{quote(filename)}",
+            "Cache-Control": "no-store",
+        },
+    )
 
 
 @router.delete("/me")
@@ -282,6 +262,8 @@ def delete_user(
     )
     db.add(audit)
 
+    bump_auth_version(current_user)
     db.commit()
+    auth_cache.invalidate(user_id)
 
     return {"message": "账号已注销"}
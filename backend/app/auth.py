@@ -1,5 +1,13 @@
 """认证模块：密码哈希、JWT 生成/校验、FastAPI 依赖"""
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 
 import jwt
 from fastapi import Depends, HTTPException, Header
@@ -8,19 +16,240 @@ from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 from app.config import settings
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app.models import User
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
 
+# ========== 密码哈希（独立进程池） ==========
+# bcrypt 每次 200ms+ 的纯 CPU 计算，在请求线程里做会占住 GIL，一批老人集中登录时整个 worker 都卡。
+# 放到单独的进程池里算，请求线程只等结果；池子排队有上限，满了直接返回 503，不无限堆积。
+
+_crypt_contexts: Dict[int, CryptContext] = {}
+
+
+def _crypt_context(rounds: int) -> CryptContext:
+    """cost 固定为 rounds：cost 不同的旧哈希 needs_update，登录时重新哈希"""
+    ctx = _crypt_contexts.get(rounds)
+    if ctx is None:
+        ctx = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds,
+        )
+        _crypt_contexts[rounds] = ctx
+    return ctx
+
+
+def _warm_up_worker(rounds: int) -> None:
+    """启动时先把子进程拉起来并加载 bcrypt，第一批登录不用等进程启动"""
+    _crypt_context(rounds)
+
+
+# 以下三个函数在进程池里执行，返回值附带开始时间和耗时（用于统计排队 / 计算时间）
+
+def _hash_in_worker(plain: str, rounds: int) -> Tuple[str, float, float]:
+    started = time.time()
+    hashed = _crypt_context(rounds).hash(plain)
+    return hashed, started, time.time() - started
+
+
+def _hash_many_in_worker(plains: List[str], rounds: int) -> Tuple[List[str], float, float]:
+    started = time.time()
+    ctx = _crypt_context(rounds)
+    hashed = [ctx.hash(p) for p in plains]
+    return hashed, started, time.time() - started
+
+
+def _verify_in_worker(plain: str, hashed: str, rounds: int) -> Tuple[Tuple[bool, Optional[str]], float, float]:
+    started = time.time()
+    result = _crypt_context(rounds).verify_and_update(plain, hashed)
+    return result, started, time.time() - started
+
+
+# 批量哈希每个任务的条数（cost 12 时一块约 1 秒）
+BULK_CHUNK_SIZE = 4
+
+
+class PasswordHasherBusy(RuntimeError):
+    """哈希进程池排队已满或等待超时"""
+
+
+class PasswordHasher:
+    """
+    bcrypt 进程池
+
+    - password_hash_workers 个进程（0=在调用线程里直接算，开发环境用）
+    - 排队中 + 计算中的任务超过 password_hash_max_pending 时拒绝（PasswordHasherBusy）
+    - 批量哈希（管理员批量建号）切成小块并行，不占排队名额
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self.peak_pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self._waits: "deque[float]" = deque(maxlen=500)  # 排队耗时（ms）
+        self._runs: "deque[float]" = deque(maxlen=500)   # 计算耗时（ms）
+
+    def start(self) -> Optional[ProcessPoolExecutor]:
+        if settings.password_hash_workers <= 0:
+            return None
+        with self._lock:
+            if self._pool is None:
+                # spawn：不 fork 带着任务线程 / 连接池的主进程
+                self._pool = ProcessPoolExecutor(
+                    max_workers=settings.password_hash_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                for _ in range(settings.password_hash_workers):
+                    self._pool.submit(_warm_up_worker, settings.bcrypt_rounds)
+                print(f"[Password] 哈希进程池已启动: {settings.password_hash_workers} 个进程")
+            return self._pool
+
+    def stop(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, fn, *args, bounded: bool = True):
+        """在进程池里执行 fn，返回 fn 的结果（不含计时）"""
+        if settings.password_hash_workers <= 0:
+            result, _, elapsed = fn(*args)
+            self._record(0.0, elapsed, count=1)
+            return result
+
+        with self._lock:
+            if bounded and self._pending >= settings.password_hash_max_pending:
+                self.rejected += 1
+                raise PasswordHasherBusy(f"哈希排队已满（{self._pending}）")
+            self._pending += 1
+            self.peak_pending = max(self.peak_pending, self._pending)
+            self.submitted += 1
+        try:
+            for attempt in range(2):
+                pool = self.start()
+                submitted_at = time.time()
+                try:
+                    future = pool.submit(fn, *args)
+                    result, started, elapsed = future.result(timeout=settings.password_hash_timeout_seconds)
+                except BrokenProcessPool:
+                    # 子进程被杀（OOM 等）：换一个池子重试一次
+                    print("[Password] 哈希进程池异常，重建")
+                    self.stop()
+                    if attempt:
+                        raise
+                    continue
+                except FutureTimeout:
+                    future.cancel()
+                    raise PasswordHasherBusy("哈希等待超时")
+                self._record(max(0.0, started - submitted_at), elapsed)
+                return result
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _record(self, wait: float, elapsed: float, count: int = 1):
+        with self._lock:
+            self.completed += count
+            self._waits.append(wait * 1000)
+            self._runs.append(elapsed * 1000)
+
+    def hash(self, plain: str) -> str:
+        return self._run(_hash_in_worker, plain, settings.bcrypt_rounds)
+
+    def verify_and_update(self, plain: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """校验密码；cost 和当前配置不同时顺带返回新哈希（否则为 None）"""
+        ok, new_hash = self._run(_verify_in_worker, plain, hashed, settings.bcrypt_rounds)
+        if new_hash:
+            with self._lock:
+                self.rehashed += 1
+        return ok, new_hash
+
+    def hash_many(self, plains: List[str]) -> List[str]:
+        """
+        批量哈希，结果顺序和输入一致
+
+        切成 BULK_CHUNK_SIZE 个一块，同时最多 password_hash_workers 块在算：
+        能用满所有进程，同时插进来的登录请求最多等一小块，不会被整批挡住
+        """
+        if not plains:
+            return []
+        chunks = [plains[i:i + BULK_CHUNK_SIZE] for i in range(0, len(plains), BULK_CHUNK_SIZE)]
+
+        def run(chunk: List[str]) -> List[str]:
+            return self._run(_hash_many_in_worker, chunk, settings.bcrypt_rounds, bounded=False)
+
+        workers = max(1, settings.password_hash_workers)
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks)), thread_name_prefix="password-bulk") as pool:
+            return [h for chunk in pool.map(run, chunks) for h in chunk]
+
+    def stats(self) -> dict:
+        def pct(values, q):
+            if not values:
+                return None
+            ordered = sorted(values)
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 1)
+
+        with self._lock:
+            waits, runs = list(self._waits), list(self._runs)
+            return {
+                "workers": settings.password_hash_workers,
+                "bcrypt_rounds": settings.bcrypt_rounds,
+                "pending": self._pending,
+                "peak_pending": self.peak_pending,
+                "max_pending": settings.password_hash_max_pending,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed,
+                "wait_ms_p50": pct(waits, 0.5),
+                "wait_ms_p95": pct(waits, 0.95),
+                "run_ms_p50": pct(runs, 0.5),
+                "run_ms_p95": pct(runs, 0.95),
+            }
+
+
+password_hasher = PasswordHasher()
+
+
+def _busy() -> HTTPException:
+    return HTTPException(status_code=503, detail="当前登录人数较多，请稍后再试")
+
+
 def hash_password(plain: str) -> str:
-    return pwd_context.hash(plain)
+    try:
+        return password_hasher.hash(plain)
+    except PasswordHasherBusy:
+        raise _busy()
+
+
+def hash_passwords(plains: List[str]) -> List[str]:
+    """批量哈希（管理员批量建号用）"""
+    try:
+        return password_hasher.hash_many(plains)
+    except PasswordHasherBusy:
+        raise _busy()
 
 
 def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+    return verify_and_update_password(plain, hashed)[0]
+
+
+def verify_and_update_password(plain: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """校验密码，返回 (是否正确, 需要替换的新哈希或 None)"""
+    try:
+        return password_hasher.verify_and_update(plain, hashed)
+    except PasswordHasherBusy:
+        raise _busy()
 
 
 def create_token(user_id: str) -> str:
@@ -45,17 +274,151 @@ def decode_token(token: str) -> str:
         raise HTTPException(status_code=401, detail="无效的认证令牌")
 
 
+# ========== 已认证用户缓存 ==========
+
+
+@dataclass(frozen=True)
+class AuthUser:
+    """鉴权用到的用户字段快照（只需要 user id 的接口用它，不必每次查整行）"""
+    id: str
+    is_active: bool
+    is_admin: bool
+    profile_completed: bool
+    auth_version: int
+
+    @classmethod
+    def of(cls, user: User) -> "AuthUser":
+        return cls(
+            id=user.id,
+            is_active=bool(user.is_active) and user.deleted_at is None,
+            is_admin=bool(user.is_admin),
+            profile_completed=bool(user.profile_completed),
+            auth_version=user.auth_version or 0,
+        )
+
+
+class AuthUserCache:
+    """
+    每个 worker 进程内的已认证用户缓存
+
+    - auth_cache_ttl_seconds 内直接用缓存，不查库
+    - 过期后只查 users.auth_version 一列：没变就续期，变了（或用户已删除）再重新加载
+    - 改动鉴权相关字段（禁用 / 注销 / 资料完成……）的地方要 bump_auth_version，
+      本进程立即 invalidate，其他进程最多 TTL 秒后通过版本号发现
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()  # user_id -> (AuthUser, 校验时间)
+        self.hits = 0
+        self.revalidated = 0  # 过期后版本号没变，续期
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str) -> Optional[AuthUser]:
+        """返回用户快照，用户不存在返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry and now - entry[1] < settings.auth_cache_ttl_seconds:
+                self._cache.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+
+        db = SessionLocal()
+        try:
+            if entry:
+                version = db.query(User.auth_version).filter(User.id == user_id).scalar()
+                if version is not None and version == entry[0].auth_version:
+                    with self._lock:
+                        self.revalidated += 1
+                    self._put(entry[0], now)
+                    return entry[0]
+            user = db.query(User).filter(User.id == user_id).first()
+        finally:
+            db.close()
+
+        with self._lock:
+            self.misses += 1
+        if not user:
+            self.invalidate(user_id)
+            return None
+        auth_user = AuthUser.of(user)
+        self._put(auth_user, now)
+        return auth_user
+
+    def remember(self, user: User):
+        """已经查出整行的请求顺手刷新缓存"""
+        self._put(AuthUser.of(user), time.monotonic())
+
+    def _put(self, auth_user: AuthUser, checked_at: float):
+        if settings.auth_cache_max_entries <= 0:
+            return
+        with self._lock:
+            self._cache[auth_user.id] = (auth_user, checked_at)
+            self._cache.move_to_end(auth_user.id)
+            while len(self._cache) > settings.auth_cache_max_entries:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            if self._cache.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.revalidated + self.misses
+            return {
+                "entries": len(self._cache),
+                "max_entries": settings.auth_cache_max_entries,
+                "ttl_seconds": settings.auth_cache_ttl_seconds,
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                # 不用查整行的比例（续期只查一列版本号）
+                "hit_rate": round((self.hits + self.revalidated) / total, 3) if total else None,
+                "no_query_rate": round(self.hits / total, 3) if total else None,
+            }
+
+
+auth_cache = AuthUserCache()
+
+
+def bump_auth_version(user: User):
+    """鉴权相关字段改动后调用（在 commit 之前），其他 worker 据此让缓存失效"""
+    user.auth_version = (user.auth_version or 0) + 1
+
+
+def _check_active(user) -> None:
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="该账号已被禁用")
+
+
+def get_auth_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> AuthUser:
+    """FastAPI 依赖：当前用户的鉴权快照（走缓存，只需要 user id 的接口用这个）"""
+    user_id = decode_token(credentials.credentials)
+    user = auth_cache.get(user_id)
+    if not user:
+        raise HTTPException(status_code=401, detail="用户不存在")
+    _check_active(user)
+    return user
+
+
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db),
 ) -> User:
-    """FastAPI 依赖：从 Authorization header 解析当前用户"""
+    """FastAPI 依赖：从 Authorization header 解析当前用户（整行，需要读写用户资料的接口用）"""
     user_id = decode_token(credentials.credentials)
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
+        auth_cache.invalidate(user_id)
         raise HTTPException(status_code=401, detail="用户不存在")
-    if not user.is_active:
-        raise HTTPException(status_code=403, detail="该账号已被禁用")
+    auth_cache.remember(user)
+    _check_active(AuthUser.of(user))
     return user
 
 
@@ -1,10 +1,12 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, Dict
 
 
 class Settings(BaseSettings):
     # 数据库配置
     database_url: str = "sqlite:///./biography.db"
+    # 协程里用了同步数据库查询（会卡住事件循环）时：off 不检查 / warn 打日志 / raise 抛错（测试环境）
+    db_loop_block_check: str = "off"
 
     # 通义千问 API配置（备用）
     dashscope_api_key: str = ""
@@ -41,6 +43,88 @@ class Settings(BaseSettings):
     intervention_timeout_ms: int = 6000         # 干预判断超时（毫秒）- TTS结束后的沉默间隙执行
     intervention_model: str = "qwen-turbo"      # 干预判断用的模型（需要快，qwen3.5-plus太慢会超时）
 
+    # 回忆录 Agent
+    memoir_agent_mode: str = "staged"           # staged=分步流水线（分析/检查用快速模型），agent=模型自主工具循环
+    memoir_agent_single_pass_chars: int = 1500  # 访谈记录不超过此字数时单次生成
+    memoir_agent_max_revisions: int = 1         # staged 模式检查不通过后最多修改几次
+    memoir_map_reduce_chars: int = 12000        # 访谈记录超过此字数时分段整理再合并（0=关闭）
+    memoir_segment_target_chars: int = 5000     # 每段目标字数
+    memoir_segment_max_chars: int = 8000        # 每段字数上限
+    memoir_map_reduce_workers: int = 3          # 分段整理的并发数
+    memoir_agent_compaction: bool = True        # 压缩工具循环的上下文（旧草稿替换为占位）
+    memoir_agent_token_budget: int = 120000     # 单次生成的 token 上限（输入+输出），0=不限
+
+    # 对话进行中预先起草回忆录（实时对话每 N 条消息或停顿较久时整理新内容，结束时只收尾）
+    memoir_speculation_enabled: bool = False
+    memoir_speculation_every_messages: int = 12  # 每保存多少条消息触发一次
+    memoir_speculation_pause_seconds: int = 30   # 停顿超过此秒数也触发一次
+    memoir_speculation_min_chars: int = 1200     # 未整理的新内容少于此字数时不起草
+
+    # 对话滚动摘要（实时对话每 N 条消息用快速模型合并一次，对话结束的任务只需处理最后几轮）
+    rolling_digest_enabled: bool = True
+    rolling_digest_every_messages: int = 6
+
+    # 访谈记录缓存（对话结束时多个任务共用一次加载）
+    transcript_cache_max_entries: int = 500
+
+    # 后台任务队列
+    job_workers: int = 2                        # 每个进程的 worker 线程数（0=本进程不执行任务）
+    job_poll_seconds: float = 1.0               # 空闲时轮询间隔
+    job_max_attempts: int = 3                   # 默认最多执行次数
+    job_retry_base_seconds: int = 15            # 重试退避基数（指数增长）
+    job_retry_max_seconds: int = 600            # 重试退避上限
+    job_lock_timeout_seconds: int = 900         # 运行中任务心跳超时，超时视为 worker 已挂
+
+    # 密码哈希（bcrypt 在独立进程池里算，不占请求线程的 GIL）
+    bcrypt_rounds: int = 12                     # cost，改了之后旧哈希在用户下次登录时自动重算
+    password_hash_workers: int = 2              # 每个 worker 进程的哈希进程数（0=在请求线程里直接算）
+    password_hash_max_pending: int = 32         # 排队 + 计算中的上限，超出返回 503
+    password_hash_timeout_seconds: float = 10.0 # 单次等待上限
+
+    # 已认证用户缓存（每个 worker 进程内；过期后只查 users.auth_version 校验）
+    auth_cache_ttl_seconds: int = 30            # 这段时间内不查库，其他 worker 的禁用 / 注销最多滞后这么久
+    auth_cache_max_entries: int = 10000         # 0=不缓存
+
+    # 数据看板（活动汇总表由定时任务增量维护，接口结果短时间缓存）
+    analytics_rollup_interval_seconds: int = 300  # 汇总任务间隔，看板数据最多滞后这么久
+    analytics_rollup_lookback_days: int = 1       # 每次重算最近几天（兜住跨天 / 迟到的写入）
+    monitoring_cache_ttl_seconds: int = 60        # 看板接口结果缓存时间
+
+    # LLM 响应缓存（确定性调用：时间段推断、标题、摘要、信息提取等）
+    llm_cache_enabled: bool = True
+    llm_cache_ttl_hours: int = 24 * 7           # 缓存有效期
+    llm_cache_max_entries: int = 5000           # 超过后按最近命中时间淘汰
+
+    # LLM 调用台账（token / 延迟统计，批量写入）
+    llm_ledger_enabled: bool = True
+    llm_ledger_flush_seconds: float = 5.0       # 最长攒多久写一次库
+    llm_ledger_batch_size: int = 100            # 攒够多少条立即写库
+    llm_user_daily_token_budget: int = 0        # 每用户每日 token 预算，超出后降级非必要功能（0=不限）
+
+    # LLM 调度（优先级：realtime > interactive > background）
+    llm_max_concurrency: int = 16               # 进程内同时进行的 LLM 调用上限
+    llm_realtime_reserved: int = 2              # 为实时判断预留的名额
+    llm_background_max_concurrency: int = 6     # 后台任务并发上限
+    llm_background_concurrency_under_realtime: int = 2  # 实时负载期间后台任务并发上限
+    llm_model_rpm: Dict[str, int] = {}          # 按模型限速（每分钟请求数），如 {"qwen3.5-plus": 120}
+    llm_request_timeout_seconds: float = 90.0   # 单次请求超时，避免后台任务一直挂着
+
+    # LLM 熔断（按模型，滚动窗口）
+    llm_breaker_enabled: bool = True
+    llm_breaker_window_seconds: int = 60        # 统计窗口
+    llm_breaker_max_samples: int = 200          # 窗口内最多保留的样本数
+    llm_breaker_min_samples: int = 5            # 样本少于此数不判断
+    llm_breaker_error_rate: float = 0.5         # 错误率达到即熔断
+    llm_breaker_latency_ms: int = 5000          # 短调用 P90 延迟达到即熔断
+    llm_breaker_cooldown_seconds: int = 30      # 熔断后多久放行探测请求
+
+    # LLM 对冲请求（仅短 prompt）
+    llm_hedge_enabled: bool = False
+    llm_hedge_percentile: float = 0.9           # 主请求超过近期该分位延迟仍未返回时补发
+    llm_hedge_default_delay_ms: int = 3000      # 样本不足时的等待时长
+    llm_hedge_max_prompt_chars: int = 4000      # prompt 超过此长度不对冲
+    llm_hedge_max_tokens: int = 500             # 输出上限超过此值不对冲
+
     class Config:
         env_file = ".env"
 
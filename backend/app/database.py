@@ -1,7 +1,14 @@
-from sqlalchemy import create_engine
+import asyncio
+import logging
+import traceback
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 if "sqlite" in settings.database_url:
     engine = create_engine(
         settings.database_url,
@@ -28,3 +35,66 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# ========== 异步引擎（WebSocket / async 接口用，不阻塞事件循环） ==========
+
+
+def async_database_url(url: str) -> str:
+    """同一个库的异步驱动地址：PostgreSQL 用 asyncpg，SQLite 用 aiosqlite"""
+    scheme, rest = url.split("://", 1)
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    if scheme.startswith("postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+
+if "sqlite" in settings.database_url:
+    async_engine = create_async_engine(async_database_url(settings.database_url))
+else:
+    async_engine = create_async_engine(
+        async_database_url(settings.database_url),
+        pool_size=5,
+        max_overflow=10,
+        pool_timeout=30,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+    )
+
+# 已有的同步服务逻辑（只接受 Session 的）在异步会话上用 await db.run_sync(fn, ...) 调用，
+# SQL 走异步驱动，不用为了 async 再写一份
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# ========== 事件循环阻塞检测 ==========
+# 同步引擎的查询如果发生在事件循环线程上（协程里直接用了 SessionLocal），整个进程的 WebSocket 都会卡住。
+# db_loop_block_check=warn 打日志，=raise 直接抛错（测试环境用，让这类调用一出现就失败）
+
+
+class LoopBlockingQuery(RuntimeError):
+    """同步数据库查询跑在了事件循环线程上"""
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _check_loop_blocking(conn, cursor, statement, parameters, context, executemany):
+    mode = settings.db_loop_block_check
+    if mode == "off" or not _in_event_loop():
+        return
+    message = f"同步数据库查询阻塞了事件循环: {statement[:120]}"
+    if mode == "raise":
+        raise LoopBlockingQuery(message)
+    logger.warning("[DB] %s\n%s", message, "".join(traceback.format_stack(limit=8)))
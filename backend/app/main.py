@@ -27,12 +27,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 列表接口的下一页游标
+    expose_headers=["X-Next-Cursor"],
 )
 
 # 注册路由
 app.include_router(router, prefix="/api")
 
 
+@app.on_event("startup")
+def start_job_workers():
+    from app.services.job_queue import job_queue
+    from app.auth import password_hasher
+    job_queue.start()
+    password_hasher.start()
+
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    from app.services.job_queue import job_queue
+    from app.auth import password_hasher
+    job_queue.stop()
+    password_hasher.stop()
+
+
 @app.get("/")
 def root():
     return {"message": "回忆录 API 服务正在运行", "version": "0.1.0"}
@@ -44,10 +62,15 @@ def health_check():
         db = SessionLocal()
         db.execute(text("SELECT 1"))
         db.close()
-        return {"status": "healthy"}
     except Exception:
         raise HTTPException(status_code=503, detail="database unavailable")
 
+    # LLM 熔断状态：熔断不影响存活判断，只标记为降级
+    from app.services.llm_breaker import llm_breaker
+    llm = llm_breaker.snapshot()
+    degraded = any(m["state"] != "closed" for m in llm.values())
+    return {"status": "degraded" if degraded else "healthy", "llm": llm}
+
 
 if __name__ == "__main__":
     import uvicorn
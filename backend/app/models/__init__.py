@@ -2,5 +2,10 @@ from app.models.user import User, TopicCandidate, EraMemoryPreset, WelcomeMessag
 from app.models.conversation import Conversation, Message
 from app.models.memoir import Memoir
 from app.models.audit_log import AuditLog
+from app.models.llm_cache import LLMCacheEntry
+from app.models.llm_usage import LLMUsage
+from app.models.job import Job
+from app.models.user_activity import UserDailyActivity
+from app.models.memoir_progress import MemoirProgressState
 
-__all__ = ["User", "TopicCandidate", "EraMemoryPreset", "WelcomeMessage", "PresetTopic", "Conversation", "Message", "Memoir", "AuditLog"]
+__all__ = ["User", "TopicCandidate", "EraMemoryPreset", "WelcomeMessage", "PresetTopic", "Conversation", "Message", "Memoir", "AuditLog", "LLMCacheEntry", "LLMUsage", "Job", "UserDailyActivity", "MemoirProgressState"]
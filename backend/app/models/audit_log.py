@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text
+from sqlalchemy import Column, String, DateTime, Text, Index
 from datetime import datetime
 import uuid
 
@@ -15,3 +15,8 @@ class AuditLog(Base):
     target_label = Column(String(100), nullable=True)   # 操作对象标签（手机号/昵称，方便展示）
     detail = Column(Text, nullable=True)                # 操作详情
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # 操作日志列表（按时间倒序游标翻页）
+        Index("ix_audit_logs_created_id", "created_at", "id"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text, ForeignKey, JSON
+from sqlalchemy import Column, String, DateTime, Text, Integer, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -16,12 +16,29 @@ class Conversation(Base):
     topics = Column(JSON, nullable=True)  # 涉及的所有主题标签
     summary = Column(Text, nullable=True)
     status = Column(String(20), default="active")  # active, completed
+    # 对话进行中预先起草的回忆录段落，见 memoir_speculation
+    speculation = Column(JSON, nullable=True)
+    # 对话进行中维护的滚动摘要，见 rolling_digest
+    digest = Column(JSON, nullable=True)
+    # 消息统计（每保存一条消息更新，见 chat_service.add_message），列表页不必加载消息
+    first_message_at = Column(DateTime, nullable=True)
+    last_message_at = Column(DateTime, nullable=True)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    user_chars = Column(Integer, nullable=False, default=0, server_default="0")        # 用户说的总字数
+    assistant_chars = Column(Integer, nullable=False, default=0, server_default="0")   # 记录师说的总字数
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     deleted_at = Column(DateTime, nullable=True)
 
     messages = relationship("Message", back_populates="conversation", order_by="Message.created_at")
 
+    __table_args__ = (
+        # 用户的对话列表（按创建时间倒序）、管理后台、删除用户
+        Index("ix_conversations_user_created", "user_id", "created_at"),
+        # 活动汇总：找出最近有消息的对话
+        Index("ix_conversations_last_message_at", "last_message_at"),
+    )
+
 
 class Message(Base):
     __tablename__ = "messages"
@@ -33,3 +50,8 @@ class Message(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     conversation = relationship("Conversation", back_populates="messages")
+
+    __table_args__ = (
+        # 按时间顺序读取对话消息（访谈记录、滚动摘要、版本核对）
+        Index("ix_messages_conversation_created", "conversation_id", "created_at"),
+    )
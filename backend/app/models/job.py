@@ -0,0 +1,39 @@
+from sqlalchemy import Column, String, DateTime, Integer, Text, JSON, Index, text
+from datetime import datetime
+import uuid
+
+from app.database import Base
+
+
+class Job(Base):
+    """后台任务队列（多个 worker 进程通过数据库领取任务）"""
+    __tablename__ = "jobs"
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = Column(String(50), nullable=False)               # 任务类型: conversation_end, memoir_complete, topic_review, era_memories 等
+    payload = Column(JSON, nullable=True)                   # 任务参数
+    status = Column(String(20), nullable=False, default="queued")  # queued / running / succeeded / failed
+    priority = Column(Integer, nullable=False, default=5)   # 越小越优先
+    dedup_key = Column(String(100), nullable=True)          # 同一 key 排队中只保留一个，且同一时间只运行一个
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)  # 重试退避：此时间之后才能领取
+    locked_by = Column(String(64), nullable=True)           # 领取该任务的 worker
+    locked_at = Column(DateTime, nullable=True)             # 领取 / 心跳时间，超时视为 worker 已挂
+    last_error = Column(Text, nullable=True)
+    result = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # 领取任务：按状态 + 优先级 + 可运行时间
+        Index("ix_jobs_claim", "status", "priority", "run_after"),
+        # 排队中的任务按 dedup_key 去重
+        Index(
+            "uq_jobs_dedup_queued", "dedup_key", unique=True,
+            postgresql_where=text("status = 'queued' AND dedup_key IS NOT NULL"),
+            sqlite_where=text("status = 'queued' AND dedup_key IS NOT NULL"),
+        ),
+        Index("ix_jobs_dedup_key", "dedup_key"),
+    )
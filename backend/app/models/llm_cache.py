@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, DateTime, Text, Integer
+from datetime import datetime
+
+from app.database import Base
+
+
+class LLMCacheEntry(Base):
+    """确定性 LLM 调用的响应缓存（按内容哈希）"""
+    __tablename__ = "llm_cache"
+
+    key = Column(String(64), primary_key=True)  # sha256(model, 模板名, 模板版本, prompt, 参数)
+    feature = Column(String(50), nullable=False)  # 调用点，如 time_period、title
+    model = Column(String(50), nullable=False)
+    response = Column(Text, nullable=False)
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_hit_at = Column(DateTime, default=datetime.utcnow)  # 淘汰时按此排序
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, String, DateTime, Integer
+from datetime import datetime
+
+from app.database import Base
+
+
+class LLMUsage(Base):
+    """LLM 调用台账（每次调用一行，用于按天/功能/用户统计成本）"""
+    __tablename__ = "llm_usage"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    feature = Column(String(50), nullable=False)  # 功能标签，如 memoir_agent、topic_review、intervention_stagnation
+    model = Column(String(50), nullable=False)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    latency_ms = Column(Integer, default=0)
+    user_id = Column(String(36), nullable=True, index=True)  # 不加外键：用户删除后台账仍保留
+    conversation_id = Column(String(36), nullable=True)
+    outcome = Column(String(20), nullable=False)  # ok / error / cache_hit / budget_exceeded
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
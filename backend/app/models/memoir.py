@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text, Integer, ForeignKey, JSON
+from sqlalchemy import Column, String, DateTime, Text, Integer, ForeignKey, JSON, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -27,3 +27,18 @@ class Memoir(Base):
 
     # 关联对话，用于获取对话时间
     conversation = relationship("Conversation", foreign_keys=[conversation_id])
+
+    __table_args__ = (
+        # 用户的回忆录列表（按 order_index）、回忆录数量
+        Index("ix_memoirs_user_order", "user_id", "order_index"),
+        # 已完成的回忆录：话题池判断 / 审查（部分索引，只含未删除的已完成回忆录）
+        Index(
+            "ix_memoirs_user_completed", "user_id", "created_at",
+            postgresql_where=text("status = 'completed' AND deleted_at IS NULL"),
+            sqlite_where=text("status = 'completed' AND deleted_at IS NULL"),
+        ),
+        # 对话是否已有回忆录
+        Index("ix_memoirs_conversation", "conversation_id"),
+        # 活动汇总：找出最近生成的回忆录
+        Index("ix_memoirs_created_at", "created_at"),
+    )
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, String, DateTime, Text, Integer, ForeignKey
+from datetime import datetime
+
+from app.database import Base
+
+
+class MemoirProgressState(Base):
+    """
+    正在生成的回忆录的进度快照（见 memoir_progress）
+
+    生成任务所在进程写入（草稿增量节流写），其他 worker 进程的 SSE 订阅方按 version 轮询，
+    生成正常结束后删除；出错时保留（带错误信息），重试时接着用
+    """
+    __tablename__ = "memoir_progress"
+
+    memoir_id = Column(String(36), ForeignKey("memoirs.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)      # 每次写入 +1，订阅方只取比已读更新的
+    stage = Column(String(20), nullable=False, default="")
+    detail = Column(String(200), nullable=False, default="")
+    draft = Column(Text, nullable=False, default="")          # 当前这一版草稿全文
+    draft_round = Column(Integer, nullable=False, default=0)  # 第几版草稿（开始新一版时 +1）
+    error = Column(Text, nullable=True)                       # 最近一次出错信息
+    error_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
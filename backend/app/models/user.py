@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, JSON, Integer, Boolean, Text, ForeignKey
+from sqlalchemy import Column, String, DateTime, JSON, Integer, Boolean, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -21,6 +21,8 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     deleted_at = Column(DateTime, nullable=True)
+    # 鉴权相关字段（禁用 / 注销 / 资料完成……）每改一次加一，各 worker 据此让已认证用户缓存失效
+    auth_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     # 用户基础信息（通过对话收集）
     birth_year = Column(Integer, nullable=True)  # 出生年份
@@ -34,13 +36,18 @@ class User(Base):
     # 话题候选池
     topic_candidates = relationship("TopicCandidate", back_populates="user", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # 管理后台用户列表（按创建时间倒序游标翻页）
+        Index("ix_users_created_id", "created_at", "id"),
+    )
+
 
 class TopicCandidate(Base):
     """预生成的话题候选（用户开始新对话时选择）"""
     __tablename__ = "topic_candidates"
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     topic = Column(String(200), nullable=False)  # 话题描述（给用户看的选项）
     greeting = Column(Text, nullable=False)  # 对应的开场白
     chat_context = Column(Text, nullable=True)  # 对话时注入的背景上下文
@@ -63,6 +70,11 @@ class EraMemoryPreset(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # 按年份区间查询 / 排序
+        Index("ix_era_memories_preset_years", "start_year", "end_year"),
+    )
+
 
 class WelcomeMessage(Base):
     """首页激励语"""
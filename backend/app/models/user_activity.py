@@ -0,0 +1,21 @@
+from sqlalchemy import Column, String, Date, DateTime, Integer, ForeignKey, Index
+from datetime import datetime
+
+from app.database import Base
+
+
+class UserDailyActivity(Base):
+    """每用户每天的活动汇总（后台任务增量维护，见 analytics_rollup），数据看板只查这张表"""
+    __tablename__ = "user_daily_activity"
+
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)                    # UTC 日期，与各表 created_at 一致
+    conversations = Column(Integer, nullable=False, default=0)  # 当天新开的对话数
+    messages = Column(Integer, nullable=False, default=0)       # 当天的消息数
+    memoirs = Column(Integer, nullable=False, default=0)        # 当天新生成的回忆录数
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # 按天统计活跃用户 / 新增
+        Index("ix_user_daily_activity_day", "day"),
+    )
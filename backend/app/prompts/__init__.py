@@ -15,7 +15,10 @@ from app.prompts import intervention_stagnation      # 对话停滞判断
 
 # 内容生成
 from app.prompts import memoir            # 生成回忆录
+from app.prompts import memoir_merge      # 合并长访谈的分段回忆录
 from app.prompts import summary           # 生成摘要
+from app.prompts import conversation_digest  # 对话结束合并调用：摘要 + 标签 + 标题 + 时间段
+from app.prompts import rolling_digest    # 对话进行中的滚动摘要（摘要 + 标签 + 时间段 + 用户信息）
 from app.prompts import era_memories      # 生成时代记忆
 from app.prompts import title             # 生成标题
 from app.prompts import time_period       # 推断时间段
@@ -0,0 +1,37 @@
+# 对话摘要（合并调用）
+# 对话结束后一次性生成：摘要、主题标签、回忆录标题、时间段
+
+VERSION = 1  # 模板版本，修改 PROMPT 后递增
+
+PROMPT = """请分析以下访谈对话，一次完成下面四项任务。
+
+{birth_info}
+
+## 对话内容
+{conversation}
+
+## 任务
+1. summary：一段简短的摘要（50-100字），概括用户讲述了什么内容
+2. topics：1-5 个主题标签（如：童年、求学、工作、婚姻、家庭、爱好、困难时期、人生转折等）
+3. title：回忆录标题（5-15个字），简洁有意境，突出回忆的核心内容或情感，不要用"回忆"、"故事"等泛泛的词
+4. 时间段：推断这段回忆发生的大概时间
+   - 提到"幼儿园"大概 3-6 岁，"小学" 6-12 岁，"初中" 12-15 岁，"高中" 15-18 岁，"大学" 18-22 岁
+   - 提到具体年份或年龄直接使用；出生年份已知时据此计算具体年份
+
+## 输出格式（JSON）
+{{
+    "summary": "摘要内容...",
+    "topics": ["主题1", "主题2"],
+    "title": "标题",
+    "year_start": 开始年份（4位数字，无法推断则为 null）,
+    "year_end": 结束年份（4位数字，某一年则与 year_start 相同，无法推断则为 null）,
+    "time_period": "时期描述（如：童年、小学时期、大学时期、工作初期等）"
+}}
+
+只输出 JSON，不要其他内容。"""
+
+
+def build(conversation: str, birth_year: int = None) -> str:
+    """构建对话摘要合并调用的 prompt"""
+    birth_info = f"用户出生于 {birth_year} 年。" if birth_year else "用户出生年份未知。"
+    return PROMPT.format(birth_info=birth_info, conversation=conversation)
@@ -0,0 +1,31 @@
+# 合并分段回忆录
+# 长访谈分段整理后，把各段草稿排序、衔接成一篇完整的回忆录
+
+PROMPT = """下面是同一位讲述者一次长访谈的分段整理稿，按访谈先后排列。请把它们合并成一篇完整的回忆录。
+
+## 要做的
+- 按时间顺序或逻辑顺序重新排列各部分（访谈先后不一定是人生先后）
+- 同一主题分散在不同段落的内容放到一起，重复的只保留说得更完整的那次
+- 段落之间自然过渡
+
+## 不要做的
+- 不要添加分段稿里没有的内容
+- 不要删减讲述者的原话，不要把口语改成书面语
+- 不要加小标题或"第一部分"之类的分段标记
+- 不要用"美好"、"珍贵"、"难忘"等空话
+
+## 叙述人称
+使用{perspective}叙述。
+
+## 分段整理稿
+{sections}
+
+## 合并后的回忆录"""
+
+
+def build(sections: list, perspective: str = "第一人称") -> str:
+    """构建合并分段回忆录的 prompt"""
+    text = "\n\n".join(
+        f"【第 {i} 段】\n{section}" for i, section in enumerate(sections, 1)
+    )
+    return PROMPT.format(sections=text, perspective=perspective)
@@ -1,6 +1,8 @@
 # 信息收集完成度检查
 # 用 Qwen 快速验证：信息是否收齐，或记录师是否已在结束对话
 
+VERSION = 1  # 模板版本，修改 PROMPT 后递增
+
 PROMPT = """请判断以下对话是否应该结束信息收集环节。
 
 ## 需要收集的 4 项信息
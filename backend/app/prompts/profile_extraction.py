@@ -1,6 +1,8 @@
 # 提取用户信息
 # 从对话中提取用户的基本信息（不包括姓名，姓名由管理员填写）
 
+VERSION = 1  # 模板版本，修改 PROMPT 后递增
+
 PROMPT = """请从以下对话中提取用户的基本信息。
 
 ## 用户已知姓名
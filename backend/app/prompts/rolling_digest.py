@@ -0,0 +1,64 @@
+# 对话滚动摘要
+# 对话进行中每隔几轮，把新增的对话合并进已有的摘要（摘要、标签、标题、时间段、用户信息），
+# 对话结束后的任务直接读这份摘要，不必再把整段对话发给模型
+
+VERSION = 1  # 模板版本，修改 PROMPT 后递增
+
+PROMPT = """你在为一段正在进行的访谈维护一份滚动摘要。下面是目前为止的摘要和新增的对话，请输出更新后的完整摘要。
+
+{birth_info}
+管理员填写的用户姓名：{nickname}
+
+## 目前为止的摘要（JSON，首次为空）
+{previous}
+
+## 新增的对话
+{conversation}
+
+## 需要更新的内容
+1. summary：整段访谈到目前为止的摘要（50-150字），概括用户讲述了什么内容；把新内容融合进去，不要只写新增部分
+2. topics：1-5 个主题标签（如：童年、求学、工作、婚姻、家庭、爱好、困难时期、人生转折等）
+3. title：回忆录标题（5-15个字），简洁有意境，不要用"回忆"、"故事"等泛泛的词
+4. 时间段：这段访谈讲述的回忆大概发生在什么时候
+   - "幼儿园"大概 3-6 岁，"小学" 6-12 岁，"初中" 12-15 岁，"高中" 15-18 岁，"大学" 18-22 岁
+   - 出生年份已知时据此计算具体年份
+5. 用户信息（只根据用户自己说的话）：
+   - preferred_name：用户希望被怎么称呼（如老张、张爷爷）；如果用户只是在说自己的姓名（与"{nickname}"读音相同或接近，可能有同音字），不算称呼
+   - birth_year：出生年份（4位数字）；用户说了年龄时按当前年份（{current_year}年）计算
+   - hometown：家乡或出生地
+   - main_city：生活时间最长的城市
+   - has_enough_info：是否已经知道用户的称呼
+   - profile_complete：称呼、出生年份、家乡、生活时间最长的城市是否都已提及（用户表示不想说也算），
+     或者记录师最后一条消息明显是在结束对话
+   新增对话没有提到的项，保留之前摘要里的值
+
+## 输出格式（JSON）
+{{
+    "summary": "摘要内容...",
+    "topics": ["主题1", "主题2"],
+    "title": "标题",
+    "year_start": 开始年份（无法推断则为 null）,
+    "year_end": 结束年份（无法推断则为 null）,
+    "time_period": "时期描述（如：童年、小学时期、工作初期等）",
+    "preferred_name": "称呼或 null",
+    "birth_year": 出生年份或 null,
+    "hometown": "家乡或 null",
+    "main_city": "城市或 null",
+    "has_enough_info": true或false,
+    "profile_complete": true或false
+}}
+
+只输出 JSON，不要其他内容。"""
+
+
+def build(previous: str, conversation: str, birth_year: int = None, nickname: str = "") -> str:
+    """构建滚动摘要的 prompt（previous 为上一版摘要的 JSON 文本，首次为空字符串）"""
+    import datetime
+    birth_info = f"用户出生于 {birth_year} 年。" if birth_year else "用户出生年份未知。"
+    return PROMPT.format(
+        birth_info=birth_info,
+        nickname=nickname or "未知",
+        previous=previous or "（空）",
+        conversation=conversation,
+        current_year=datetime.datetime.now().year,
+    )
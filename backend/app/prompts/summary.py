@@ -1,6 +1,8 @@
 # 生成对话摘要
 # 将对话内容总结成简短摘要
 
+VERSION = 1  # 模板版本，修改 PROMPT 后递增
+
 PROMPT = """请根据以下对话内容，生成一个简短的摘要（50-100字），概括这次对话的主要内容：
 
 {conversation}
@@ -1,6 +1,8 @@
 # 推断时间段
 # 从对话内容推断回忆发生的大概时间段
 
+VERSION = 1  # 模板版本，修改 PROMPT 后递增
+
 PROMPT = """请根据以下对话内容，推断这段回忆发生的大概时间段。
 
 {birth_info}
@@ -1,6 +1,8 @@
 # 生成回忆录标题
 # 根据对话内容生成简练的标题
 
+VERSION = 1  # 模板版本，修改 PROMPT 后递增
+
 PROMPT = """请根据以下对话内容，生成一个简练的标题（5-15个字），概括这段回忆的主题。
 
 要求：
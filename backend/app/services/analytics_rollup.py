@@ -0,0 +1,144 @@
+"""
+数据看板的活动汇总
+- user_daily_activity：每用户每天新开的对话数 / 消息数 / 新生成的回忆录数
+- 定时任务增量维护：每次只重算最近几天（表为空时全量回填），只碰最近有消息的对话
+  （last_message_at 索引）和最近生成的回忆录（created_at 索引），耗时和总数据量无关
+- 看板接口的结果短时间缓存，见 cached()
+
+口径：
+- 对话按创建日计，只算有消息的对话
+- 回忆录按生成日计，重新生成会算作新的一篇
+"""
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Conversation, Memoir, Message, UserDailyActivity
+from app.services.job_queue import job_queue
+
+
+def to_date(value) -> Optional[date]:
+    """func.date() 的结果：PostgreSQL 返回 date，SQLite 返回 'YYYY-MM-DD' 字符串"""
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+class AnalyticsRollup:
+    """活动汇总 + 看板结果缓存"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Tuple[float, Any]] = {}
+
+    # ---------- 汇总 ----------
+
+    def refresh(self, db: Session, since: Optional[date] = None) -> Dict[str, Any]:
+        """
+        重算 since（含）之后每天的汇总
+
+        since 为空时从表里最新一天往前 analytics_rollup_lookback_days 天开始；表为空则全量回填
+        """
+        if since is None:
+            latest = to_date(db.query(func.max(UserDailyActivity.day)).scalar())
+            if latest:
+                since = latest - timedelta(days=settings.analytics_rollup_lookback_days)
+        start = datetime.combine(since, datetime.min.time()) if since else None
+
+        started = time.monotonic()
+        counts: Dict[Tuple[str, date], List[int]] = {}
+
+        def add(rows, index: int):
+            for user_id, day, n in rows:
+                counts.setdefault((user_id, to_date(day)), [0, 0, 0])[index] += n
+
+        # 对话（按创建日）
+        conv_day = func.date(Conversation.created_at)
+        query = db.query(Conversation.user_id, conv_day, func.count(Conversation.id))
+        if start:
+            query = query.filter(Conversation.last_message_at >= start, Conversation.created_at >= start)
+        else:
+            query = query.filter(Conversation.last_message_at.isnot(None))
+        add(query.group_by(Conversation.user_id, conv_day).all(), 0)
+
+        # 消息（只扫最近有消息的对话，走 (conversation_id, created_at) 索引）
+        msg_day = func.date(Message.created_at)
+        query = db.query(Conversation.user_id, msg_day, func.count(Message.id)).join(
+            Conversation, Conversation.id == Message.conversation_id
+        )
+        if start:
+            query = query.filter(Conversation.last_message_at >= start, Message.created_at >= start)
+        add(query.group_by(Conversation.user_id, msg_day).all(), 1)
+
+        # 回忆录（按生成日）
+        memoir_day = func.date(Memoir.created_at)
+        query = db.query(Memoir.user_id, memoir_day, func.count(Memoir.id))
+        if start:
+            query = query.filter(Memoir.created_at >= start)
+        add(query.group_by(Memoir.user_id, memoir_day).all(), 2)
+
+        # 整段替换（同一事务，看板不会读到一半）
+        delete = db.query(UserDailyActivity)
+        if since:
+            delete = delete.filter(UserDailyActivity.day >= since)
+        delete.delete(synchronize_session=False)
+        now = datetime.utcnow()
+        rows = [
+            {
+                "user_id": user_id, "day": day,
+                "conversations": c, "messages": m, "memoirs": r,
+                "updated_at": now,
+            }
+            for (user_id, day), (c, m, r) in counts.items()
+        ]
+        if rows:
+            db.execute(insert(UserDailyActivity), rows)
+        db.commit()
+
+        elapsed = int((time.monotonic() - started) * 1000)
+        print(f"[Analytics] 活动汇总: since={since or '全量'} {len(rows)} 行 {elapsed}ms")
+        return {"since": since.isoformat() if since else None, "rows": len(rows), "elapsed_ms": elapsed}
+
+    # ---------- 看板结果缓存 ----------
+
+    def cached(self, key: str, build: Callable[[], Any]) -> Any:
+        """看板结果缓存 monitoring_cache_ttl_seconds 秒（0=不缓存）"""
+        ttl = settings.monitoring_cache_ttl_seconds
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit and hit[0] > now:
+                return hit[1]
+
+        value = build()
+        if ttl > 0:
+            with self._lock:
+                self._cache[key] = (now + ttl, value)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+
+
+analytics_rollup = AnalyticsRollup()
+
+
+@job_queue.handler("analytics_rollup")
+def _run_analytics_rollup(payload: dict):
+    db = SessionLocal()
+    try:
+        result = analytics_rollup.refresh(db)
+    finally:
+        db.close()
+    analytics_rollup.invalidate()
+    return result
+
+
+job_queue.schedule("analytics_rollup", interval_seconds=settings.analytics_rollup_interval_seconds)
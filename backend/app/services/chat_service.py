@@ -1,7 +1,10 @@
+from datetime import datetime
+from sqlalchemy import and_, func, or_, update
 from sqlalchemy.orm import Session
 from typing import List, Optional, Generator
 from app.models import Conversation, Message
 from app.services.llm_service import llm_service
+from app.services.transcript_service import transcript_service
 
 
 class ChatService:
@@ -15,6 +18,27 @@ class ChatService:
         # 实时语音模式下，开场白由 WebSocket 处理，这里不保存第一条消息
         return conversation, ""
 
+    def add_message(self, db: Session, conversation_id: str, role: str, content: str) -> Message:
+        """保存一条消息，同时更新对话的消息统计（同一事务）"""
+        now = datetime.utcnow()
+        message = Message(conversation_id=conversation_id, role=role, content=content, created_at=now)
+        db.add(message)
+        chars = len(content)
+        db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(
+                first_message_at=func.coalesce(Conversation.first_message_at, now),
+                last_message_at=now,
+                message_count=Conversation.message_count + 1,
+                user_chars=Conversation.user_chars + (chars if role == "user" else 0),
+                assistant_chars=Conversation.assistant_chars + (0 if role == "user" else chars),
+            )
+        )
+        db.commit()
+        transcript_service.invalidate(conversation_id)
+        return message
+
     def chat(self, db: Session, conversation_id: str, user_message: str) -> str:
         """处理用户消息（已弃用，仅保留兼容性）"""
         raise NotImplementedError("文本聊天模式已弃用，请使用实时语音对话")
@@ -32,16 +56,7 @@ class ChatService:
         if not conversation:
             return None
 
-        # 获取所有消息
-        messages = db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(Message.created_at).all()
-
-        # 构建对话文本
-        conversation_text = "\n".join([
-            f"{'老人' if msg.role == 'user' else 'AI'}: {msg.content}"
-            for msg in messages
-        ])
+        conversation_text = transcript_service.text(db, conversation_id)
 
         # 生成摘要
         summary = llm_service.generate_summary(conversation_text)
@@ -76,12 +91,35 @@ class ChatService:
             Conversation.id == conversation_id
         ).first()
 
-    def get_user_conversations(self, db: Session, user_id: str) -> List[Conversation]:
-        """获取用户的所有对话"""
-        return db.query(Conversation).filter(
+    def get_user_conversations(
+        self,
+        db: Session,
+        user_id: str,
+        after: Optional[tuple] = None,
+        limit: Optional[int] = None,
+    ) -> list:
+        """
+        用户的对话列表（只查列表展示用的列，不加载 ORM 对象）
+
+        按 (created_at, id) 倒序；分页时 after 传上一页最后一条的 (created_at, id)
+        """
+        query = db.query(
+            Conversation.id, Conversation.title, Conversation.summary,
+            Conversation.status, Conversation.created_at,
+        ).filter(
             Conversation.user_id == user_id,
             Conversation.deleted_at == None,
-        ).order_by(Conversation.created_at.desc()).all()
+        )
+        if after:
+            created_at, conversation_id = after
+            query = query.filter(or_(
+                Conversation.created_at < created_at,
+                and_(Conversation.created_at == created_at, Conversation.id < conversation_id),
+            ))
+        query = query.order_by(Conversation.created_at.desc(), Conversation.id.desc())
+        if limit:
+            query = query.limit(limit)
+        return query.all()
 
 
 chat_service = ChatService()
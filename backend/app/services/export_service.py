@@ -0,0 +1,236 @@
+"""
+用户数据导出（流式）
+- NDJSON：每行一条记录（profile / conversation / message / memoir），边查边写
+- zip：data.ndjson + 每个对话一份 Markdown 访谈记录 + 可选的回忆录成书（Markdown，按年代排序）
+- 消息用一次联表查询按对话顺序读出，yield_per 分块（PostgreSQL 上是服务端游标），
+  内存占用和用户的历史数据量无关
+"""
+import json
+import re
+import zipfile
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+from sqlalchemy import case
+from sqlalchemy.orm import Session
+
+from app.models import Conversation, Memoir, Message
+
+# 每次从游标取多少行
+EXPORT_CHUNK_ROWS = 500
+# 输出攒到多大发一次（避免逐行发送的开销）
+EXPORT_SEND_BYTES = 64 * 1024
+
+# zip 里的文件名
+NDJSON_NAME = "data.ndjson"
+BOOK_NAME = "回忆录.md"
+
+ROLE_LABELS = {"user": "我", "assistant": "记录师"}
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _line(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def _safe_filename(title: Optional[str], fallback: str) -> str:
+    """对话标题做文件名：去掉路径分隔符等非法字符，截断"""
+    name = re.sub(r'[\\/:*?"<>|\s]+', "_", (title or "").strip()).strip("_")
+    return name[:40] or fallback
+
+
+class _ZipSink:
+    """
+    zipfile 的输出目标：只追加、不能 seek（zipfile 会改用 data descriptor），
+    写进来的字节由生成器通过 drain() 取走发给客户端
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._pending = 0
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._pending += len(data)
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self, force: bool = False) -> Iterator[bytes]:
+        """攒够 EXPORT_SEND_BYTES（或 force）时取走已写出的字节"""
+        if self._pending and (force or self._pending >= EXPORT_SEND_BYTES):
+            data = b"".join(self._chunks)
+            self._chunks.clear()
+            self._pending = 0
+            yield data
+
+
+class ExportService:
+    """用户数据导出"""
+
+    # ---------- 数据读取（全部按块流式读取） ----------
+
+    def _iter_conversation_rows(self, db: Session, user_id: str):
+        """对话 + 消息一次联表查询，按对话、消息时间排序（没有消息的对话 message 列为空）"""
+        return db.query(
+            Conversation.id, Conversation.title, Conversation.topic, Conversation.summary,
+            Conversation.status, Conversation.created_at,
+            Message.role, Message.content, Message.created_at.label("message_created_at"),
+        ).outerjoin(
+            Message, Message.conversation_id == Conversation.id
+        ).filter(
+            Conversation.user_id == user_id,
+            Conversation.deleted_at == None,
+        ).order_by(
+            Conversation.created_at, Conversation.id, Message.created_at, Message.id,
+        ).yield_per(EXPORT_CHUNK_ROWS)
+
+    def _iter_memoirs(self, db: Session, user_id: str, by_year: bool = False):
+        """回忆录（含正文）；by_year 时按 year_start 排序，没有年份的排最后"""
+        query = db.query(
+            Memoir.id, Memoir.title, Memoir.content, Memoir.year_start, Memoir.year_end,
+            Memoir.time_period, Memoir.order_index, Memoir.created_at,
+        ).filter(
+            Memoir.user_id == user_id,
+            Memoir.deleted_at == None,
+        )
+        if by_year:
+            query = query.order_by(
+                case((Memoir.year_start == None, 1), else_=0), Memoir.year_start, Memoir.order_index, Memoir.id,
+            )
+        else:
+            query = query.order_by(Memoir.order_index, Memoir.id)
+        return query.yield_per(EXPORT_CHUNK_ROWS)
+
+    # ---------- NDJSON ----------
+
+    def iter_ndjson(self, db: Session, user_id: str, profile: Dict[str, Any]) -> Iterator[str]:
+        """
+        NDJSON 导出，每行一条记录：
+        {"type": "profile", ...} / {"type": "conversation", ...} / {"type": "message", ...} / {"type": "memoir", ...}
+        消息紧跟在所属对话之后
+        """
+        yield _line({"type": "profile", **profile})
+
+        current = None
+        for row in self._iter_conversation_rows(db, user_id):
+            if row.id != current:
+                current = row.id
+                yield _line({
+                    "type": "conversation",
+                    "id": row.id,
+                    "title": row.title,
+                    "topic": row.topic,
+                    "summary": row.summary,
+                    "status": row.status,
+                    "created_at": _iso(row.created_at),
+                })
+            if row.role is not None:
+                yield _line({
+                    "type": "message",
+                    "conversation_id": row.id,
+                    "role": row.role,
+                    "content": row.content,
+                    "created_at": _iso(row.message_created_at),
+                })
+
+        for m in self._iter_memoirs(db, user_id):
+            yield _line({
+                "type": "memoir",
+                "id": m.id,
+                "title": m.title,
+                "content": m.content,
+                "year_start": m.year_start,
+                "year_end": m.year_end,
+                "time_period": m.time_period,
+                "order_index": m.order_index,
+                "created_at": _iso(m.created_at),
+            })
+
+    def iter_ndjson_bytes(self, db: Session, user_id: str, profile: Dict[str, Any]) -> Iterator[bytes]:
+        """iter_ndjson 编码后按 EXPORT_SEND_BYTES 合并成块"""
+        buffer, size = [], 0
+        for line in self.iter_ndjson(db, user_id, profile):
+            data = line.encode("utf-8")
+            buffer.append(data)
+            size += len(data)
+            if size >= EXPORT_SEND_BYTES:
+                yield b"".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield b"".join(buffer)
+
+    # ---------- Markdown ----------
+
+    def iter_transcripts(self, db: Session, user_id: str) -> Iterator[tuple]:
+        """逐个对话生成 Markdown 访谈记录：产出 (文件名 或 None, 文本片段)，文件名不为空表示开始一个新文件"""
+        current, index = None, 0
+        for row in self._iter_conversation_rows(db, user_id):
+            if row.id != current:
+                current, index = row.id, index + 1
+                day = row.created_at.strftime("%Y%m%d") if row.created_at else "未知日期"
+                name = f"对话记录/{index:03d}-{day}-{_safe_filename(row.title, row.id[:8])}.md"
+                header = f"# {row.title or '未命名对话'}\n\n"
+                if row.created_at:
+                    header += f"时间：{row.created_at.strftime('%Y-%m-%d %H:%M')}\n\n"
+                if row.summary:
+                    header += f"> {row.summary}\n\n"
+                yield name, header
+            if row.role is not None:
+                yield None, f"**{ROLE_LABELS.get(row.role, row.role)}**：{row.content}\n\n"
+
+    def iter_book(self, db: Session, user_id: str, author: Optional[str]) -> Iterator[str]:
+        """回忆录成书：按 year_start 排序，每篇一章"""
+        yield f"# {author + '的' if author else ''}回忆录\n\n"
+        for m in self._iter_memoirs(db, user_id, by_year=True):
+            yield f"## {m.title or '未命名'}\n\n"
+            if m.time_period:
+                yield f"*{m.time_period}*\n\n"
+            yield (m.content or "").strip() + "\n\n"
+
+    # ---------- zip ----------
+
+    def iter_zip(
+        self, db: Session, user_id: str, profile: Dict[str, Any], include_book: bool = False,
+    ) -> Iterator[bytes]:
+        """zip 导出（边写边发）：data.ndjson + 对话记录/*.md + 可选 回忆录.md"""
+        sink = _ZipSink()
+        with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+            with zf.open(NDJSON_NAME, mode="w", force_zip64=True) as f:
+                for line in self.iter_ndjson(db, user_id, profile):
+                    f.write(line.encode("utf-8"))
+                    yield from sink.drain()
+
+            entry = None
+            try:
+                for name, text in self.iter_transcripts(db, user_id):
+                    if name:
+                        if entry:
+                            entry.close()
+                        entry = zf.open(name, mode="w", force_zip64=True)
+                    entry.write(text.encode("utf-8"))
+                    yield from sink.drain()
+            finally:
+                if entry:
+                    entry.close()
+
+            if include_book:
+                author = profile.get("preferred_name") or profile.get("nickname")
+                with zf.open(BOOK_NAME, mode="w", force_zip64=True) as f:
+                    for text in self.iter_book(db, user_id, author):
+                        f.write(text.encode("utf-8"))
+                        yield from sink.drain()
+        # 中央目录在 close 时写出
+        yield from sink.drain(force=True)
+
+
+export_service = ExportService()
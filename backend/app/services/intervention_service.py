@@ -3,12 +3,14 @@
 并行执行多个判断，取最高优先级的一条结果
 返回干预类型、注入机制、干预内容
 """
-import json
 import asyncio
 from typing import List, Dict, Optional, Tuple
 from openai import AsyncOpenAI
+from pydantic import BaseModel
 
 from app.config import settings
+from app.services import structured_output
+from app.services import llm_gateway
 from app.prompts import (
     intervention_topic_drift,
     intervention_important_clue,
@@ -17,6 +19,10 @@ from app.prompts import (
 )
 
 
+class JudgeResult(BaseModel):
+    guidance: Optional[str] = None
+
+
 # 干预类型
 TYPE_TOPIC_DRIFT = "topic_drift"
 TYPE_STAGNATION = "stagnation"
@@ -191,10 +197,12 @@ class InterventionService:
 
         return "\n".join(lines)
 
-    async def _call_llm(self, prompt: str) -> Optional[str]:
+    async def _call_llm(self, prompt: str, judge_type: str) -> Optional[str]:
         """调用 LLM 进行判断"""
         try:
-            response = await self.client.chat.completions.create(
+            response = await llm_gateway.achat_completion(
+                self.client,
+                feature=f"intervention_{judge_type}",
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3,
@@ -203,19 +211,11 @@ class InterventionService:
 
             content = response.choices[0].message.content.strip()
 
-            # 解析 JSON
-            if content.startswith("```"):
-                content = content.split("```")[1]
-                if content.startswith("json"):
-                    content = content[4:]
-                content = content.strip()
-
-            result = json.loads(content)
-            guidance = result.get("guidance")
+            guidance = structured_output.parse(content, JudgeResult).guidance
 
             return guidance if guidance else None
 
-        except json.JSONDecodeError as e:
+        except structured_output.StructuredOutputError as e:
             print(f"[Intervention] JSON 解析失败: {e}")
             return None
         except Exception as e:
@@ -225,19 +225,19 @@ class InterventionService:
     async def _judge_topic_drift(self, topic: str, recent_messages: str) -> Optional[str]:
         """判断话题偏离"""
         prompt = intervention_topic_drift.build(topic, recent_messages)
-        return await self._call_llm(prompt)
+        return await self._call_llm(prompt, TYPE_TOPIC_DRIFT)
 
     async def _judge_important_clue(self, topic: str, recent_messages: str) -> Optional[str]:
         """判断重要线索"""
         prompt = intervention_important_clue.build(topic, recent_messages)
-        return await self._call_llm(prompt)
+        return await self._call_llm(prompt, TYPE_IMPORTANT_CLUE)
 
     async def _judge_era_trigger(self, user_message: str, era_memories: str) -> Optional[str]:
         """判断时代触发"""
         if not era_memories or not user_message:
             return None
         prompt = intervention_era_trigger.build(user_message, era_memories)
-        return await self._call_llm(prompt)
+        return await self._call_llm(prompt, TYPE_ERA_TRIGGER)
 
     async def _judge_stagnation(self, topic: str, recent_messages: str) -> Optional[str]:
         """判断对话停滞"""
@@ -245,7 +245,7 @@ class InterventionService:
         if recent_messages.count("\n") < 6:  # 至少 3 轮对话
             return None
         prompt = intervention_stagnation.build(recent_messages)
-        return await self._call_llm(prompt)
+        return await self._call_llm(prompt, TYPE_STAGNATION)
 
 
 # 单例
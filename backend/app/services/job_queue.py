@@ -0,0 +1,505 @@
+"""
+后台任务队列（数据库持久化）
+- 任务写入 jobs 表，worker 重启 / 被 kill 不会丢
+- PostgreSQL 用 SELECT ... FOR UPDATE SKIP LOCKED 领取；SQLite 退化为条件更新（status='queued' 才能改成 running）
+- 每个进程一个 worker 池（job_workers 个线程），多进程之间靠数据库协调
+- 失败按指数退避重试，超过 max_attempts 标记 failed
+- dedup_key：排队中同 key 只保留一个；同 key 同一时间只运行一个
+  coalesce_running=True 时同 key 已在运行也直接返回那个任务（用户重复提交同一操作）
+- worker 心跳：运行中的任务定期刷新 locked_at，超时未刷新的视为 worker 已挂，重新排队
+- 定时任务：schedule() 注册后由维护线程按间隔入队，是否到期看 jobs 表里上一次的记录，多进程不会重复
+
+用法：
+    @job_queue.handler("topic_review")
+    def _run_topic_review(payload): ...
+
+    job_queue.enqueue("topic_review", {"user_id": uid}, dedup_key=f"topic_review:{uid}")
+
+    job_queue.schedule("analytics_rollup", interval_seconds=300)
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+
+from app.config import settings
+from app.database import SessionLocal, AsyncSessionLocal
+from app.models import Job
+
+logger = logging.getLogger(__name__)
+
+# 优先级（越小越优先）
+PRIORITY_HIGH = 0      # 用户正在等结果
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10      # 可以慢慢做的
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# 心跳间隔（秒）
+HEARTBEAT_SECONDS = 30
+
+
+class JobQueue:
+    """数据库任务队列 + 进程内 worker 池"""
+
+    def __init__(self):
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._running_lock = threading.Lock()
+        self._running: Dict[str, str] = {}  # job_id -> kind（本进程正在运行的）
+        self._schedules: Dict[str, Dict[str, Any]] = {}  # kind -> {interval, payload}
+        self._worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    # ---------- 注册 / 入队 ----------
+
+    def handler(self, kind: str):
+        """注册任务处理函数（装饰器）。函数抛异常即视为失败，会按策略重试"""
+        def decorator(fn):
+            self._handlers[kind] = fn
+            return fn
+        return decorator
+
+    def schedule(self, kind: str, interval_seconds: int, payload: Optional[Dict[str, Any]] = None):
+        """注册定时任务：每隔 interval_seconds 入队一次（低优先级，失败不重试，等下一轮）"""
+        self._schedules[kind] = {"interval": interval_seconds, "payload": payload or {}}
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: Optional[Dict[str, Any]] = None,
+        priority: int = PRIORITY_NORMAL,
+        dedup_key: Optional[str] = None,
+        max_attempts: Optional[int] = None,
+        coalesce_running: bool = False,
+    ) -> str:
+        """
+        新增任务
+
+        Args:
+            coalesce_running: dedup_key 已有运行中的任务时也合并进去（默认排一个新的，等它跑完再运行）
+
+        Returns:
+            任务 ID；dedup_key 已有排队中（或运行中）的任务时返回那个任务的 ID
+        """
+        db = SessionLocal()
+        try:
+            job_id = self._insert(db, kind, payload, priority, dedup_key, max_attempts, coalesce_running)
+        finally:
+            db.close()
+
+        self._wakeup.set()
+        return job_id
+
+    async def aenqueue(
+        self,
+        kind: str,
+        payload: Optional[Dict[str, Any]] = None,
+        priority: int = PRIORITY_NORMAL,
+        dedup_key: Optional[str] = None,
+        max_attempts: Optional[int] = None,
+        coalesce_running: bool = False,
+    ) -> str:
+        """enqueue 的异步版本（WebSocket 等协程里用，走异步数据库驱动）"""
+        async with AsyncSessionLocal() as db:
+            job_id = await db.run_sync(
+                self._insert, kind, payload, priority, dedup_key, max_attempts, coalesce_running
+            )
+        self._wakeup.set()
+        return job_id
+
+    def _insert(
+        self,
+        db,
+        kind: str,
+        payload: Optional[Dict[str, Any]],
+        priority: int,
+        dedup_key: Optional[str],
+        max_attempts: Optional[int],
+        coalesce_running: bool,
+    ) -> str:
+        if dedup_key:
+            existing = self._find_active(db, dedup_key) if coalesce_running else self._find_queued(db, dedup_key)
+            if existing:
+                print(f"[JobQueue] 任务已在排队 / 运行，合并: {kind} {dedup_key}")
+                return existing
+
+        job = Job(
+            kind=kind,
+            payload=payload or {},
+            status=QUEUED,
+            priority=priority,
+            dedup_key=dedup_key,
+            max_attempts=max_attempts or settings.job_max_attempts,
+            run_after=datetime.utcnow(),
+        )
+        db.add(job)
+        try:
+            db.commit()
+        except IntegrityError:
+            # 并发入队撞上唯一索引：别人刚插入了同 key 的任务
+            db.rollback()
+            existing = self._find_queued(db, dedup_key)
+            if existing:
+                return existing
+            raise
+        print(f"[JobQueue] 入队: {kind} {job.id} priority={priority}")
+        return job.id
+
+    @staticmethod
+    def _find_queued(db, dedup_key: str) -> Optional[str]:
+        row = db.query(Job.id).filter(
+            Job.dedup_key == dedup_key,
+            Job.status == QUEUED,
+        ).first()
+        return row[0] if row else None
+
+    @staticmethod
+    def _find_active(db, dedup_key: str) -> Optional[str]:
+        row = db.query(Job.id).filter(
+            Job.dedup_key == dedup_key,
+            Job.status.in_((QUEUED, RUNNING)),
+        ).order_by(Job.status.desc()).first()  # running 优先
+        return row[0] if row else None
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """任务状态和结果（供前端轮询 / SSE）"""
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            if not job:
+                return None
+            return {
+                "id": job.id,
+                "kind": job.kind,
+                "status": job.status,
+                "owner": (job.payload or {}).get("user_id"),
+                "attempts": job.attempts,
+                "max_attempts": job.max_attempts,
+                "result": job.result,
+                "error": job.last_error,
+                "created_at": job.created_at.isoformat() if job.created_at else None,
+                "started_at": job.started_at.isoformat() if job.started_at else None,
+                "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+            }
+        finally:
+            db.close()
+
+    # ---------- worker 池 ----------
+
+    def start(self, workers: Optional[int] = None):
+        """启动本进程的 worker 线程（应用启动时调用）"""
+        workers = settings.job_workers if workers is None else workers
+        if workers <= 0 or self._threads:
+            return
+        self._stop.clear()
+        for i in range(workers):
+            t = threading.Thread(
+                target=self._worker_loop, args=(f"{self._worker_prefix}:{i}",),
+                name=f"job-worker-{i}", daemon=True,
+            )
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._maintenance_loop, name="job-maintenance", daemon=True)
+        t.start()
+        self._threads.append(t)
+        print(f"[JobQueue] 启动 {workers} 个 worker")
+
+    def stop(self, timeout: float = 5.0):
+        """停止 worker（正在运行的任务会跑完当前这个）"""
+        self._stop.set()
+        self._wakeup.set()
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads = []
+
+    def _worker_loop(self, worker_id: str):
+        while not self._stop.is_set():
+            try:
+                job = self._claim(worker_id)
+            except Exception as e:
+                logger.warning(f"[JobQueue] 领取任务失败: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(timeout=settings.job_poll_seconds)
+                self._wakeup.clear()
+                continue
+
+            self._execute(job)
+
+    def _claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """领取一个可运行的任务，返回 {id, kind, payload, attempts, max_attempts}"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            # 同 dedup_key 已有任务在运行的，先不领
+            running_keys = db.query(Job.dedup_key).filter(
+                Job.status == RUNNING,
+                Job.dedup_key.isnot(None),
+            )
+            query = db.query(Job).filter(
+                Job.status == QUEUED,
+                Job.run_after <= now,
+                (Job.dedup_key.is_(None)) | (Job.dedup_key.notin_(running_keys)),
+            ).order_by(Job.priority, Job.run_after)
+
+            if db.bind.dialect.name == "postgresql":
+                candidates = query.with_for_update(skip_locked=True).limit(1).all()
+            else:
+                candidates = query.limit(5).all()
+
+            for job in candidates:
+                claimed = {
+                    "id": job.id,
+                    "kind": job.kind,
+                    "payload": job.payload or {},
+                    "attempts": (job.attempts or 0) + 1,
+                    "max_attempts": job.max_attempts,
+                }
+                # 条件更新：只有仍是 queued 才能领到（SQLite 多进程时防止重复领取）
+                result = db.execute(
+                    update(Job)
+                    .where(Job.id == job.id, Job.status == QUEUED)
+                    .values(
+                        status=RUNNING,
+                        locked_by=worker_id,
+                        locked_at=now,
+                        started_at=now,
+                        attempts=Job.attempts + 1,
+                    )
+                )
+                if result.rowcount == 1:
+                    db.commit()
+                    return claimed
+            db.rollback()
+            return None
+        finally:
+            db.close()
+
+    def _execute(self, job: Dict[str, Any]):
+        job_id, kind = job["id"], job["kind"]
+        fn = self._handlers.get(kind)
+        with self._running_lock:
+            self._running[job_id] = kind
+
+        start = time.monotonic()
+        try:
+            if fn is None:
+                raise RuntimeError(f"未注册的任务类型: {kind}")
+            print(f"[JobQueue] 开始: {kind} {job_id} (第 {job['attempts']} 次)")
+            result = fn(job["payload"])
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            self._fail(job, e)
+        else:
+            self._finish(job_id, SUCCEEDED, result=result if isinstance(result, (dict, list)) else None)
+            print(f"[JobQueue] 完成: {kind} {job_id} {int((time.monotonic() - start) * 1000)}ms")
+        finally:
+            with self._running_lock:
+                self._running.pop(job_id, None)
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None):
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(Job).where(Job.id == job_id).values(
+                    status=status,
+                    result=result,
+                    last_error=error,
+                    finished_at=datetime.utcnow(),
+                    locked_by=None,
+                    locked_at=None,
+                )
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _fail(self, job: Dict[str, Any], error: Exception):
+        message = f"{type(error).__name__}: {error}"[:2000]
+        if job["attempts"] >= job["max_attempts"]:
+            print(f"[JobQueue] 失败（不再重试）: {job['kind']} {job['id']} {message}")
+            self._finish(job["id"], FAILED, error=message)
+            return
+
+        delay = min(
+            settings.job_retry_base_seconds * (2 ** (job["attempts"] - 1)),
+            settings.job_retry_max_seconds,
+        )
+        print(f"[JobQueue] 失败，{delay}s 后重试: {job['kind']} {job['id']} {message}")
+        self._requeue(job["id"], datetime.utcnow() + timedelta(seconds=delay), message)
+
+    def _requeue(self, job_id: str, run_after: datetime, error: Optional[str]) -> bool:
+        """放回队列；同 dedup_key 已有排队中的任务时，这个任务由那个取代"""
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(Job).where(Job.id == job_id).values(
+                    status=QUEUED,
+                    run_after=run_after,
+                    last_error=error,
+                    locked_by=None,
+                    locked_at=None,
+                )
+            )
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            db.execute(
+                update(Job).where(Job.id == job_id).values(
+                    status=FAILED,
+                    last_error=f"{error or ''}（已有同类任务排队，不再重试）",
+                    finished_at=datetime.utcnow(),
+                    locked_by=None,
+                    locked_at=None,
+                )
+            )
+            db.commit()
+            return False
+        finally:
+            db.close()
+
+    # ---------- 心跳 / 回收 ----------
+
+    def _maintenance_loop(self):
+        while not self._stop.wait(timeout=HEARTBEAT_SECONDS):
+            try:
+                self._heartbeat()
+                self._reclaim_stale()
+                self._enqueue_scheduled()
+            except Exception as e:
+                logger.warning(f"[JobQueue] 心跳 / 回收失败: {e}")
+
+    def _heartbeat(self):
+        with self._running_lock:
+            job_ids = list(self._running)
+        if not job_ids:
+            return
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(Job)
+                .where(Job.id.in_(job_ids), Job.status == RUNNING)
+                .values(locked_at=datetime.utcnow())
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _reclaim_stale(self):
+        """心跳超时的 running 任务（worker 被 kill / 重启）重新排队或标记失败"""
+        deadline = datetime.utcnow() - timedelta(seconds=settings.job_lock_timeout_seconds)
+        db = SessionLocal()
+        try:
+            stale = db.query(Job.id, Job.kind, Job.attempts, Job.max_attempts).filter(
+                Job.status == RUNNING,
+                Job.locked_at < deadline,
+            ).all()
+        finally:
+            db.close()
+
+        for job_id, kind, attempts, max_attempts in stale:
+            print(f"[JobQueue] 回收超时任务: {kind} {job_id}")
+            if attempts >= max_attempts:
+                self._finish(job_id, FAILED, error="worker 超时未响应")
+            else:
+                self._requeue(job_id, datetime.utcnow(), "worker 超时未响应")
+
+    def _enqueue_scheduled(self):
+        """到期的定时任务入队：上一次还在排队 / 运行，或入队时间不到间隔的跳过"""
+        if not self._schedules:
+            return
+        now = datetime.utcnow()
+        due = []
+        db = SessionLocal()
+        try:
+            for kind, spec in self._schedules.items():
+                last = db.query(Job.status, Job.created_at).filter(
+                    Job.dedup_key == f"schedule:{kind}"
+                ).order_by(Job.created_at.desc()).first()
+                if last and (
+                    last.status in (QUEUED, RUNNING)
+                    or last.created_at > now - timedelta(seconds=spec["interval"])
+                ):
+                    continue
+                due.append((kind, spec))
+        finally:
+            db.close()
+
+        for kind, spec in due:
+            self.enqueue(
+                kind, spec["payload"], priority=PRIORITY_LOW,
+                dedup_key=f"schedule:{kind}", max_attempts=1,
+            )
+
+    # ---------- 管理 ----------
+
+    def retry(self, job_id: str) -> bool:
+        """手动重试一个失败的任务"""
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(Job.id == job_id, Job.status == FAILED).first()
+            if not job:
+                return False
+            job.max_attempts = max(job.max_attempts, (job.attempts or 0) + 1)
+            db.commit()
+        finally:
+            db.close()
+        ok = self._requeue(job_id, datetime.utcnow(), None)
+        self._wakeup.set()
+        return ok
+
+    def stats(self, failures: int = 20) -> Dict[str, Any]:
+        """队列深度（按类型 / 状态）、最早排队时间、最近失败"""
+        db = SessionLocal()
+        try:
+            counts = db.query(Job.kind, Job.status, func.count(Job.id)).group_by(Job.kind, Job.status).all()
+            oldest = db.query(func.min(Job.created_at)).filter(Job.status == QUEUED).scalar()
+            recent_failures = db.query(Job).filter(
+                Job.status == FAILED
+            ).order_by(Job.finished_at.desc()).limit(failures).all()
+        finally:
+            db.close()
+
+        by_kind: Dict[str, Dict[str, int]] = {}
+        totals: Dict[str, int] = {}
+        for kind, status, n in counts:
+            by_kind.setdefault(kind, {})[status] = n
+            totals[status] = totals.get(status, 0) + n
+
+        with self._running_lock:
+            local_running = len(self._running)
+
+        return {
+            "totals": totals,
+            "by_kind": by_kind,
+            "oldest_queued_seconds": int((datetime.utcnow() - oldest).total_seconds()) if oldest else None,
+            "workers_this_process": len([t for t in self._threads if t.name.startswith("job-worker")]),
+            "running_this_process": local_running,
+            "recent_failures": [
+                {
+                    "id": j.id,
+                    "kind": j.kind,
+                    "attempts": j.attempts,
+                    "last_error": j.last_error,
+                    "finished_at": j.finished_at.isoformat() if j.finished_at else None,
+                }
+                for j in recent_failures
+            ],
+        }
+
+
+job_queue = JobQueue()
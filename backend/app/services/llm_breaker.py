@@ -0,0 +1,168 @@
+"""
+LLM 熔断器（按模型）
+- 滚动窗口统计最近调用的延迟和错误率
+- 服务商变慢或出错时打开熔断，暂停非必要功能（干预判断、话题池审查等）
+- 冷却后进入半开状态，放行一个带编号的探测请求，只由它的结果决定恢复还是重新熔断
+- 提供延迟分位数，供对冲请求确定等待时长
+"""
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from app.config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class _ModelBreaker:
+    def __init__(self, model: str):
+        self.model = model
+        self.state = CLOSED
+        # (时间, 延迟ms, 是否成功)；长输出调用的总耗时不能反映服务商快慢，延迟记为 None
+        self.samples: deque = deque(maxlen=settings.llm_breaker_max_samples)
+        self.opened_at = 0.0
+        # 半开状态下放行的探测请求：只有它的结果能决定恢复还是重新熔断
+        self.probe: Optional[int] = None
+        self.probe_started = 0.0
+        self.open_count = 0
+
+    def _trim(self, now: float):
+        window = settings.llm_breaker_window_seconds
+        while self.samples and now - self.samples[0][0] > window:
+            self.samples.popleft()
+
+    def error_rate(self) -> Optional[float]:
+        if not self.samples:
+            return None
+        return sum(1 for _, _, ok in self.samples if not ok) / len(self.samples)
+
+    def latency_percentile(self, q: float) -> Optional[int]:
+        latencies = sorted(ms for _, ms, ok in self.samples if ok and ms is not None)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+
+    def degraded(self) -> bool:
+        if len(self.samples) < settings.llm_breaker_min_samples:
+            return False
+        if self.error_rate() >= settings.llm_breaker_error_rate:
+            return True
+        p90 = self.latency_percentile(0.9)
+        return p90 is not None and p90 >= settings.llm_breaker_latency_ms
+
+
+class LLMBreaker:
+    """各模型的熔断状态"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[str, _ModelBreaker] = {}
+        self._probe_ids = itertools.count(1)
+
+    def _get(self, model: str) -> _ModelBreaker:
+        b = self._models.get(model)
+        if b is None:
+            b = self._models[model] = _ModelBreaker(model)
+        return b
+
+    def acquire(self, model: str) -> Tuple[bool, Optional[int]]:
+        """
+        非必要功能调用前检查，返回 (是否放行, 探测编号)
+
+        熔断打开时拒绝；冷却结束后进入半开，只放行一个探测请求，返回它的编号，
+        调用结束后 record(..., probe=编号) 才会决定恢复还是重新熔断。
+        探测请求迟迟没有结果（比如流式响应没被读取）时，超过请求超时后放行新的探测
+        """
+        if not settings.llm_breaker_enabled:
+            return True, None
+        now = time.monotonic()
+        with self._lock:
+            b = self._get(model)
+            if b.state == CLOSED:
+                return True, None
+            if b.state == OPEN:
+                if now - b.opened_at < settings.llm_breaker_cooldown_seconds:
+                    return False, None
+                b.state = HALF_OPEN
+                b.probe = None
+            if b.probe is not None and now - b.probe_started < settings.llm_request_timeout_seconds:
+                return False, None
+            b.probe = next(self._probe_ids)
+            b.probe_started = now
+            return True, b.probe
+
+    def record(self, model: str, latency_ms: Optional[int], ok: bool, probe: Optional[int] = None):
+        """
+        记录一次调用结果（所有功能都记，必要功能也参与判断服务商是否降级）
+
+        半开状态只由探测请求（probe 与 acquire 返回的编号一致）的结果决定恢复或重新熔断，
+        其他调用（必要功能、熔断前就发出的慢请求）只记样本
+        """
+        if not settings.llm_breaker_enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            b = self._get(model)
+            b.samples.append((now, latency_ms, ok))
+            b._trim(now)
+
+            if b.state == HALF_OPEN:
+                if probe is None or probe != b.probe:
+                    return
+                b.probe = None
+                slow = latency_ms is not None and latency_ms >= settings.llm_breaker_latency_ms
+                if ok and not slow:
+                    b.state = CLOSED
+                    b.samples.clear()
+                    print(f"[LLMBreaker] {model} 探测成功，恢复正常")
+                else:
+                    self._open(b, now, "探测失败")
+                return
+
+            if b.state == CLOSED and b.degraded():
+                p90 = b.latency_percentile(0.9)
+                self._open(b, now, f"错误率 {b.error_rate():.0%}，P90 {p90 if p90 is not None else '-'}ms")
+
+    def _open(self, b: _ModelBreaker, now: float, reason: str):
+        b.state = OPEN
+        b.opened_at = now
+        b.open_count += 1
+        print(f"[LLMBreaker] {b.model} 熔断打开（{reason}），暂停非必要功能 {settings.llm_breaker_cooldown_seconds}s")
+
+    def latency_percentile(self, model: str, q: float) -> Optional[int]:
+        """最近窗口内成功调用的延迟分位数（ms），样本不足时返回 None"""
+        with self._lock:
+            b = self._models.get(model)
+            if not b or len(b.samples) < settings.llm_breaker_min_samples:
+                return None
+            b._trim(time.monotonic())
+            return b.latency_percentile(q)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """各模型熔断状态（供 /health 和管理后台）"""
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for model, b in self._models.items():
+                b._trim(now)
+                if b.state == OPEN and now - b.opened_at >= settings.llm_breaker_cooldown_seconds:
+                    state = HALF_OPEN
+                else:
+                    state = b.state
+                error_rate = b.error_rate()
+                result[model] = {
+                    "state": state,
+                    "samples": len(b.samples),
+                    "error_rate": round(error_rate, 3) if error_rate is not None else None,
+                    "latency_ms_p50": b.latency_percentile(0.5),
+                    "latency_ms_p90": b.latency_percentile(0.9),
+                    "open_count": b.open_count,
+                }
+            return result
+
+
+llm_breaker = LLMBreaker()
@@ -0,0 +1,261 @@
+"""
+LLM 响应缓存
+- 按 (模型, 模板名, 模板版本, 渲染后的 prompt, 参数) 做内容哈希
+- 存在数据库 llm_cache 表，带 TTL 和按条数的淘汰
+- 各调用点通过 cache=True 显式开启，命中/未命中计数供管理后台查看
+- 只缓存完整、可用的输出：被 max_tokens 截断的不缓存；结构化调用传 schema，
+  解析通过后才写入，缓存里解析不了的条目按未命中处理
+"""
+import hashlib
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Type
+
+from pydantic import BaseModel
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import LLMCacheEntry
+from app.services import llm_gateway, structured_output
+
+logger = logging.getLogger(__name__)
+
+# 每写入多少条执行一次淘汰，避免每次写入都扫表
+EVICT_EVERY_N_WRITES = 50
+
+
+class LLMCache:
+    """LLM 响应缓存（数据库持久化，多 worker 共享）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        self._writes_since_evict = 0
+
+    @staticmethod
+    def make_key(model: str, template: str, version: int, prompt: str, params: Dict[str, Any]) -> str:
+        """计算缓存 key"""
+        raw = json.dumps(
+            {
+                "model": model,
+                "template": template,
+                "version": version,
+                "prompt": prompt,
+                "params": params,
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，过期视为未命中"""
+        db = SessionLocal()
+        try:
+            entry = db.query(LLMCacheEntry).filter(LLMCacheEntry.key == key).first()
+            if not entry:
+                return None
+            now = datetime.utcnow()
+            if entry.expires_at <= now:
+                db.delete(entry)
+                db.commit()
+                return None
+            entry.hit_count = (entry.hit_count or 0) + 1
+            entry.last_hit_at = now
+            db.commit()
+            return entry.response
+        except Exception as e:
+            logger.warning(f"[LLMCache] 读取缓存失败: {e}")
+            db.rollback()
+            return None
+        finally:
+            db.close()
+
+    def set(self, key: str, feature: str, model: str, response: str):
+        """写入缓存"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            entry = db.query(LLMCacheEntry).filter(LLMCacheEntry.key == key).first()
+            if not entry:
+                entry = LLMCacheEntry(key=key, feature=feature, model=model, hit_count=0)
+                db.add(entry)
+            entry.response = response
+            entry.created_at = now
+            entry.last_hit_at = now
+            entry.expires_at = now + timedelta(hours=settings.llm_cache_ttl_hours)
+            db.commit()
+
+            with self._lock:
+                self._writes_since_evict += 1
+                should_evict = self._writes_since_evict >= EVICT_EVERY_N_WRITES
+                if should_evict:
+                    self._writes_since_evict = 0
+            if should_evict:
+                self.evict(db)
+        except Exception as e:
+            # 并发写入同一 key 时可能主键冲突，忽略即可
+            logger.warning(f"[LLMCache] 写入缓存失败: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def evict(self, db=None) -> int:
+        """删除过期条目，并在超过上限时按最近命中时间淘汰最旧的条目"""
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
+        try:
+            removed = db.query(LLMCacheEntry).filter(
+                LLMCacheEntry.expires_at <= datetime.utcnow()
+            ).delete(synchronize_session=False)
+
+            total = db.query(LLMCacheEntry).count()
+            overflow = total - settings.llm_cache_max_entries
+            if overflow > 0:
+                stale_keys = [
+                    k for (k,) in db.query(LLMCacheEntry.key)
+                    .order_by(LLMCacheEntry.last_hit_at.asc())
+                    .limit(overflow)
+                    .all()
+                ]
+                removed += db.query(LLMCacheEntry).filter(
+                    LLMCacheEntry.key.in_(stale_keys)
+                ).delete(synchronize_session=False)
+
+            db.commit()
+            if removed:
+                logger.info(f"[LLMCache] 淘汰 {removed} 条缓存")
+            return removed
+        except Exception as e:
+            logger.warning(f"[LLMCache] 淘汰缓存失败: {e}")
+            db.rollback()
+            return 0
+        finally:
+            if own_session:
+                db.close()
+
+    def complete(
+        self,
+        client,
+        *,
+        feature: str,
+        version: int,
+        model: str,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        cache: bool = True,
+        schema: Optional[Type[BaseModel]] = None,
+    ) -> Any:
+        """
+        单轮 prompt 补全，cache=True 时先查缓存
+
+        Args:
+            client: OpenAI 客户端
+            feature: 调用点名称（同时作为模板名参与 key 计算）
+            version: prompt 模板版本
+            cache: 调用点是否开启缓存
+            schema: 结构化输出的 pydantic 模型；传入时按它解析，解析通过才写缓存
+
+        Returns:
+            没有 schema 时为模型输出文本（已 strip），有 schema 时为解析后的对象
+            （解析失败抛 StructuredOutputError，结果不会进缓存）
+        """
+        use_cache = cache and settings.llm_cache_enabled
+        key = None
+
+        if use_cache:
+            key = self.make_key(
+                model, feature, version, prompt,
+                {"temperature": temperature, "max_tokens": max_tokens},
+            )
+            cached = self.get(key)
+            if cached is not None:
+                try:
+                    result = structured_output.parse(cached, schema) if schema else cached
+                except structured_output.StructuredOutputError:
+                    # 旧版本写进去的坏条目：删掉，按未命中重新调用
+                    print(f"[LLMCache] 缓存内容无法解析，丢弃: {feature}")
+                    self.delete(key)
+                else:
+                    self._count(self._hits, feature)
+                    llm_gateway.record_cache_hit(feature, model)
+                    print(f"[LLMCache] 命中: {feature}")
+                    return result
+            self._count(self._misses, feature)
+
+        response = llm_gateway.chat_completion(
+            client,
+            feature=feature,
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        choice = response.choices[0]
+        content = (choice.message.content or "").strip()
+        result = structured_output.parse(content, schema) if schema else content
+
+        # 被 max_tokens 截断的输出不完整（结构化输出的括号可能是补上的），不缓存
+        if use_cache and content and choice.finish_reason != "length":
+            self.set(key, feature, model, content)
+
+        return result
+
+    def delete(self, key: str):
+        """删除一条缓存"""
+        db = SessionLocal()
+        try:
+            db.query(LLMCacheEntry).filter(LLMCacheEntry.key == key).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.warning(f"[LLMCache] 删除缓存失败: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _count(self, counter: Dict[str, int], feature: str):
+        with self._lock:
+            counter[feature] = counter.get(feature, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率统计（当前 worker 进程）+ 缓存表概况"""
+        with self._lock:
+            hits = dict(self._hits)
+            misses = dict(self._misses)
+
+        features = sorted(set(hits) | set(misses))
+        by_feature = {}
+        for f in features:
+            h, m = hits.get(f, 0), misses.get(f, 0)
+            by_feature[f] = {
+                "hits": h,
+                "misses": m,
+                "hit_rate": round(h / (h + m), 3) if (h + m) else None,
+            }
+
+        total_hits = sum(hits.values())
+        total_misses = sum(misses.values())
+
+        db = SessionLocal()
+        try:
+            entries = db.query(LLMCacheEntry).count()
+        finally:
+            db.close()
+
+        return {
+            "enabled": settings.llm_cache_enabled,
+            "entries": entries,
+            "max_entries": settings.llm_cache_max_entries,
+            "hits": total_hits,
+            "misses": total_misses,
+            "hit_rate": round(total_hits / (total_hits + total_misses), 3) if (total_hits + total_misses) else None,
+            "by_feature": by_feature,
+        }
+
+
+llm_cache = LLMCache()
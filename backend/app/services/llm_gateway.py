@@ -0,0 +1,372 @@
+"""
+LLM 调用入口
+所有 chat.completions 调用都经过这里，统一做：
+- 台账记录（token、延迟、结果）
+- 每用户每日预算检查（超出后拒绝非必要功能）
+- 按优先级通道排队（见 llm_scheduler）
+- 熔断：服务商降级时拒绝非必要功能（见 llm_breaker）
+- 对冲：短 prompt 超过延迟分位数仍未返回时，向快速模型补发一次，谁先回来用谁
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextvars import copy_context
+from typing import Any, Dict, Iterator, Optional
+
+from app.config import settings
+from app.services.llm_breaker import llm_breaker
+from app.services.llm_ledger import llm_ledger, current_context
+from app.services.llm_scheduler import llm_scheduler, resolve_lane
+
+# 非必要功能：预算超出或熔断打开时直接拒绝，调用方走各自的兜底逻辑
+NON_ESSENTIAL_FEATURES = (
+    "intervention",
+    "topic_review",
+    "topic_options",
+)
+
+# 对冲请求用的线程池（同步调用时主请求也放在这里，调用线程只负责等）
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+_hedge_lock = threading.Lock()
+_hedge_stats: Dict[str, int] = {"eligible": 0, "fired": 0, "won": 0}
+
+
+class LLMBudgetExceeded(RuntimeError):
+    """用户当日 token 预算已用完，非必要功能被降级"""
+
+
+class LLMCircuitOpen(RuntimeError):
+    """模型熔断中，非必要功能被暂停"""
+
+
+def is_essential(feature: str) -> bool:
+    return not feature.startswith(NON_ESSENTIAL_FEATURES)
+
+
+def _check_budget(feature: str, model: str):
+    if is_essential(feature):
+        return
+    user_id = current_context().get("user_id")
+    if llm_ledger.over_budget(user_id):
+        llm_ledger.record(feature, model, outcome="budget_exceeded")
+        raise LLMBudgetExceeded(f"用户 {user_id} 今日 token 预算已用完，跳过 {feature}")
+
+
+def _check_breaker(feature: str, model: str) -> Optional[int]:
+    """熔断检查；半开时放行的探测请求返回探测编号，结果记账时带上"""
+    if is_essential(feature):
+        return None
+    allowed, probe = llm_breaker.acquire(model)
+    if not allowed:
+        llm_ledger.record(feature, model, outcome="circuit_open")
+        raise LLMCircuitOpen(f"{model} 熔断中，跳过 {feature}")
+    return probe
+
+
+def _lane(feature: str) -> str:
+    return resolve_lane(feature, current_context().get("lane"))
+
+
+def _usage_tokens(usage) -> tuple:
+    if not usage:
+        return 0, 0
+    return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+
+
+def _elapsed_ms(start: float) -> int:
+    return int((time.monotonic() - start) * 1000)
+
+
+def _is_short(kwargs: Dict[str, Any]) -> bool:
+    """短调用：非流式、无工具、输出上限小、prompt 不长。只有这类调用的耗时能反映服务商快慢"""
+    if kwargs.get("stream") or kwargs.get("tools"):
+        return False
+    if (kwargs.get("max_tokens") or 0) > settings.llm_hedge_max_tokens:
+        return False
+    prompt_chars = sum(len(str(m.get("content") or "")) for m in kwargs.get("messages", []))
+    return prompt_chars <= settings.llm_hedge_max_prompt_chars
+
+
+def _hedge_delay_seconds(model: str) -> Optional[float]:
+    """对冲等待时长：主模型近期延迟的分位数；未开启或不适用（主模型已是快速模型）时返回 None"""
+    if not settings.llm_hedge_enabled or model == settings.dashscope_model_fast:
+        return None
+    delay_ms = llm_breaker.latency_percentile(model, settings.llm_hedge_percentile)
+    if delay_ms is None:
+        delay_ms = settings.llm_hedge_default_delay_ms
+    return max(delay_ms, 200) / 1000
+
+
+def _count_hedge(key: str):
+    with _hedge_lock:
+        _hedge_stats[key] += 1
+
+
+def _record_ok(feature: str, model: str, response, start: float, short: bool, probe: Optional[int] = None):
+    latency_ms = _elapsed_ms(start)
+    prompt_tokens, completion_tokens = _usage_tokens(getattr(response, "usage", None))
+    llm_ledger.record(
+        feature, model,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        latency_ms=latency_ms,
+    )
+    llm_breaker.record(model, latency_ms if short else None, ok=True, probe=probe)
+
+
+def _record_error(feature: str, model: str, start: float, outcome: str = "error", probe: Optional[int] = None):
+    latency_ms = _elapsed_ms(start)
+    llm_ledger.record(feature, model, latency_ms=latency_ms, outcome=outcome)
+    llm_breaker.record(model, latency_ms, ok=False, probe=probe)
+
+
+# ========== 同步 ==========
+
+
+def chat_completion(client, *, feature: str, **kwargs) -> Any:
+    """
+    同步调用 client.chat.completions.create 并记账
+
+    Args:
+        client: OpenAI 客户端
+        feature: 功能标签（写入台账）
+        **kwargs: 透传给 chat.completions.create；stream=True 时返回包装后的流
+    """
+    model = kwargs.get("model", "")
+    _check_budget(feature, model)
+    probe = _check_breaker(feature, model)
+
+    kwargs.setdefault("timeout", settings.llm_request_timeout_seconds)
+    if kwargs.get("stream"):
+        kwargs.setdefault("extra_body", {"stream_options": {"include_usage": True}})
+        return _create(client, feature, kwargs, probe)
+
+    if _is_short(kwargs):
+        delay = _hedge_delay_seconds(model)
+        if delay is not None:
+            return _hedged(client, feature, kwargs, delay, probe)
+    return _create(client, feature, kwargs, probe)
+
+
+def _create(client, feature: str, kwargs: Dict[str, Any], probe: Optional[int] = None) -> Any:
+    model = kwargs.get("model", "")
+    short = _is_short(kwargs)
+
+    if kwargs.get("stream"):
+        # 流式调用到开始迭代时才排队、发请求：返回的流没被读（客户端提前断开等）也不会占着名额
+        return _RecordedStream(client, kwargs, feature, model, _lane(feature), probe)
+
+    with llm_scheduler.slot(_lane(feature), model):
+        start = time.monotonic()
+        try:
+            response = client.chat.completions.create(**kwargs)
+        except Exception:
+            _record_error(feature, model, start, probe=probe)
+            raise
+
+    _record_ok(feature, model, response, start, short, probe)
+    return response
+
+
+def _hedged(client, feature: str, kwargs: Dict[str, Any], delay: float, probe: Optional[int] = None) -> Any:
+    """主请求等待 delay 秒仍未返回时补发到快速模型，返回先成功的那个（探测编号只跟主请求）"""
+    _count_hedge("eligible")
+    primary = _hedge_pool.submit(copy_context().run, _create, client, feature, kwargs, probe)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+
+    _count_hedge("fired")
+    hedge_kwargs = {**kwargs, "model": settings.dashscope_model_fast}
+    print(f"[LLMGateway] {feature} 超过 {int(delay * 1000)}ms 未返回，对冲到 {hedge_kwargs['model']}")
+    backup = _hedge_pool.submit(copy_context().run, _create, client, feature, hedge_kwargs)
+
+    pending = {primary, backup}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if future is backup:
+                _count_hedge("won")
+            # 另一个请求无法取消，让它在后台跑完（结果照常记账）
+            return result
+    raise error
+
+
+# ========== 异步 ==========
+
+
+async def achat_completion(client, *, feature: str, **kwargs) -> Any:
+    """异步版本（AsyncOpenAI 客户端），不支持 stream"""
+    model = kwargs.get("model", "")
+    if not is_essential(feature):
+        # 预算检查会用同步会话查今日用量，放到线程里跑，不阻塞事件循环（to_thread 会带上当前调用上下文）
+        await asyncio.to_thread(_check_budget, feature, model)
+    probe = _check_breaker(feature, model)
+
+    kwargs.setdefault("timeout", settings.llm_request_timeout_seconds)
+    if _is_short(kwargs):
+        delay = _hedge_delay_seconds(model)
+        if delay is not None:
+            return await _ahedged(client, feature, kwargs, delay, probe)
+    return await _acreate(client, feature, kwargs, probe)
+
+
+async def _acreate(client, feature: str, kwargs: Dict[str, Any], probe: Optional[int] = None) -> Any:
+    model = kwargs.get("model", "")
+    short = _is_short(kwargs)
+
+    queued = time.monotonic()
+    try:
+        async with llm_scheduler.aslot(_lane(feature), model):
+            start = time.monotonic()
+            response = await client.chat.completions.create(**kwargs)
+    except asyncio.CancelledError:
+        # 超时取消也记一笔（包括排队期间被取消），便于统计判断任务的超时率；
+        # 熔断只记延迟下限，不算错误
+        latency_ms = _elapsed_ms(queued)
+        llm_ledger.record(feature, model, latency_ms=latency_ms, outcome="cancelled")
+        llm_breaker.record(model, latency_ms if short else None, ok=True, probe=probe)
+        raise
+    except Exception:
+        _record_error(feature, model, queued, probe=probe)
+        raise
+
+    _record_ok(feature, model, response, start, short, probe)
+    return response
+
+
+async def _ahedged(client, feature: str, kwargs: Dict[str, Any], delay: float, probe: Optional[int] = None) -> Any:
+    """异步对冲：先返回的成功结果胜出，另一个请求直接取消"""
+    _count_hedge("eligible")
+    primary = asyncio.ensure_future(_acreate(client, feature, kwargs, probe))
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done:
+        return primary.result()
+
+    _count_hedge("fired")
+    hedge_kwargs = {**kwargs, "model": settings.dashscope_model_fast}
+    print(f"[LLMGateway] {feature} 超过 {int(delay * 1000)}ms 未返回，对冲到 {hedge_kwargs['model']}")
+    backup = asyncio.ensure_future(_acreate(client, feature, hedge_kwargs))
+
+    pending = {primary, backup}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                if task is backup:
+                    _count_hedge("won")
+                return task.result()
+        raise error
+    finally:
+        for task in (primary, backup):
+            if not task.done():
+                task.cancel()
+
+
+class _RecordedStream:
+    """
+    包装流式响应：开始迭代时才占调度名额并发请求，迭代结束（或中途异常、被关闭）时释放名额并记账；
+    首个分片的到达时间计入熔断统计
+    """
+
+    def __init__(
+        self, client, kwargs: Dict[str, Any], feature: str, model: str, lane: str, probe: Optional[int] = None,
+    ):
+        self._client = client
+        self._kwargs = kwargs
+        self._feature = feature
+        self._model = model
+        self._lane = lane
+        self._probe = probe
+        self._start = time.monotonic()
+        self._iterator = None
+        self._usage = None
+        self._chars = 0
+        self._first_chunk = False
+        self._recorded = False
+
+    def __iter__(self) -> Iterator:
+        if self._iterator is not None:
+            raise RuntimeError("流式响应只能迭代一次")
+        self._iterator = self._iterate()
+        return self._iterator
+
+    def close(self):
+        """不再读取：正在迭代时结束迭代（释放名额、关闭连接）"""
+        if self._iterator is not None:
+            self._iterator.close()
+
+    def __del__(self):
+        self.close()
+
+    def _iterate(self) -> Iterator:
+        with llm_scheduler.slot(self._lane, self._model):
+            self._start = time.monotonic()
+            try:
+                stream = self._client.chat.completions.create(**self._kwargs)
+            except Exception:
+                _record_error(self._feature, self._model, self._start, probe=self._probe)
+                raise
+
+            outcome = "ok"
+            try:
+                for chunk in stream:
+                    if not self._first_chunk:
+                        self._first_chunk = True
+                        llm_breaker.record(self._model, _elapsed_ms(self._start), ok=True, probe=self._probe)
+                    if getattr(chunk, "usage", None):
+                        self._usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        self._chars += len(chunk.choices[0].delta.content)
+                    yield chunk
+            except Exception:
+                outcome = "error"
+                llm_breaker.record(self._model, None, ok=False, probe=self._probe)
+                raise
+            except GeneratorExit:
+                # 调用方没读完就关闭了
+                outcome = "cancelled"
+                raise
+            finally:
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+                self._record(outcome)
+
+    def _record(self, outcome: str):
+        if self._recorded:
+            return
+        self._recorded = True
+        prompt_tokens, completion_tokens = _usage_tokens(self._usage)
+        if not completion_tokens:
+            # 服务端未返回 usage 时按字数粗估（中文约 1 字 1 token）
+            completion_tokens = self._chars
+        llm_ledger.record(
+            self._feature, self._model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency_ms=_elapsed_ms(self._start),
+            outcome=outcome,
+        )
+
+
+def record_cache_hit(feature: str, model: str, user_id: Optional[str] = None):
+    """缓存命中也记一笔（0 token），便于看出缓存省下的调用"""
+    llm_ledger.record(feature, model, outcome="cache_hit", user_id=user_id)
+
+
+def hedge_stats() -> Dict[str, int]:
+    """对冲请求计数（当前 worker 进程）"""
+    with _hedge_lock:
+        return dict(_hedge_stats)
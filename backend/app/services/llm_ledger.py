@@ -0,0 +1,212 @@
+"""
+LLM 调用台账
+- 每次调用记录功能标签、模型、token、延迟、用户、对话和结果
+- 写入先进内存队列，由后台线程批量落库，不占用调用线程
+- 提供每用户每日 token 用量，用于预算降级
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, date
+from typing import Optional, Dict, Any, List, Tuple
+
+from sqlalchemy import func, insert
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import LLMUsage
+
+logger = logging.getLogger(__name__)
+
+# 调用上下文：在请求/后台任务入口设置 user_id、conversation_id，下游 LLM 调用自动带上
+_call_context: ContextVar[Dict[str, Any]] = ContextVar("llm_call_context", default={})
+
+# 预算用量缓存的刷新间隔（秒）
+USAGE_REFRESH_SECONDS = 60
+
+
+@contextmanager
+def llm_context(**fields):
+    """
+    设置 LLM 调用上下文（可嵌套，内层覆盖外层）
+
+    用法：
+        with llm_context(user_id=user_id, conversation_id=conversation_id):
+            memoir_service.generate_from_conversation(...)
+    """
+    merged = {**_call_context.get(), **{k: v for k, v in fields.items() if v is not None}}
+    token = _call_context.set(merged)
+    try:
+        yield merged
+    finally:
+        _call_context.reset(token)
+
+
+def current_context() -> Dict[str, Any]:
+    """当前 LLM 调用上下文"""
+    return _call_context.get()
+
+
+def _utc_today() -> date:
+    """预算按 UTC 日计，和 created_at（utcnow）一致，不受服务器时区影响"""
+    return datetime.utcnow().date()
+
+
+class LLMLedger:
+    """LLM 调用台账（批量异步写库）"""
+
+    def __init__(self):
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._inflight: List[Dict[str, Any]] = []  # 已出队但尚未落库的一批
+        # 每用户当日用量：user_id -> (日期, 库中用量, 拉取时间, 之后本进程新增用量)
+        self._usage_lock = threading.Lock()
+        self._usage: Dict[str, Tuple[date, int, float, int]] = {}
+
+    def record(
+        self,
+        feature: str,
+        model: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        latency_ms: int = 0,
+        outcome: str = "ok",
+        user_id: Optional[str] = None,
+        conversation_id: Optional[str] = None,
+    ):
+        """记录一次调用（非阻塞）"""
+        if not settings.llm_ledger_enabled:
+            return
+
+        ctx = current_context()
+        user_id = user_id or ctx.get("user_id")
+        conversation_id = conversation_id or ctx.get("conversation_id")
+
+        self._queue.put({
+            "feature": feature[:50],
+            "model": (model or "")[:50],
+            "prompt_tokens": prompt_tokens or 0,
+            "completion_tokens": completion_tokens or 0,
+            "latency_ms": int(latency_ms or 0),
+            "user_id": user_id,
+            "conversation_id": conversation_id,
+            "outcome": outcome,
+            "created_at": datetime.utcnow(),
+        })
+
+        if user_id:
+            self._add_local_usage(user_id, (prompt_tokens or 0) + (completion_tokens or 0))
+
+        self._ensure_writer()
+
+    # ---------- 批量写库 ----------
+
+    def _ensure_writer(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._writer_loop, name="llm-ledger", daemon=True)
+            self._thread.start()
+
+    def _writer_loop(self):
+        while True:
+            batch = self._drain(block=True)
+            if batch:
+                self._write(batch)
+
+    def _drain(self, block: bool) -> List[Dict[str, Any]]:
+        """取出一批记录：攒够 batch_size 或等满 flush_seconds 即返回"""
+        batch = []
+        self._inflight = batch
+        deadline = time.monotonic() + settings.llm_ledger_flush_seconds
+        while len(batch) < settings.llm_ledger_batch_size:
+            timeout = deadline - time.monotonic()
+            if not block or timeout <= 0:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        db = SessionLocal()
+        try:
+            db.execute(insert(LLMUsage), batch)
+            db.commit()
+        except Exception as e:
+            logger.warning(f"[LLMLedger] 写入台账失败（丢弃 {len(batch)} 条）: {e}")
+            db.rollback()
+        finally:
+            db.close()
+            if self._inflight is batch:
+                self._inflight = []
+
+    def flush(self):
+        """把队列中剩余记录立即写库（进程退出时调用）"""
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                break
+            self._write(batch)
+
+    # ---------- 预算 ----------
+
+    def _add_local_usage(self, user_id: str, tokens: int):
+        with self._usage_lock:
+            entry = self._usage.get(user_id)
+            if entry and entry[0] == _utc_today():
+                day, db_tokens, fetched_at, local = entry
+                self._usage[user_id] = (day, db_tokens, fetched_at, local + tokens)
+
+    def tokens_today(self, user_id: str) -> int:
+        """用户今日（UTC 日）已用 token（库中数据每分钟刷新一次，加上本进程之后的新增）"""
+        today = _utc_today()
+        with self._usage_lock:
+            entry = self._usage.get(user_id)
+        if entry and entry[0] == today and time.monotonic() - entry[2] < USAGE_REFRESH_SECONDS:
+            return entry[1] + entry[3]
+
+        day_start = datetime.combine(today, datetime.min.time())
+        db = SessionLocal()
+        try:
+            db_tokens = db.query(
+                func.coalesce(func.sum(LLMUsage.prompt_tokens + LLMUsage.completion_tokens), 0)
+            ).filter(
+                LLMUsage.user_id == user_id,
+                LLMUsage.created_at >= day_start,
+            ).scalar() or 0
+        finally:
+            db.close()
+
+        # 队列里和正在写入中、尚未落库的部分
+        pending = sum(
+            r["prompt_tokens"] + r["completion_tokens"]
+            for r in list(self._queue.queue) + list(self._inflight)
+            if r.get("user_id") == user_id
+        )
+        with self._usage_lock:
+            self._usage[user_id] = (today, int(db_tokens), time.monotonic(), pending)
+        return int(db_tokens) + pending
+
+    def over_budget(self, user_id: Optional[str]) -> bool:
+        """用户是否已超出每日预算"""
+        budget = settings.llm_user_daily_token_budget
+        if not budget or not user_id:
+            return False
+        return self.tokens_today(user_id) >= budget
+
+
+llm_ledger = LLMLedger()
+atexit.register(llm_ledger.flush)
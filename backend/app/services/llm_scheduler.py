@@ -0,0 +1,271 @@
+"""
+LLM 调用调度器（进程内）
+- 三条优先级通道：realtime（实时对话中的判断）> interactive（用户在等的请求）> background（后台任务）
+- 全局并发上限，为 realtime 预留名额；实时负载高时压低 background 并发
+- 按模型的令牌桶限速（每分钟请求数）
+- 排队指标：等待数、执行数、等待时长
+
+已经发出的 HTTP 请求无法中途抢占，"抢占" 体现在排队阶段：
+realtime 永远排在最前，background 在实时负载期间只能占很少的并发。
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from itertools import count
+from typing import Dict, List, Optional
+
+from app.config import settings
+
+REALTIME = "realtime"
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+LANES = (REALTIME, INTERACTIVE, BACKGROUND)
+_LANE_RANK = {lane: i for i, lane in enumerate(LANES)}
+
+# 固定走某条通道的功能（前缀匹配），其余按调用上下文的 lane，默认 background
+FEATURE_LANES = {
+    "intervention": REALTIME,
+    "profile_completion_check": REALTIME,
+    "chat": INTERACTIVE,
+}
+
+# 最近一次 realtime 调用后多少秒内仍视为实时负载高
+REALTIME_COOLDOWN_SECONDS = 10.0
+# 异步等待的轮询间隔（秒）
+ASYNC_POLL_SECONDS = 0.01
+# 每条通道保留最近多少次等待时长用于算分位数
+WAIT_SAMPLES = 200
+
+
+def resolve_lane(feature: str, context_lane: Optional[str] = None) -> str:
+    """根据功能标签和调用上下文确定通道"""
+    for prefix, lane in FEATURE_LANES.items():
+        if feature.startswith(prefix):
+            return lane
+    if context_lane in _LANE_RANK:
+        return context_lane
+    return BACKGROUND
+
+
+class _TokenBucket:
+    """令牌桶：rpm 为每分钟请求数，容量为一秒的量（至少 1）"""
+
+    def __init__(self, rpm: float):
+        self.rate = rpm / 60.0
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready(self) -> bool:
+        self._refill()
+        return self.tokens >= 1.0
+
+    def take(self):
+        self.tokens -= 1.0
+
+    def wait_seconds(self) -> float:
+        self._refill()
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class _Ticket:
+    __slots__ = ("lane", "model", "seq", "enqueued_at")
+
+    def __init__(self, lane: str, model: str, seq: int):
+        self.lane = lane
+        self.model = model
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+
+    @property
+    def order(self):
+        return _LANE_RANK[self.lane], self.seq
+
+
+class LLMScheduler:
+    """按优先级通道分配 LLM 调用名额"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = count()
+        self._waiting: List[_Ticket] = []
+        self._in_flight: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self._last_realtime = 0.0
+        # 指标
+        self._admitted: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._waits: Dict[str, deque] = {lane: deque(maxlen=WAIT_SAMPLES) for lane in LANES}
+        self._max_wait: Dict[str, float] = {lane: 0.0 for lane in LANES}
+
+    # ---------- 对外接口 ----------
+
+    @contextmanager
+    def slot(self, lane: str, model: str):
+        """同步占用一个调用名额（阻塞等待）"""
+        ticket = self._enqueue(lane, model)
+        try:
+            with self._cond:
+                while not self._try_admit(ticket):
+                    self._cond.wait(timeout=self._wait_hint(ticket))
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    @asynccontextmanager
+    async def aslot(self, lane: str, model: str):
+        """异步占用一个调用名额（不阻塞事件循环，可被超时取消）"""
+        ticket = self._enqueue(lane, model)
+        try:
+            while True:
+                with self._cond:
+                    if self._try_admit(ticket):
+                        break
+                await asyncio.sleep(ASYNC_POLL_SECONDS)
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def stats(self) -> Dict:
+        """各通道排队指标（当前 worker 进程）"""
+        with self._cond:
+            waiting = {lane: 0 for lane in LANES}
+            for t in self._waiting:
+                waiting[t.lane] += 1
+            lanes = {}
+            for lane in LANES:
+                samples = sorted(self._waits[lane])
+                lanes[lane] = {
+                    "waiting": waiting[lane],
+                    "in_flight": self._in_flight[lane],
+                    "admitted": self._admitted[lane],
+                    "wait_ms_p50": _percentile_ms(samples, 0.5),
+                    "wait_ms_p95": _percentile_ms(samples, 0.95),
+                    "wait_ms_max": int(self._max_wait[lane] * 1000),
+                }
+            return {
+                "max_concurrency": settings.llm_max_concurrency,
+                "realtime_reserved": settings.llm_realtime_reserved,
+                "realtime_busy": self._realtime_busy(),
+                "lanes": lanes,
+                "model_rpm": dict(settings.llm_model_rpm),
+            }
+
+    # ---------- 内部 ----------
+
+    def _enqueue(self, lane: str, model: str) -> _Ticket:
+        with self._cond:
+            ticket = _Ticket(lane, model, next(self._seq))
+            self._waiting.append(ticket)
+            if lane == REALTIME:
+                self._last_realtime = time.monotonic()
+            return ticket
+
+    def _dequeue(self, ticket: _Ticket):
+        with self._cond:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+
+    def _release(self, lane: str):
+        with self._cond:
+            self._in_flight[lane] -= 1
+            if lane == REALTIME:
+                self._last_realtime = time.monotonic()
+            self._cond.notify_all()
+
+    def _bucket(self, model: str) -> Optional[_TokenBucket]:
+        rpm = settings.llm_model_rpm.get(model)
+        if not rpm:
+            return None
+        bucket = self._buckets.get(model)
+        if bucket is None or bucket.rate != rpm / 60.0:
+            bucket = self._buckets[model] = _TokenBucket(rpm)
+        return bucket
+
+    def _bucket_ready(self, model: str) -> bool:
+        bucket = self._bucket(model)
+        return bucket is None or bucket.ready()
+
+    def _realtime_busy(self) -> bool:
+        return (
+            self._in_flight[REALTIME] > 0
+            or any(t.lane == REALTIME for t in self._waiting)
+            or time.monotonic() - self._last_realtime < REALTIME_COOLDOWN_SECONDS
+        )
+
+    def _lane_has_capacity(self, lane: str) -> bool:
+        total = sum(self._in_flight.values())
+        if total >= settings.llm_max_concurrency:
+            return False
+        if lane == REALTIME:
+            return True
+        # 非 realtime 不能占用预留名额
+        if total >= settings.llm_max_concurrency - settings.llm_realtime_reserved:
+            return False
+        if lane == BACKGROUND:
+            limit = settings.llm_background_max_concurrency
+            if self._realtime_busy():
+                limit = min(limit, settings.llm_background_concurrency_under_realtime)
+            return self._in_flight[BACKGROUND] < limit
+        return True
+
+    def _try_admit(self, ticket: _Ticket) -> bool:
+        """调用方需持有 self._cond。轮到自己（前面没有可以执行的更高优先级请求）且有名额时放行"""
+        if not self._lane_has_capacity(ticket.lane) or not self._bucket_ready(ticket.model):
+            return False
+        for other in sorted(self._waiting, key=lambda t: t.order):
+            if other is ticket:
+                break
+            # 排在前面的请求如果能执行就让它先走；只因自己模型限速而等待的不挡后面的人
+            if self._lane_has_capacity(other.lane) and self._bucket_ready(other.model):
+                return False
+
+        self._waiting.remove(ticket)
+        bucket = self._bucket(ticket.model)
+        if bucket:
+            bucket.take()
+        self._in_flight[ticket.lane] += 1
+
+        waited = time.monotonic() - ticket.enqueued_at
+        self._admitted[ticket.lane] += 1
+        self._waits[ticket.lane].append(waited)
+        self._max_wait[ticket.lane] = max(self._max_wait[ticket.lane], waited)
+        if waited > 1.0:
+            print(f"[LLMScheduler] {ticket.lane} 请求排队 {waited:.1f}s (model={ticket.model})")
+        return True
+
+    def _wait_hint(self, ticket: _Ticket) -> float:
+        """同步等待的超时：限速时等到下一个令牌，否则靠 notify 唤醒（兜底 1 秒）"""
+        bucket = self._bucket(ticket.model)
+        if bucket:
+            hint = bucket.wait_seconds()
+            if hint > 0:
+                return min(hint, 1.0)
+        return 1.0
+
+
+def _percentile_ms(sorted_samples: List[float], q: float) -> Optional[int]:
+    if not sorted_samples:
+        return None
+    idx = min(len(sorted_samples) - 1, int(len(sorted_samples) * q))
+    return int(sorted_samples[idx] * 1000)
+
+
+llm_scheduler = LLMScheduler()
@@ -1,6 +1,19 @@
 from openai import OpenAI
-from typing import List, Dict, Generator
+from pydantic import BaseModel
+from typing import List, Dict, Generator, Optional
 from app.config import settings
+from app.services.llm_cache import llm_cache
+from app.services import llm_gateway
+
+
+class TimePeriodResult(BaseModel):
+    year_start: Optional[int] = None
+    year_end: Optional[int] = None
+    time_period: Optional[str] = ""
+
+
+class ProfileCompletionResult(BaseModel):
+    complete: bool = False
 
 
 class LLMService:
@@ -21,7 +34,9 @@ class LLMService:
 
         full_messages.extend(messages)
 
-        response = self.client.chat.completions.create(
+        response = llm_gateway.chat_completion(
+            self.client,
+            feature="chat",
             model=self.model,
             messages=full_messages,
             temperature=0.8,
@@ -39,7 +54,9 @@ class LLMService:
 
         full_messages.extend(messages)
 
-        response = self.client.chat.completions.create(
+        response = llm_gateway.chat_completion(
+            self.client,
+            feature="chat",
             model=self.model,
             messages=full_messages,
             temperature=0.8,
@@ -47,30 +64,38 @@ class LLMService:
             stream=True
         )
 
-        for chunk in response:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
-
-    def generate_summary(self, conversation_text: str) -> str:
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # 客户端断开时生成器被关闭，立即释放调度名额
+            response.close()
+
+    def generate_summary(self, conversation_text: str, cache: bool = True) -> str:
         """生成对话摘要"""
         from app.prompts import summary
 
         prompt = summary.build(conversation_text)
-        response = self.client.chat.completions.create(
+        return llm_cache.complete(
+            self.client,
+            feature="summary",
+            version=summary.VERSION,
             model=self.model,
-            messages=[{"role": "user", "content": prompt}],
+            prompt=prompt,
             temperature=0.3,
-            max_tokens=200
+            max_tokens=200,
+            cache=cache,
         )
 
-        return response.choices[0].message.content
-
     def generate_memoir(self, conversation_text: str, perspective: str = "第一人称") -> str:
         """生成回忆录内容"""
         from app.prompts import memoir
 
         prompt = memoir.build(conversation_text, perspective)
-        response = self.client.chat.completions.create(
+        response = llm_gateway.chat_completion(
+            self.client,
+            feature="memoir_single",
             model=self.model,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.7,
@@ -79,21 +104,23 @@ class LLMService:
 
         return response.choices[0].message.content
 
-    def generate_title(self, conversation_text: str) -> str:
+    def generate_title(self, conversation_text: str, cache: bool = True) -> str:
         """根据对话内容生成简练的标题"""
         from app.prompts import title
 
         prompt = title.build(conversation_text)
-        response = self.client.chat.completions.create(
+        return llm_cache.complete(
+            self.client,
+            feature="title",
+            version=title.VERSION,
             model=self.model_fast,
-            messages=[{"role": "user", "content": prompt}],
+            prompt=prompt,
             temperature=0.7,
-            max_tokens=30
+            max_tokens=30,
+            cache=cache,
         )
 
-        return response.choices[0].message.content.strip()
-
-    def infer_time_period(self, conversation_text: str, birth_year: int = None) -> dict:
+    def infer_time_period(self, conversation_text: str, birth_year: int = None, cache: bool = True) -> dict:
         """
         从对话内容推断时间段
 
@@ -104,64 +131,50 @@ class LLMService:
                 "time_period": "小学时期"  # 时期描述
             }
         """
-        import json
         from app.prompts import time_period
 
         prompt = time_period.build(conversation_text, birth_year)
 
         try:
-            response = self.client.chat.completions.create(
+            result = llm_cache.complete(
+                self.client,
+                feature="time_period",
+                version=time_period.VERSION,
                 model=self.model_fast,
-                messages=[{"role": "user", "content": prompt}],
+                prompt=prompt,
                 temperature=0.1,
-                max_tokens=100
+                max_tokens=100,
+                cache=cache,
+                schema=TimePeriodResult,
             )
-
-            content = response.choices[0].message.content.strip()
-
-            # 处理可能的 markdown 代码块
-            if content.startswith("```"):
-                content = content.split("```")[1]
-                if content.startswith("json"):
-                    content = content[4:]
-                content = content.strip()
-
-            result = json.loads(content)
             return {
-                "year_start": result.get("year_start"),
-                "year_end": result.get("year_end"),
-                "time_period": result.get("time_period", "")
+                "year_start": result.year_start,
+                "year_end": result.year_end,
+                "time_period": result.time_period or ""
             }
         except Exception as e:
             print(f"[LLM] 推断时间段失败: {e}")
             return {"year_start": None, "year_end": None, "time_period": ""}
 
-    def check_profile_completion(self, conversation_text: str) -> bool:
+    def check_profile_completion(self, conversation_text: str, cache: bool = True) -> bool:
         """检查信息收集对话是否已收集全部 4 项信息（称呼、出生年份、家乡、主要城市）"""
-        import json
         from app.prompts import profile_completion_check
 
         prompt = profile_completion_check.build(conversation_text)
 
         try:
-            response = self.client.chat.completions.create(
+            result = llm_cache.complete(
+                self.client,
+                feature="profile_completion_check",
+                version=profile_completion_check.VERSION,
                 model=self.model_fast,
-                messages=[{"role": "user", "content": prompt}],
+                prompt=prompt,
                 temperature=0.1,
-                max_tokens=50
+                max_tokens=50,
+                cache=cache,
+                schema=ProfileCompletionResult,
             )
-
-            content = response.choices[0].message.content.strip()
-
-            # 处理可能的 markdown 代码块
-            if content.startswith("```"):
-                content = content.split("```")[1]
-                if content.startswith("json"):
-                    content = content[4:]
-                content = content.strip()
-
-            result = json.loads(content)
-            return result.get("complete", False)
+            return result.complete
         except Exception as e:
             print(f"[LLM] 信息收集完成度检查失败: {e}")
             # 出错时默认返回 True，避免阻塞用户
@@ -173,7 +186,9 @@ class LLMService:
 
         prompt = era_memories.build(birth_year, hometown, main_city)
 
-        response = self.client.chat.completions.create(
+        response = llm_gateway.chat_completion(
+            self.client,
+            feature="era_memories",
             model=self.model,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.7,
@@ -1,11 +1,55 @@
 """
 回忆录生成 Agent
 通过多轮调用，让模型自己决定如何整理回忆录
+
+两种模式（配置 memoir_agent_mode）：
+- agent：模型自己决定调用顺序的工具循环
+- staged：固定流水线 分析 → 草稿 → 检查 →（修改 → 检查）；
+  分析和检查用快速模型，草稿用主模型
+未指定模式时按访谈长度选择：较短时走单次生成；超长时分段并行整理再合并（map-reduce），
+合并按 MERGE_BATCH_CHARS 分批逐层进行，单次合并的输出不会超过上限。
+
+有人在订阅生成进度时（见 memoir_progress），草稿、修改和合并步骤改用流式输出纯文本，
+边生成边把增量推给前端；其余步骤只推送当前步骤名。
+
+上下文压缩（agent 模式）：每轮调用前，被后续版本取代的草稿和检查结果替换为占位说明，
+只保留最新草稿和最近一次检查的问题列表，避免输入 token 随轮数平方增长。
+
+没能得到正文（模型出错、没有返回草稿、长访谈每一段都整理失败）时抛 MemoirGenerationError，
+由任务队列重试，不会把出错信息当成回忆录内容保存。
 """
 import json
-from typing import Optional, List, Dict, Any
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Optional, List, Dict, Any, Tuple
 from openai import OpenAI
 from app.config import settings
+from app.prompts import memoir_merge
+from app.services import structured_output
+from app.services import llm_gateway
+from app.services.memoir_progress import memoir_progress
+from app.services.transcript_segmenter import segment_transcript
+
+# 检查结果回传给模型的问题条数和每条长度上限
+MAX_ISSUES = 5
+MAX_ISSUE_CHARS = 100
+
+# staged 模式各步骤的输出上限
+ANALYZE_MAX_TOKENS = 800
+DRAFT_MAX_TOKENS = 4000
+CHECK_MAX_TOKENS = 600
+MERGE_MAX_TOKENS = 8000
+# 合并的输出和输入差不多长（中文约 1 字 1 token），每批输入的字数控制在输出上限以内并留余量
+MERGE_BATCH_CHARS = 6000
+
+# 输出正文的两种方式：强制调用工具，或（流式时）直接输出纯文本
+TOOL_OUTPUT_HINT = "请用 {tool} 工具输出。"
+TEXT_OUTPUT_HINT = "请直接输出回忆录正文，不要调用工具，也不要写任何说明。"
+
+
+class MemoirGenerationError(RuntimeError):
+    """回忆录没能生成出正文"""
 
 
 # Agent 可用的工具定义
@@ -180,6 +224,7 @@ class MemoirAgent:
             base_url=settings.dashscope_base_url
         )
         self.model = settings.dashscope_model
+        self.fast_model = settings.dashscope_model_fast
         self.max_iterations = 10  # 最大迭代次数，防止无限循环
 
     def generate(self, transcript: str, perspective: str = "第一人称") -> str:
@@ -192,7 +237,593 @@ class MemoirAgent:
 
         Returns:
             生成的回忆录内容
+
+        Raises:
+            MemoirGenerationError: 没能生成出正文
+        """
+        memoir, _ = self.generate_with_stats(transcript, perspective)
+        return memoir
+
+    def generate_with_stats(
+        self,
+        transcript: str,
+        perspective: str = "第一人称",
+        compact: Optional[bool] = None,
+        token_budget: Optional[int] = None,
+        mode: Optional[str] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        生成回忆录，同时返回本次生成的 token / 耗时统计
+
+        Args:
+            transcript: 访谈记录
+            perspective: 叙述人称
+            compact: 是否压缩上下文（agent 模式），默认取配置 memoir_agent_compaction
+            token_budget: 本次生成的 token 上限（输入+输出），默认取配置，0 表示不限
+            mode: "agent" / "staged" / "single_pass" / "map_reduce"，指定时按指定模式运行（对比测试用）；
+                默认按访谈长度选择单次生成 / map-reduce，其余取配置 memoir_agent_mode
+
+        Returns:
+            (回忆录内容, 统计信息)；统计里的 mode 是实际运行的模式
+
+        Raises:
+            MemoirGenerationError: 没能生成出正文
+        """
+        if mode is None:
+            if len(transcript) <= settings.memoir_agent_single_pass_chars:
+                mode = "single_pass"
+            elif settings.memoir_map_reduce_chars and len(transcript) > settings.memoir_map_reduce_chars:
+                mode = "map_reduce"
+            else:
+                mode = settings.memoir_agent_mode
+        if compact is None:
+            compact = settings.memoir_agent_compaction
+        if token_budget is None:
+            token_budget = settings.memoir_agent_token_budget
+
+        stats = self._new_stats(mode)
+        start = time.monotonic()
+        try:
+            if mode == "single_pass":
+                memoir = self._run_single_pass(transcript, perspective, stats)
+            elif mode == "map_reduce":
+                memoir = self._run_map_reduce(transcript, perspective, token_budget, stats)
+            elif mode == "staged":
+                memoir = self._run_staged(transcript, perspective, token_budget, stats)
+            else:
+                memoir = self._run(transcript, perspective, compact, token_budget, stats)
+            if not (memoir or "").strip():
+                raise MemoirGenerationError("模型未返回内容")
+        finally:
+            stats["elapsed_ms"] = int((time.monotonic() - start) * 1000)
+        stage_summary = ", ".join(f"{st['stage']}={st['ms']}ms" for st in stats["stages"])
+        print(
+            f"[MemoirAgent] 统计 - {stats['mode']}, {stats['iterations']} 轮, "
+            f"输入 {stats['prompt_tokens']} / 输出 {stats['completion_tokens']} tokens, "
+            f"压缩 {stats['compacted_chars']} 字, {stats['elapsed_ms']}ms ({stage_summary})"
+        )
+        return memoir, stats
+
+    def draft_section(self, segment: str, perspective: str = "第一人称") -> Tuple[str, Dict[str, Any]]:
+        """
+        预先整理进行中访谈的一段（对话还没结束时调用，见 memoir_speculation）
+
+        Returns:
+            (这一段的草稿, 统计信息)；整理失败时草稿为空字符串
+        """
+        stats = self._new_stats("speculate")
+        start = time.monotonic()
+        try:
+            section = self._draft_section(
+                segment, perspective,
+                "这是一次还在进行中的访谈的一段，前后的内容会另外整理后合并。",
+                "speculate", stats, keep_raw=False,
+            )
+        finally:
+            stats["elapsed_ms"] = int((time.monotonic() - start) * 1000)
+        return section, stats
+
+    def finish_sections(
+        self,
+        sections: List[str],
+        remainder: str,
+        perspective: str = "第一人称",
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        对话结束时收尾：整理预先起草之后剩下的部分，再合并所有段落
+
+        Args:
+            sections: 对话进行中已整理好的各段草稿（按时间顺序）
+            remainder: 还没整理的访谈记录（可能为空）
+
+        Returns:
+            (回忆录内容, 统计信息)
+
+        Raises:
+            MemoirGenerationError: 没有任何一段草稿
+        """
+        stats = self._new_stats("speculative")
+        start = time.monotonic()
+        try:
+            sections = list(sections)
+            if remainder.strip():
+                memoir_progress.stage("drafting", "最后一段")
+                sections.append(self._draft_section(
+                    remainder, perspective,
+                    "这是一次长访谈的最后一段，前面的内容已另外整理，会和这一段合并。",
+                    "remainder", stats,
+                ))
+            sections = [section for section in sections if section]
+            if not sections:
+                raise MemoirGenerationError("没有可合并的草稿")
+            if len(sections) == 1:
+                return sections[0], stats
+            return self._merge(sections, perspective, settings.memoir_agent_token_budget, stats), stats
+        finally:
+            stats["elapsed_ms"] = int((time.monotonic() - start) * 1000)
+
+    @staticmethod
+    def _new_stats(mode: str) -> Dict[str, Any]:
+        return {
+            "mode": mode,
+            "iterations": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "compacted_chars": 0,
+            "budget_exhausted": False,
+            "failed_sections": 0,  # 整理失败、退回原话的段落数
+            "elapsed_ms": 0,
+            "stages": [],  # 每次调用：步骤、模型、耗时、token
+        }
+
+    def _call(
+        self,
+        stage: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]],
+        tool_choice: Any,
+        max_tokens: int,
+        stats: Dict[str, Any],
+    ):
+        """调用一次模型，并把 token 和耗时记到对应步骤（tools 为 None 时普通补全）"""
+        start = time.monotonic()
+        extra = {"tools": tools, "tool_choice": tool_choice} if tools else {}
+        response = llm_gateway.chat_completion(
+            self.client,
+            feature=f"memoir_agent_{stage}",
+            model=model,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=max_tokens,
+            **extra
+        )
+        self._record_stage(stage, model, start, getattr(response, "usage", None), stats)
+        return response
+
+    def _stream_text(
+        self,
+        stage: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        max_tokens: int,
+        stats: Dict[str, Any],
+    ) -> Tuple[str, Optional[str]]:
+        """流式补全（不带工具），每个增量同时推给进度订阅方，返回 (完整文本, finish_reason)"""
+        stats["iterations"] += 1
+        print(f"[MemoirAgent] {stage} ({model}, 流式)")
+        start = time.monotonic()
+        memoir_progress.draft("", reset=True)
+        stream = llm_gateway.chat_completion(
+            self.client,
+            feature=f"memoir_agent_{stage}",
+            model=model,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        parts = []
+        usage = None
+        finish_reason = None
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+                if choice.delta.content:
+                    parts.append(choice.delta.content)
+                    memoir_progress.draft(choice.delta.content)
+        finally:
+            stream.close()
+            memoir_progress.flush()
+        self._record_stage(stage, model, start, usage, stats)
+        return "".join(parts).strip(), finish_reason
+
+    @staticmethod
+    def _record_stage(stage: str, model: str, start: float, usage, stats: Dict[str, Any]):
+        """把一次调用的 token 和耗时记到对应步骤"""
+        prompt_tokens = (usage.prompt_tokens or 0) if usage else 0
+        completion_tokens = (usage.completion_tokens or 0) if usage else 0
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        stats["stages"].append({
+            "stage": stage,
+            "model": model,
+            "ms": int((time.monotonic() - start) * 1000),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        })
+
+    def _call_tool(
+        self,
+        stage: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        tool_name: str,
+        max_tokens: int,
+        stats: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """强制调用指定工具，返回工具参数；模型没走工具而是直接输出文本时放在 "_text" 里"""
+        stats["iterations"] += 1
+        print(f"[MemoirAgent] {stage} ({model})")
+        response = self._call(
+            stage, model, messages,
+            tools=[t for t in TOOLS if t["function"]["name"] == tool_name],
+            tool_choice={"type": "function", "function": {"name": tool_name}},
+            max_tokens=max_tokens,
+            stats=stats,
+        )
+        message = response.choices[0].message
+        for tc in message.tool_calls or []:
+            if tc.function.name == tool_name:
+                args = structured_output.loads(tc.function.arguments)
+                return args if isinstance(args, dict) else {}
+        return {"_text": message.content or ""}
+
+    def _write(
+        self,
+        stage: str,
+        model: str,
+        system: Dict[str, Any],
+        request: str,
+        tool_name: str,
+        stats: Dict[str, Any],
+    ) -> str:
+        """
+        输出一版回忆录正文（草稿 / 修改稿 / 单次生成的成稿）
+
+        有人订阅进度时流式输出纯文本，否则强制调用 draft / finish 工具。
+        """
+        if memoir_progress.active():
+            messages = [system, {"role": "user", "content": f"{request}\n\n{TEXT_OUTPUT_HINT}"}]
+            text, _ = self._stream_text(stage, model, messages, DRAFT_MAX_TOKENS, stats)
+            return text
+
+        messages = [system, {"role": "user", "content": f"{request}\n\n{TOOL_OUTPUT_HINT.format(tool=tool_name)}"}]
+        args = self._call_tool(stage, model, messages, tool_name, DRAFT_MAX_TOKENS, stats)
+        if tool_name == "draft":
+            self._handle_draft(args)
+            return args.get("content") or args.get("_text") or ""
+        return args.get("memoir") or args.get("_text") or ""
+
+    def _run_single_pass(self, transcript: str, perspective: str, stats: Dict[str, Any]) -> str:
+        """短访谈：主模型一次直接完成"""
+        system = {"role": "system", "content": SYSTEM_PROMPT.format(perspective=perspective, transcript=transcript)}
+        memoir_progress.stage("drafting")
+        try:
+            memoir = self._write("finish", self.model, system, "访谈内容不长，请直接完成最终回忆录。", "finish", stats)
+        except Exception as e:
+            print(f"[MemoirAgent] 错误: {e}")
+            raise MemoirGenerationError(str(e)) from e
+        if not memoir:
+            raise MemoirGenerationError("模型未返回内容")
+        return memoir
+
+    def _run_map_reduce(
+        self,
+        transcript: str,
+        perspective: str,
+        token_budget: int,
+        stats: Dict[str, Any],
+    ) -> str:
+        """长访谈：分段并行整理草稿（有限并发），再由主模型合并排序"""
+        segments = segment_transcript(
+            transcript,
+            target_chars=settings.memoir_segment_target_chars,
+            max_chars=settings.memoir_segment_max_chars,
+        )
+        if len(segments) == 1:
+            stats["mode"] = "staged"
+            return self._run_staged(transcript, perspective, token_budget, stats)
+
+        total = len(segments)
+        print(f"[MemoirAgent] 长访谈 {len(transcript)} 字，分 {total} 段并行整理")
+
+        # 每段单独统计，结束后再汇总，避免多线程同时改 stats
+        seg_stats = [self._sub_stats() for _ in segments]
+        workers = max(1, min(settings.memoir_map_reduce_workers, total))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="memoir-map") as pool:
+            futures = [
+                # copy_context 让每段的 LLM 调用带上当前的用户 / 对话上下文
+                pool.submit(copy_context().run, self._draft_segment, i, total, seg, perspective, seg_stats[i])
+                for i, seg in enumerate(segments)
+            ]
+            sections = [f.result() for f in futures]
+
+        for sub in seg_stats:
+            self._add_stats(stats, sub)
+        if stats["failed_sections"] == total:
+            # 每一段都只剩原话，不算生成成功
+            raise MemoirGenerationError(f"{total} 段全部整理失败")
+
+        return self._merge(sections, perspective, token_budget, stats)
+
+    @staticmethod
+    def _sub_stats() -> Dict[str, Any]:
+        """并行子任务各自的统计，结束后用 _add_stats 汇总"""
+        return {"iterations": 0, "prompt_tokens": 0, "completion_tokens": 0, "failed_sections": 0, "stages": []}
+
+    @staticmethod
+    def _add_stats(stats: Dict[str, Any], sub: Dict[str, Any]):
+        stats["iterations"] += sub["iterations"]
+        stats["prompt_tokens"] += sub["prompt_tokens"]
+        stats["completion_tokens"] += sub["completion_tokens"]
+        stats["failed_sections"] += sub["failed_sections"]
+        stats["stages"].extend(sub["stages"])
+
+    def _merge(
+        self,
+        sections: List[str],
+        perspective: str,
+        token_budget: int,
+        stats: Dict[str, Any],
+    ) -> str:
+        """
+        分层合并各段草稿：相邻草稿按 MERGE_BATCH_CHARS 分批，每批由主模型合并成一篇，
+        合并结果再分批合并，直到只剩一篇。
+        超预算、或两段相邻草稿已放不进一批时，剩下的按访谈顺序拼接
+        """
+        memoir_progress.stage("merging")
+        level = [section for section in sections if section]
+        depth = 0
+        while len(level) > 1:
+            batches = self._merge_batches(level)
+            pending = [batch for batch in batches if len(batch) > 1]
+            if not pending:
+                print("[MemoirAgent] 草稿过长，无法再合并，按访谈顺序拼接")
+                break
+            cost = sum(sum(len(section) for section in batch) + MERGE_MAX_TOKENS for batch in pending)
+            if token_budget and stats["prompt_tokens"] + stats["completion_tokens"] + cost > token_budget:
+                stats["budget_exhausted"] = True
+                print("[MemoirAgent] token 预算用完，跳过合并，按访谈顺序拼接")
+                break
+
+            depth += 1
+            print(f"[MemoirAgent] 第 {depth} 层合并：{len(level)} 篇分 {len(batches)} 批")
+            if len(batches) == 1:
+                # 最后一次合并：有人订阅进度时流式输出
+                level = [self._merge_batch(batches[0], perspective, stats, stream=memoir_progress.active())]
+                continue
+
+            sub_stats = [self._sub_stats() for _ in batches]
+            workers = max(1, min(settings.memoir_map_reduce_workers, len(pending)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="memoir-merge") as pool:
+                futures = [
+                    pool.submit(copy_context().run, self._merge_batch, batch, perspective, sub_stats[i])
+                    for i, batch in enumerate(batches)
+                ]
+                level = [f.result() for f in futures]
+            for sub in sub_stats:
+                self._add_stats(stats, sub)
+        return "\n\n".join(level)
+
+    @staticmethod
+    def _merge_batches(sections: List[str]) -> List[List[str]]:
+        """按访谈顺序把相邻草稿分批，每批总字数不超过 MERGE_BATCH_CHARS（单篇超长时自成一批）"""
+        batches, current, size = [], [], 0
+        for section in sections:
+            if current and size + len(section) > MERGE_BATCH_CHARS:
+                batches.append(current)
+                current, size = [], 0
+            current.append(section)
+            size += len(section)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _merge_batch(
+        self,
+        batch: List[str],
+        perspective: str,
+        stats: Dict[str, Any],
+        stream: bool = False,
+    ) -> str:
+        """合并一批草稿；只有一篇时原样返回，失败或输出被截断（finish_reason=length）时按访谈顺序拼接"""
+        fallback = "\n\n".join(batch)
+        if len(batch) == 1:
+            return fallback
+
+        messages = [{"role": "user", "content": memoir_merge.build(batch, perspective)}]
+        try:
+            if stream:
+                merged, finish_reason = self._stream_text("merge", self.model, messages, MERGE_MAX_TOKENS, stats)
+            else:
+                stats["iterations"] += 1
+                print(f"[MemoirAgent] merge ({self.model})")
+                response = self._call(
+                    "merge", self.model, messages,
+                    tools=None, tool_choice=None,
+                    max_tokens=MERGE_MAX_TOKENS,
+                    stats=stats,
+                )
+                choice = response.choices[0]
+                merged, finish_reason = (choice.message.content or "").strip(), choice.finish_reason
+        except Exception as e:
+            print(f"[MemoirAgent] 合并失败，按访谈顺序拼接: {e}")
+            return fallback
+        if finish_reason == "length":
+            print(f"[MemoirAgent] 合并输出达到上限被截断（{len(merged)} 字），按访谈顺序拼接")
+            return fallback
+        return merged or fallback
+
+    def _draft_segment(
+        self,
+        index: int,
+        total: int,
+        segment: str,
+        perspective: str,
+        stats: Dict[str, Any],
+    ) -> str:
+        """整理一段访谈；失败时保留这一段用户的原话，不丢内容（各段并行，不推送草稿增量）"""
+        memoir_progress.stage("drafting", f"第 {index + 1}/{total} 段")
+        return self._draft_section(
+            segment, perspective,
+            f"这是一次长访谈的第 {index + 1}/{total} 段，其他段落会另外整理后合并。",
+            "map", stats,
+        )
+
+    def _draft_section(
+        self,
+        segment: str,
+        perspective: str,
+        position: str,
+        stage: str,
+        stats: Dict[str, Any],
+        keep_raw: bool = True,
+    ) -> str:
+        """
+        整理访谈中的一段（position 说明这段在整场访谈中的位置）
+
+        失败时 keep_raw=True 返回这一段用户的原话（不丢内容），否则返回空字符串
         """
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT.format(perspective=perspective, transcript=segment)},
+            {"role": "user", "content": (
+                f"{position}"
+                "请只整理这一段，不要写开头总述或结尾总结，直接用 draft 输出。"
+            )},
+        ]
+        try:
+            args = self._call_tool(stage, self.model, messages, "draft", DRAFT_MAX_TOKENS, stats)
+            content = args.get("content") or args.get("_text") or ""
+            if content:
+                return content
+        except Exception as e:
+            print(f"[MemoirAgent] {stage} 段落整理失败: {e}")
+        stats["failed_sections"] += 1
+        if not keep_raw:
+            return ""
+        return "\n".join(
+            line[len("用户:"):].strip() for line in segment.split("\n") if line.startswith("用户:")
+        )
+
+    def _run_staged(
+        self,
+        transcript: str,
+        perspective: str,
+        token_budget: int,
+        stats: Dict[str, Any],
+    ) -> str:
+        """固定流水线：分析（快速模型）→ 草稿（主模型）→ 检查（快速模型）→ 按需修改"""
+        system = {"role": "system", "content": SYSTEM_PROMPT.format(perspective=perspective, transcript=transcript)}
+
+        def over_budget() -> bool:
+            if not token_budget:
+                return False
+            spent = stats["prompt_tokens"] + stats["completion_tokens"]
+            if spent + len(transcript) + DRAFT_MAX_TOKENS > token_budget:
+                stats["budget_exhausted"] = True
+                print(f"[MemoirAgent] token 预算用完（已用 {spent}），返回当前草稿")
+                return True
+            return False
+
+        # 1. 分析：失败不影响后续，草稿步骤没有分析结果也能做
+        analysis = ""
+        memoir_progress.stage("analyzing")
+        try:
+            args = self._call_tool("analyze", self.fast_model, [
+                system,
+                {"role": "user", "content": "请先用 analyze 分析这段访谈。"},
+            ], "analyze", ANALYZE_MAX_TOKENS, stats)
+            self._handle_analyze(args)
+            topics = "、".join(str(t) for t in args.get("topics") or [])
+            analysis = (
+                f"主题：{topics or '无'}\n"
+                f"时间线：{args.get('timeline') or '无'}\n"
+                f"结构笔记：{args.get('structure_notes') or '无'}"
+            )
+        except Exception as e:
+            print(f"[MemoirAgent] 分析失败，跳过: {e}")
+
+        # 2. 草稿
+        draft_request = "请整理出回忆录草稿。"
+        if analysis:
+            draft_request = f"分析结果：\n{analysis}\n\n{draft_request}"
+        memoir_progress.stage("drafting")
+        try:
+            current_draft = self._write("draft", self.model, system, draft_request, "draft", stats)
+        except Exception as e:
+            print(f"[MemoirAgent] 错误: {e}")
+            raise MemoirGenerationError(str(e)) from e
+        if not current_draft:
+            raise MemoirGenerationError("模型未返回草稿")
+
+        # 3. 检查 → 修改，最多 memoir_agent_max_revisions 次
+        revisions = 0
+        while True:
+            if over_budget():
+                return current_draft
+            memoir_progress.stage("checking")
+            try:
+                check = self._call_tool("check", self.fast_model, [
+                    system,
+                    {"role": "user", "content": f"当前草稿：\n{current_draft}\n\n请对照访谈记录用 check 检查这版草稿。"},
+                ], "check", CHECK_MAX_TOKENS, stats)
+            except Exception as e:
+                print(f"[MemoirAgent] 检查失败，使用当前草稿: {e}")
+                return current_draft
+
+            result = self._handle_check(check)
+            if result["status"] != "needs_revision" or settings.memoir_agent_max_revisions <= 0:
+                return current_draft
+            if over_budget():
+                return current_draft
+
+            revisions += 1
+            issues = "\n".join(f"- {i}" for i in result.get("issues") or []) or "- （未列出具体问题）"
+            memoir_progress.stage("revising")
+            try:
+                revised = self._write("revise", self.model, system, (
+                    f"上一版草稿：\n{current_draft}\n\n检查发现的问题：\n{issues}\n\n"
+                    "请输出修改后的完整草稿。"
+                ), "draft", stats)
+            except Exception as e:
+                print(f"[MemoirAgent] 修改失败，使用当前草稿: {e}")
+                # 流式输出时前端已清空了上一版，重新推一次
+                memoir_progress.draft(current_draft, reset=True)
+                return current_draft
+            if revised:
+                current_draft = revised
+            else:
+                memoir_progress.draft(current_draft, reset=True)
+            # 最后一次修改后不再检查，检查结果也没有机会处理
+            if revisions >= settings.memoir_agent_max_revisions:
+                return current_draft
+
+    def _run(
+        self,
+        transcript: str,
+        perspective: str,
+        compact: bool,
+        token_budget: int,
+        stats: Dict[str, Any],
+    ) -> str:
+        """Agent 主循环"""
         # 构建初始消息
         system_prompt = SYSTEM_PROMPT.format(
             perspective=perspective,
@@ -206,20 +837,37 @@ class MemoirAgent:
         # Agent 主循环
         current_draft = ""
         iteration = 0
+        compacted = set()  # 已压缩的 tool_call id
 
         while iteration < self.max_iterations:
             iteration += 1
+            stats["iterations"] = iteration
             print(f"[MemoirAgent] 第 {iteration} 轮调用")
 
+            if compact:
+                stats["compacted_chars"] += self._compact(messages, compacted)
+
+            # token 预算：下一轮（输入 + 输出上限）会超出时停止迭代
+            tool_choice: Any = "auto"
+            if token_budget:
+                spent = stats["prompt_tokens"] + stats["completion_tokens"]
+                if spent + self._estimate_tokens(messages) + 4000 > token_budget:
+                    stats["budget_exhausted"] = True
+                    if current_draft:
+                        print(f"[MemoirAgent] token 预算用完（已用 {spent}），返回当前草稿")
+                        return current_draft
+                    # 还没有草稿：强制最后一轮直接 finish
+                    print(f"[MemoirAgent] token 预算用完（已用 {spent}），要求直接完成")
+                    tool_choice = {"type": "function", "function": {"name": "finish"}}
+
             try:
                 # 调用模型
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
+                response = self._call(
+                    "round", self.model, messages,
                     tools=TOOLS,
-                    tool_choice="auto",
-                    temperature=0.7,
-                    max_tokens=4000
+                    tool_choice=tool_choice,
+                    max_tokens=4000,
+                    stats=stats,
                 )
 
                 assistant_message = response.choices[0].message
@@ -245,17 +893,23 @@ class MemoirAgent:
 
                     for tool_call in assistant_message.tool_calls:
                         tool_name = tool_call.function.name
-                        tool_args = json.loads(tool_call.function.arguments)
+                        tool_args = structured_output.loads(tool_call.function.arguments)
+                        if not isinstance(tool_args, dict):
+                            tool_args = {}
 
                         print(f"[MemoirAgent] 调用工具: {tool_name}")
 
                         # 处理不同的工具
                         if tool_name == "analyze":
+                            memoir_progress.stage("analyzing")
                             result = self._handle_analyze(tool_args)
                         elif tool_name == "draft":
                             current_draft = tool_args.get("content", "")
+                            memoir_progress.stage("drafting")
+                            memoir_progress.draft(current_draft, reset=True)
                             result = self._handle_draft(tool_args)
                         elif tool_name == "check":
+                            memoir_progress.stage("checking")
                             result = self._handle_check(tool_args)
                         elif tool_name == "finish":
                             # 完成，返回最终结果
@@ -285,6 +939,10 @@ class MemoirAgent:
                             "content": "请继续处理，使用工具完成任务。"
                         })
 
+                if tool_choice != "auto":
+                    # 强制 finish 后模型仍未完成，不再继续
+                    break
+
             except Exception as e:
                 print(f"[MemoirAgent] 错误: {e}")
                 import traceback
@@ -293,13 +951,58 @@ class MemoirAgent:
                 # 如果有草稿，返回草稿
                 if current_draft:
                     return current_draft
-
-                # 否则返回错误信息
-                return f"（生成失败: {str(e)}）"
+                raise MemoirGenerationError(str(e)) from e
 
         # 达到最大迭代次数
         print(f"[MemoirAgent] 达到最大迭代次数 {self.max_iterations}")
-        return current_draft if current_draft else "（生成超时）"
+        if not current_draft:
+            raise MemoirGenerationError(f"{self.max_iterations} 轮后仍没有草稿")
+        return current_draft
+
+    def _compact(self, messages: List[Dict[str, Any]], compacted: set) -> int:
+        """
+        压缩上下文：只保留最新一次 draft 的全文和最近一次 check 的参数，
+        更早的替换为占位说明（tool_call 结构保持不变，模型仍能看到完整的调用历史）
+
+        Returns:
+            本次省掉的字数
+        """
+        latest = {}
+        for msg in messages:
+            for tc in msg.get("tool_calls") or []:
+                name = tc["function"]["name"]
+                if name in ("draft", "check"):
+                    latest[name] = tc["id"]
+
+        saved = 0
+        version = 0
+        for msg in messages:
+            for tc in msg.get("tool_calls") or []:
+                fn = tc["function"]
+                if fn["name"] == "draft":
+                    version += 1
+                if fn["name"] not in latest or tc["id"] == latest[fn["name"]] or tc["id"] in compacted:
+                    continue
+
+                before = len(fn["arguments"])
+                if fn["name"] == "draft":
+                    stub = {"content": f"（第 {version} 版草稿已被后续版本取代，省略）"}
+                else:
+                    stub = {"needs_revision": True, "issues": ["（已在后续版本处理，省略）"]}
+                fn["arguments"] = json.dumps(stub, ensure_ascii=False)
+                compacted.add(tc["id"])
+                saved += max(0, before - len(fn["arguments"]))
+        return saved
+
+    @staticmethod
+    def _estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+        """粗估输入 token（中文约 1 字 1 token）"""
+        total = 0
+        for msg in messages:
+            total += len(msg.get("content") or "")
+            for tc in msg.get("tool_calls") or []:
+                total += len(tc["function"]["arguments"])
+        return total
 
     def _handle_analyze(self, args: Dict[str, Any]) -> Dict[str, Any]:
         """处理 analyze 工具调用"""
@@ -338,8 +1041,10 @@ class MemoirAgent:
         print(f"[MemoirAgent] 检查 - 内容完整: {preserved}, 风格保持: {kept_style}, 需修改: {needs_revision}")
 
         if needs_revision:
+            # 问题列表回传给模型（截短），旧的检查参数会在压缩时被省略
             return {
                 "status": "needs_revision",
+                "issues": [str(i)[:MAX_ISSUE_CHARS] for i in issues[:MAX_ISSUES]],
                 "message": f"发现 {len(issues)} 个问题，请用 draft 工具修改后再检查。"
             }
         else:
@@ -0,0 +1,283 @@
+"""
+回忆录生成进度
+生成回忆录的任务把进度（当前步骤、草稿增量、完成）发布到这里，
+/memoir/{id}/stream 订阅后用 SSE 推给前端，前端不再需要轮询列表。
+
+- 进度是一份快照（当前步骤、当前草稿全文、出错次数），订阅方用 ProgressCursor
+  对比上次发出的内容，算出要推送的 stage / draft 增量 / error 事件
+- 同进程：生成任务在线程里跑，每次发布用 call_soon_threadsafe 唤醒订阅方，直接读内存里的快照
+- 跨进程：快照同时写进 memoir_progress 表（草稿增量最多每 PERSIST_INTERVAL_SECONDS 写一次，
+  步骤变化、出错、流式输出结束时立即写），其他 worker 的订阅方每 POLL_SECONDS 读一次
+- 当前正在生成哪篇回忆录记在 ContextVar 里，MemoirAgent 直接调 stage()/draft()，
+  不在生成回忆录时（比如对话结束流水线）这些调用什么也不做
+"""
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.database import SessionLocal
+from app.models import MemoirProgressState
+
+# 当前线程 / 协程正在生成的回忆录 ID
+_current_memoir: ContextVar[Optional[str]] = ContextVar("memoir_progress_current", default=None)
+
+# 事件类型
+STAGE = "stage"    # {"stage": analyzing/drafting/checking/revising/merging, "detail": ...}
+DRAFT = "draft"    # {"text": 增量文本, "reset": 是否开始新一版草稿}
+ERROR = "error"    # {"message": ...}，任务队列会重试，不是终止事件
+DONE = "done"      # {"status": ..., "title": ..., "content": ...}
+
+# 草稿增量写库的最小间隔（秒）
+PERSIST_INTERVAL_SECONDS = 0.3
+# 跨进程订阅方读库的间隔（秒）
+POLL_SECONDS = 0.3
+
+# 快照中写库的字段
+_FIELDS = ("version", "stage", "detail", "draft", "draft_round", "error", "error_count")
+
+
+class ProgressCursor:
+    """一个订阅方已经推送到哪里；diff() 对比新快照，返回需要补发的事件"""
+
+    def __init__(self):
+        self.version = -1
+        self._stage: Tuple[str, str] = ("", "")
+        self._draft = ""
+        self._draft_round: Optional[int] = None
+        self._error_count: Optional[int] = None
+
+    def diff(self, state: Dict[str, Any]) -> List[Dict[str, Any]]:
+        events = []
+        self.version = state["version"]
+
+        stage = (state["stage"], state["detail"])
+        if stage != self._stage:
+            self._stage = stage
+            if stage[0]:
+                events.append({"event": STAGE, "data": {"stage": stage[0], "detail": stage[1]}})
+
+        draft = state["draft"]
+        if state["draft_round"] != self._draft_round or not draft.startswith(self._draft):
+            if draft or self._draft:
+                events.append({"event": DRAFT, "data": {"text": draft, "reset": True}})
+        elif len(draft) > len(self._draft):
+            events.append({"event": DRAFT, "data": {"text": draft[len(self._draft):], "reset": False}})
+        self._draft, self._draft_round = draft, state["draft_round"]
+
+        # 订阅之前的出错不补发
+        if self._error_count is not None and state["error_count"] != self._error_count:
+            events.append({"event": ERROR, "data": {"message": state["error"] or ""}})
+        self._error_count = state["error_count"]
+        return events
+
+
+class MemoirProgress:
+    """回忆录生成进度：进程内广播 + 写库供其他进程轮询"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 写库串行化，保证后写入的快照不会被先取的快照覆盖
+        self._persist_lock = threading.Lock()
+        # memoir_id -> 快照（_FIELDS）+ 写库节流信息
+        self._states: Dict[str, Dict[str, Any]] = {}
+        # memoir_id -> [(事件循环, 队列)]
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+    # ---------- 发布（生成任务线程） ----------
+
+    @contextmanager
+    def track(self, memoir_id: str, reset: bool = False):
+        """
+        在此范围内 MemoirAgent 的进度发布到这篇回忆录
+
+        正常结束时删除库里的快照；抛出异常时记一次出错（保留快照，重试时接着用）。
+        reset=True 表示新一次生成（如重新生成），不沿用库里上一次留下的草稿轮次和出错记录
+        """
+        state = self._initial_state(memoir_id, reset)
+        with self._lock:
+            self._states[memoir_id] = state
+        self._persist(memoir_id, force=True)
+        token = _current_memoir.set(memoir_id)
+        try:
+            yield
+        except Exception as e:
+            self.error(memoir_id, str(e))
+            raise
+        else:
+            self._delete(memoir_id)
+        finally:
+            _current_memoir.reset(token)
+            with self._lock:
+                self._states.pop(memoir_id, None)
+
+    def active(self) -> bool:
+        """当前是否在为某篇回忆录发布进度（决定是否走流式调用）"""
+        return _current_memoir.get() is not None
+
+    def stage(self, stage: str, detail: str = ""):
+        memoir_id = _current_memoir.get()
+        if memoir_id is None:
+            return
+        def update(state):
+            state["stage"], state["detail"] = stage, detail
+        self._publish(memoir_id, STAGE, update, force=True)
+
+    def draft(self, text: str, reset: bool = False):
+        """草稿增量；reset=True 表示开始新一版草稿（前端清空后再追加 text）"""
+        memoir_id = _current_memoir.get()
+        if memoir_id is None:
+            return
+        def update(state):
+            if reset:
+                state["draft"] = text
+                state["draft_round"] += 1
+            else:
+                state["draft"] += text
+        self._publish(memoir_id, DRAFT, update, force=False)
+
+    def flush(self):
+        """把节流中还没写库的草稿增量写进去（流式输出结束时调用）"""
+        memoir_id = _current_memoir.get()
+        if memoir_id is not None:
+            self._persist(memoir_id, force=True)
+
+    def error(self, memoir_id: str, message: str):
+        def update(state):
+            state["error"] = message
+            state["error_count"] += 1
+        self._publish(memoir_id, ERROR, update, force=True)
+
+    def done(self, memoir_id: str, status: str, title: str = "", content: str = ""):
+        self._notify(memoir_id, {"event": DONE, "data": {"status": status, "title": title, "content": content}})
+
+    def _publish(self, memoir_id: str, event: str, update, force: bool):
+        with self._lock:
+            state = self._states.get(memoir_id)
+            if state is None:
+                return
+            update(state)
+            state["dirty"] = True
+        self._notify(memoir_id, {"event": event})
+        self._persist(memoir_id, force=force)
+
+    def _notify(self, memoir_id: str, message: Dict[str, Any]):
+        """唤醒本进程的订阅方"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(memoir_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+            except RuntimeError:
+                # 订阅方的事件循环已关闭
+                pass
+
+    # ---------- 写库 ----------
+
+    def _initial_state(self, memoir_id: str, reset: bool = False) -> Dict[str, Any]:
+        """新一次生成的快照；沿用库里的版本号，重试时（reset=False）还沿用草稿轮次和出错次数"""
+        state = {
+            "version": 0, "stage": "", "detail": "", "draft": "", "draft_round": 0,
+            "error": None, "error_count": 0, "persisted_at": 0.0, "dirty": True,
+        }
+        db = SessionLocal()
+        try:
+            row = db.query(
+                MemoirProgressState.version, MemoirProgressState.draft_round,
+                MemoirProgressState.error, MemoirProgressState.error_count,
+            ).filter(MemoirProgressState.memoir_id == memoir_id).first()
+            if row:
+                # 版本号始终递增，订阅方据此判断快照是否有变化
+                state["version"] = row.version
+                if not reset:
+                    state.update(draft_round=row.draft_round + 1, error=row.error, error_count=row.error_count)
+        except Exception as e:
+            print(f"[MemoirProgress] 读取进度失败: {e}")
+        finally:
+            db.close()
+        return state
+
+    def _persist(self, memoir_id: str, force: bool):
+        """快照有改动时写库；force=False 时距上次写入不到 PERSIST_INTERVAL_SECONDS 就先不写"""
+        with self._persist_lock:
+            now = time.monotonic()
+            with self._lock:
+                state = self._states.get(memoir_id)
+                if state is None or not state["dirty"]:
+                    return
+                if not force and now - state["persisted_at"] < PERSIST_INTERVAL_SECONDS:
+                    return
+                state["version"] += 1
+                state["persisted_at"] = now
+                state["dirty"] = False
+                values = {key: state[key] for key in _FIELDS}
+
+            db = SessionLocal()
+            try:
+                updated = db.query(MemoirProgressState).filter(
+                    MemoirProgressState.memoir_id == memoir_id
+                ).update(values, synchronize_session=False)
+                if not updated:
+                    db.add(MemoirProgressState(memoir_id=memoir_id, **values))
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"[MemoirProgress] 写入进度失败: {e}")
+            finally:
+                db.close()
+
+    def _delete(self, memoir_id: str):
+        with self._persist_lock:
+            db = SessionLocal()
+            try:
+                db.query(MemoirProgressState).filter(
+                    MemoirProgressState.memoir_id == memoir_id
+                ).delete(synchronize_session=False)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"[MemoirProgress] 删除进度失败: {e}")
+            finally:
+                db.close()
+
+    # ---------- 订阅（事件循环） ----------
+
+    def subscribe(self, memoir_id: str) -> asyncio.Queue:
+        """
+        订阅一篇回忆录的进度（须在事件循环里调用）
+
+        本进程发布进度时往队列里放一条唤醒消息（done 消息带完整结果），
+        进度内容用 local_state() / load_state() 读快照，交给 ProgressCursor 算增量
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers.setdefault(memoir_id, []).append((loop, queue))
+        return queue
+
+    def unsubscribe(self, memoir_id: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(memoir_id, [])
+            subscribers[:] = [(l, q) for l, q in subscribers if q is not queue]
+            if not subscribers:
+                self._subscribers.pop(memoir_id, None)
+
+    def local_state(self, memoir_id: str) -> Optional[Dict[str, Any]]:
+        """本进程正在生成时的内存快照，否则 None"""
+        with self._lock:
+            state = self._states.get(memoir_id)
+            return {key: state[key] for key in _FIELDS} if state else None
+
+    def load_state(self, memoir_id: str) -> Optional[Dict[str, Any]]:
+        """库里的快照（其他进程在生成）；没有时返回 None（同步查询，在线程池里调用）"""
+        db = SessionLocal()
+        try:
+            row = db.query(MemoirProgressState).filter(MemoirProgressState.memoir_id == memoir_id).first()
+            return {key: getattr(row, key) for key in _FIELDS} if row else None
+        finally:
+            db.close()
+
+
+memoir_progress = MemoirProgress()
@@ -1,21 +1,18 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from app.models import Memoir, Conversation, Message, User
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, defer
+from typing import List, Optional, Tuple
+from datetime import datetime
+from app.models import Memoir, Conversation, User
 from app.services.llm_service import llm_service
 from app.services.memoir_agent import memoir_agent
+from app.services.rolling_digest import rolling_digest
+from app.services.transcript_service import transcript_service
 
 
 class MemoirService:
     def _get_conversation_text(self, db: Session, conversation_id: str) -> str:
         """获取对话文本"""
-        messages = db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(Message.created_at).all()
-
-        return "\n".join([
-            f"{'用户' if msg.role == 'user' else '记录师'}: {msg.content}"
-            for msg in messages
-        ])
+        return transcript_service.text(db, conversation_id)
 
     def create_generating(
         self,
@@ -92,9 +89,14 @@ class MemoirService:
         # 获取对话文本
         conversation_text = self._get_conversation_text(db, conversation_id)
 
+        # 对话进行中维护过滚动摘要的，标题和时间段直接从摘要里取
+        digest = rolling_digest.fold(db, conversation_id) if conversation_text.strip() else None
+
         # 生成标题（如果没有提供）
         if not title:
-            if conversation_text.strip():
+            if digest and digest.get("title"):
+                title = digest["title"]
+            elif conversation_text.strip():
                 title = llm_service.generate_title(conversation_text)
             else:
                 title = "新回忆"
@@ -111,10 +113,25 @@ class MemoirService:
 
         # 推断时间段
         time_info = {"year_start": None, "year_end": None, "time_period": ""}
-        if conversation_text.strip():
+        if digest and digest.get("time_period"):
+            time_info = {k: digest.get(k) for k in time_info}
+            print(f"[Memoir] 滚动摘要时间段: {time_info}")
+        elif conversation_text.strip():
             time_info = llm_service.infer_time_period(conversation_text, birth_year)
             print(f"[Memoir] 推断时间段: {time_info}")
 
+        return self.create_completed(db, user_id, conversation_id, title, content, time_info)
+
+    def create_completed(
+        self,
+        db: Session,
+        user_id: str,
+        conversation_id: str,
+        title: str,
+        content: str,
+        time_info: dict,
+    ) -> Memoir:
+        """保存一篇已生成好内容的回忆录"""
         # 获取现有回忆录数量，用于排序
         count = db.query(Memoir).filter(Memoir.user_id == user_id).count()
 
@@ -144,6 +161,76 @@ class MemoirService:
             Memoir.deleted_at == None,
         ).order_by(Memoir.order_index).all()
 
+    def get_user_memoirs_with_times(
+        self,
+        db: Session,
+        user_id: str,
+        include_deleted: bool = False,
+        with_content: bool = False,
+        after: Optional[Tuple[int, str]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[Memoir, Optional[datetime], Optional[datetime]]]:
+        """
+        回忆录列表 + 关联对话的首末消息时间（一次查询，不加载对话和消息）
+
+        按 (order_index, id) 排序；分页时 after 传上一页最后一条的 (order_index, id)
+
+        Returns:
+            [(memoir, 对话开始时间, 对话结束时间)]
+        """
+        query = db.query(
+            Memoir, Conversation.first_message_at, Conversation.last_message_at
+        ).outerjoin(
+            Conversation, Conversation.id == Memoir.conversation_id
+        ).filter(Memoir.user_id == user_id)
+        if not include_deleted:
+            query = query.filter(Memoir.deleted_at == None)
+        if not with_content:
+            query = query.options(defer(Memoir.content))
+        if after:
+            order_index, memoir_id = after
+            query = query.filter(or_(
+                Memoir.order_index > order_index,
+                and_(Memoir.order_index == order_index, Memoir.id > memoir_id),
+            ))
+        query = query.order_by(Memoir.order_index, Memoir.id)
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
+    def get_user_memoir_list(
+        self,
+        db: Session,
+        user_id: str,
+        after: Optional[Tuple[int, str]] = None,
+        limit: Optional[int] = None,
+    ) -> list:
+        """
+        用户回忆录列表（只查列表展示用的列 + 关联对话的首末消息时间）
+
+        按 (order_index, id) 排序；分页时 after 传上一页最后一条的 (order_index, id)
+        """
+        query = db.query(
+            Memoir.id, Memoir.title, Memoir.status, Memoir.order_index,
+            Memoir.year_start, Memoir.year_end, Memoir.time_period,
+            Conversation.first_message_at, Conversation.last_message_at,
+        ).outerjoin(
+            Conversation, Conversation.id == Memoir.conversation_id
+        ).filter(
+            Memoir.user_id == user_id,
+            Memoir.deleted_at == None,
+        )
+        if after:
+            order_index, memoir_id = after
+            query = query.filter(or_(
+                Memoir.order_index > order_index,
+                and_(Memoir.order_index == order_index, Memoir.id > memoir_id),
+            ))
+        query = query.order_by(Memoir.order_index, Memoir.id)
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
     def get_memoir(self, db: Session, memoir_id: str) -> Optional[Memoir]:
         """获取单个回忆录章节"""
         return db.query(Memoir).filter(
@@ -208,6 +295,7 @@ class MemoirService:
 
         # 更新回忆录
         memoir.content = content
+        memoir.status = "completed"
         db.commit()
         db.refresh(memoir)
 
@@ -0,0 +1,248 @@
+"""
+对话进行中预先起草回忆录
+实时对话每保存 N 条消息（或用户停顿较久）时，在后台把还没整理的新内容整理成一段草稿，
+存在 conversations.speculation 里。对话结束时只需整理最后剩下的几轮，再把各段合并，
+用户说完再见后等回忆录的时间从一整次 Agent 运行缩短为"最后一段 + 合并"。
+
+speculation 结构：
+    {
+        "covered": 已整理的消息条数（按时间顺序的前 N 条）,
+        "last_message_id": 第 N 条消息的 ID（对不上说明消息有变化，草稿作废）,
+        "sections": [各段草稿],
+        "rounds": 起草次数, "prompt_tokens": ..., "completion_tokens": ..., "ms": 起草总耗时,
+        "updated_at": ...,
+        "final": 对话结束时的收尾统计（未开启预先起草的对话也会记录，用于对比）
+    }
+
+只在 memoir_speculation_enabled 开启时触发；任务走任务队列低优先级，同一对话同时只起草一段。
+"""
+import asyncio
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Conversation, User
+from app.services.job_queue import job_queue, PRIORITY_LOW
+from app.services.llm_ledger import llm_context
+from app.services.memoir_agent import memoir_agent
+from app.services.transcript_service import Transcript, transcript_service
+
+
+@contextmanager
+def _session():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _percentile(values: List[int], pct: float) -> Optional[int]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class MemoirSpeculation:
+    """实时对话中的回忆录预先起草"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}  # conversation_id -> 上次触发后新保存的消息数
+
+    # ---------- 触发（实时对话） ----------
+
+    async def on_message_saved(self, conversation_id: str):
+        """实时对话保存一条消息后调用，累计到 N 条触发一次起草"""
+        if not settings.memoir_speculation_enabled or not conversation_id:
+            return
+        with self._lock:
+            count = self._counts.get(conversation_id, 0) + 1
+            trigger = count >= settings.memoir_speculation_every_messages
+            self._counts[conversation_id] = 0 if trigger else count
+        if trigger:
+            await self._enqueue(conversation_id, "messages")
+
+    async def watch_pause(self, conversation_id: str):
+        """停顿计时：每保存一条消息重新开始，超过 memoir_speculation_pause_seconds 触发一次起草"""
+        if not settings.memoir_speculation_enabled or not conversation_id:
+            return
+        await asyncio.sleep(settings.memoir_speculation_pause_seconds)
+        with self._lock:
+            self._counts[conversation_id] = 0
+        await self._enqueue(conversation_id, "pause")
+
+    def forget(self, conversation_id: str):
+        """实时连接断开时清理计数"""
+        with self._lock:
+            self._counts.pop(conversation_id, None)
+
+    async def _enqueue(self, conversation_id: str, reason: str):
+        try:
+            await job_queue.aenqueue(
+                "memoir_speculate",
+                {"conversation_id": conversation_id, "reason": reason},
+                priority=PRIORITY_LOW,
+                dedup_key=f"memoir_speculate:{conversation_id}",
+                max_attempts=1,
+            )
+        except Exception as e:
+            print(f"[Speculation] 入队失败: {e}")
+
+    # ---------- 起草（任务队列） ----------
+
+    def speculate(self, conversation_id: str):
+        """把还没整理的新内容整理成一段草稿"""
+        with _session() as db:
+            conversation = db.query(
+                Conversation.user_id, Conversation.status, Conversation.speculation
+            ).filter(Conversation.id == conversation_id).first()
+            if not conversation or conversation.status != "active":
+                return
+            # 信息收集阶段的对话结束后不生成回忆录
+            user = db.query(User.profile_completed).filter(User.id == conversation.user_id).first()
+            if not user or not user.profile_completed:
+                return
+            transcript = transcript_service.get(db, conversation_id)
+
+        state = self._valid_state(conversation.speculation, transcript) or {
+            "covered": 0, "last_message_id": None, "sections": [],
+            "rounds": 0, "prompt_tokens": 0, "completion_tokens": 0, "ms": 0,
+        }
+        start = state["covered"]
+
+        # 只整理到最后一条记录师发言之前：记录师的提问和用户接下来的回答留在同一段
+        end = max((i for i in range(start, len(transcript)) if transcript.roles[i] != "user"), default=start)
+        text = transcript.slice(start, end)
+        if len(text) < settings.memoir_speculation_min_chars:
+            return
+
+        print(f"[Speculation] 预先起草 {conversation_id}: 第 {start + 1}-{end} 条消息, {len(text)} 字")
+        with llm_context(user_id=conversation.user_id, conversation_id=conversation_id):
+            section, stats = memoir_agent.draft_section(text)
+        if not section:
+            # 起草失败不记录，留给对话结束时整理
+            return
+
+        state["covered"] = end
+        state["last_message_id"] = transcript.message_ids[end - 1]
+        state["sections"] = state["sections"] + [section]
+        state["rounds"] += 1
+        state["prompt_tokens"] += stats["prompt_tokens"]
+        state["completion_tokens"] += stats["completion_tokens"]
+        state["ms"] += stats["elapsed_ms"]
+        state["updated_at"] = datetime.utcnow().isoformat()
+
+        with _session() as db:
+            # 对话已结束就不再写入（结束流水线可能已经读过旧状态）；不改动 updated_at
+            db.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation_id, Conversation.status == "active")
+                .values(speculation=state, updated_at=Conversation.updated_at)
+            )
+            db.commit()
+
+    @staticmethod
+    def _valid_state(state: Optional[Dict[str, Any]], transcript: Transcript) -> Optional[Dict[str, Any]]:
+        """已有草稿和当前消息对得上时返回（副本），否则返回 None"""
+        if not state or not state.get("sections"):
+            return None
+        covered = state.get("covered") or 0
+        if covered <= 0 or covered > len(transcript) or transcript.message_ids[covered - 1] != state.get("last_message_id"):
+            return None
+        return dict(state)
+
+    # ---------- 对话结束 ----------
+
+    def usable(self, state: Optional[Dict[str, Any]], transcript: Transcript) -> Optional[Tuple[List[str], str]]:
+        """
+        对话结束时能否用预先起草的结果
+
+        Returns:
+            (已整理的各段, 剩下没整理的访谈记录)；没有可用结果时返回 None
+        """
+        state = self._valid_state(state, transcript)
+        if not state:
+            return None
+        return state["sections"], transcript.slice(state["covered"])
+
+    def record_final(
+        self,
+        db: Session,
+        conversation_id: str,
+        mode: str,
+        end_to_memoir_ms: Optional[int],
+        memoir_ms: int,
+        prompt_tokens: int,
+        completion_tokens: int,
+    ):
+        """记录对话结束后生成回忆录的耗时和 token（mode: speculative / full），用于对比"""
+        conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+        if not conversation:
+            return
+        state = dict(conversation.speculation or {})
+        state["final"] = {
+            "mode": mode,
+            "end_to_memoir_ms": end_to_memoir_ms,
+            "memoir_ms": memoir_ms,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            # 总 token 包括对话进行中起草用掉的
+            "total_tokens": prompt_tokens + completion_tokens
+                + (state.get("prompt_tokens") or 0) + (state.get("completion_tokens") or 0),
+        }
+        db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(speculation=state, updated_at=Conversation.updated_at)
+        )
+        db.commit()
+        print(f"[Speculation] {conversation_id} 收尾: {state['final']}")
+
+    def report(self, db: Session, days: int = 7) -> Dict[str, Any]:
+        """最近 N 天开启 / 未开启预先起草的对话，对话结束到回忆录完成的耗时和总 token 对比"""
+        since = datetime.utcnow() - timedelta(days=days)
+        rows = db.query(Conversation.speculation).filter(
+            Conversation.created_at >= since,
+            Conversation.speculation.isnot(None),
+        ).all()
+
+        groups: Dict[str, Dict[str, List[int]]] = {}
+        for (state,) in rows:
+            final = (state or {}).get("final")
+            if not final:
+                continue
+            group = groups.setdefault(final["mode"], {"latency": [], "memoir": [], "tokens": [], "rounds": []})
+            if final.get("end_to_memoir_ms") is not None:
+                group["latency"].append(final["end_to_memoir_ms"])
+            group["memoir"].append(final.get("memoir_ms") or 0)
+            group["tokens"].append(final.get("total_tokens") or 0)
+            group["rounds"].append(state.get("rounds") or 0)
+
+        result = {}
+        for mode, group in groups.items():
+            n = len(group["memoir"])
+            result[mode] = {
+                "conversations": n,
+                "end_to_memoir_p50_ms": _percentile(group["latency"], 0.5),
+                "end_to_memoir_p90_ms": _percentile(group["latency"], 0.9),
+                "avg_memoir_ms": sum(group["memoir"]) // n,
+                "avg_total_tokens": sum(group["tokens"]) // n,
+                "avg_speculation_rounds": round(sum(group["rounds"]) / n, 1),
+            }
+        return {"days": days, "enabled": settings.memoir_speculation_enabled, "modes": result}
+
+
+memoir_speculation = MemoirSpeculation()
+
+
+@job_queue.handler("memoir_speculate")
+def _run_speculation(payload: dict):
+    memoir_speculation.speculate(payload["conversation_id"])
@@ -0,0 +1,297 @@
+"""
+对话结束后的处理流水线（DAG）
+
+    context ──┬── digest ────────┐
+              └── memoir_content ┴── save_memoir ── topics
+
+- context：只读一次对话记录（以及出生年份、是否已有回忆录）
+- digest：摘要、主题标签、标题、时间段；对话进行中维护过滚动摘要的（见 rolling_digest），
+  只把最后几轮合并进去，否则一次 LLM 调用读整段对话，与回忆录 Agent 并行
+- memoir_content：回忆录 Agent，整条链路的耗时基本就是它的耗时；
+  对话进行中已预先起草过的（见 memoir_speculation），只整理剩下的部分再合并
+- save_memoir：两者都完成后保存回忆录
+- topics：按已完成回忆录数量生成 / 审查话题池
+
+每个节点在线程池里运行，使用自己的数据库会话。
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from contextvars import copy_context
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from openai import OpenAI
+from pydantic import BaseModel
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Conversation, Memoir, User
+from app.services.llm_cache import llm_cache
+from app.services.llm_service import llm_service
+from app.services.memoir_agent import memoir_agent
+from app.services.memoir_service import memoir_service
+from app.services.memoir_speculation import memoir_speculation
+from app.services.rolling_digest import rolling_digest
+from app.services.summary_service import summary_service
+from app.services.topic_service import topic_service
+from app.services.transcript_service import transcript_service
+
+# 对话文本少于此字数时不生成摘要（与 summary_service 一致）
+MIN_DIGEST_CHARS = 50
+
+# (节点名, 函数, 依赖的节点名)；函数入参为 {依赖名: 依赖结果}
+DagNode = Tuple[str, Callable[[Dict[str, Any]], Any], Tuple[str, ...]]
+
+
+class ConversationDigest(BaseModel):
+    summary: str = ""
+    topics: List[str] = []
+    title: str = ""
+    year_start: Optional[int] = None
+    year_end: Optional[int] = None
+    time_period: Optional[str] = ""
+
+
+@contextmanager
+def _session():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def run_dag(nodes: List[DagNode], max_workers: int = 4, tag: str = "DAG") -> Tuple[Dict[str, Any], List[str]]:
+    """
+    按依赖关系并行执行节点，依赖全部完成后立即调度
+
+    节点抛异常时结果记为 None 并继续执行下游（下游自行处理 None）。
+
+    Returns:
+        ({节点名: 结果}, 失败的节点名列表)
+    """
+    pending = {name: (fn, deps) for name, fn, deps in nodes}
+    results: Dict[str, Any] = {}
+    failed: List[str] = []
+    timings: Dict[str, int] = {}
+    running = {}
+    start = time.monotonic()
+
+    def timed(name, fn, inputs):
+        t = time.monotonic()
+        try:
+            return fn(inputs)
+        finally:
+            timings[name] = int((time.monotonic() - t) * 1000)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="post-conv") as pool:
+        while pending or running:
+            for name, (fn, deps) in list(pending.items()):
+                if all(d in results for d in deps):
+                    inputs = {d: results[d] for d in deps}
+                    # copy_context 让节点里的 LLM 调用带上当前的用户 / 对话上下文
+                    running[pool.submit(copy_context().run, timed, name, fn, inputs)] = name
+                    del pending[name]
+
+            if not running:
+                # 剩下的节点依赖不存在的节点，无法执行
+                print(f"[{tag}] 无法调度的节点: {list(pending)}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    print(f"[{tag}] 节点 {name} 失败: {e}")
+                    import traceback
+                    traceback.print_exc()
+                    results[name] = None
+                    failed.append(name)
+
+    total = int((time.monotonic() - start) * 1000)
+    detail = ", ".join(f"{n}={ms}ms" for n, ms in timings.items())
+    print(f"[{tag}] 完成，总耗时 {total}ms ({detail})")
+    return results, failed
+
+
+class PostConversationPipeline:
+    """对话结束后：摘要 + 回忆录 + 话题池"""
+
+    def __init__(self):
+        self.client = OpenAI(
+            api_key=settings.dashscope_api_key,
+            base_url=settings.dashscope_base_url
+        )
+        self.model = settings.dashscope_model
+
+    def run(self, conversation_id: str, user_id: str, ended_at: Optional[float] = None) -> Dict[str, Any]:
+        """
+        执行流水线；回忆录没能生成 / 保存时抛异常，由任务队列重试（已保存的部分不会重复）
+
+        Args:
+            ended_at: 用户结束对话的时间（time.time()），用于统计结束到回忆录完成的耗时
+        """
+        results, failed = run_dag([
+            ("context", lambda _: self._load_context(conversation_id, user_id), ()),
+            ("digest", lambda r: self._digest(conversation_id, r["context"]), ("context",)),
+            ("memoir_content", lambda r: self._memoir_content(r["context"]), ("context",)),
+            ("save_memoir", lambda r: self._save_memoir(
+                conversation_id, user_id, r["context"], r["digest"], r["memoir_content"], ended_at
+            ), ("context", "digest", "memoir_content")),
+            ("topics", lambda r: self._topics(user_id), ("save_memoir",)),
+        ], tag="PostConversation")
+
+        critical = [n for n in failed if n in ("context", "memoir_content", "save_memoir")]
+        if critical:
+            raise RuntimeError(f"对话结束流水线失败: {', '.join(critical)}")
+        return results
+
+    # ---------- 节点 ----------
+
+    def _load_context(self, conversation_id: str, user_id: str) -> Dict[str, Any]:
+        """读取对话文本（只读一次，后续节点共用）"""
+        with _session() as db:
+            transcript = transcript_service.get(db, conversation_id)
+            speculation = db.query(Conversation.speculation).filter(
+                Conversation.id == conversation_id
+            ).scalar()
+            user = db.query(User.birth_year).filter(User.id == user_id).first()
+            has_memoir = db.query(Memoir.id).filter(
+                Memoir.conversation_id == conversation_id
+            ).first() is not None
+
+        return {
+            "text": transcript.text,
+            "birth_year": user.birth_year if user else None,
+            "has_memoir": has_memoir,
+            "speculation": memoir_speculation.usable(speculation, transcript),
+        }
+
+    def _digest(self, conversation_id: str, context: Dict[str, Any]) -> Optional[ConversationDigest]:
+        """一次调用生成摘要、主题标签、标题、时间段，并写回对话"""
+        from app.prompts import conversation_digest
+
+        text = context["text"]
+        if len(text) < MIN_DIGEST_CHARS:
+            return None
+
+        # 优先用滚动摘要：只需合并还没合并的最后几轮
+        with _session() as db:
+            rolled = rolling_digest.fold(db, conversation_id, birth_year=context["birth_year"])
+        if rolled and rolled.get("summary"):
+            digest = ConversationDigest(**{k: rolled.get(k) for k in ConversationDigest.model_fields})
+            print(f"[PostConversation] 滚动摘要: {digest.summary[:50]}... 标签: {digest.topics} 标题: {digest.title}")
+            with _session() as db:
+                summary_service.save(db, conversation_id, digest.summary, digest.topics)
+            return digest
+
+        try:
+            digest = llm_cache.complete(
+                self.client,
+                feature="conversation_digest",
+                version=conversation_digest.VERSION,
+                model=self.model,
+                prompt=conversation_digest.build(text, context["birth_year"]),
+                temperature=0.3,
+                max_tokens=600,
+                schema=ConversationDigest,
+            )
+        except Exception as e:
+            # 合并调用失败时退回单独生成摘要，标题和时间段在保存回忆录时单独补
+            print(f"[PostConversation] 合并摘要失败，改为单独调用: {e}")
+            with _session() as db:
+                summary_service.generate_summary(db, conversation_id)
+            return None
+
+        print(f"[PostConversation] 摘要: {digest.summary[:50]}... 标签: {digest.topics} 标题: {digest.title}")
+        with _session() as db:
+            summary_service.save(db, conversation_id, digest.summary, digest.topics)
+        return digest
+
+    def _memoir_content(self, context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """回忆录 Agent（已有回忆录时跳过），返回 {"content", "mode", "stats"}"""
+        if context["has_memoir"]:
+            print("[PostConversation] 该对话已有回忆录，跳过自动生成")
+            return None
+        if not context["text"].strip():
+            return {"content": "（对话内容为空）", "mode": "full", "stats": None}
+
+        if context["speculation"]:
+            sections, remainder = context["speculation"]
+            print(f"[PostConversation] 使用预先起草的 {len(sections)} 段，剩余 {len(remainder)} 字")
+            content, stats = memoir_agent.finish_sections(sections, remainder)
+            return {"content": content, "mode": "speculative", "stats": stats}
+
+        content, stats = memoir_agent.generate_with_stats(context["text"])
+        return {"content": content, "mode": "full", "stats": stats}
+
+    def _save_memoir(
+        self,
+        conversation_id: str,
+        user_id: str,
+        context: Dict[str, Any],
+        digest: Optional[ConversationDigest],
+        result: Optional[Dict[str, Any]],
+        ended_at: Optional[float],
+    ) -> Optional[str]:
+        if result is None:
+            return None
+        content = result["content"]
+
+        text = context["text"]
+        if digest and digest.title:
+            title = digest.title.strip().strip('"“”')
+            time_info = {
+                "year_start": digest.year_start,
+                "year_end": digest.year_end,
+                "time_period": digest.time_period or "",
+            }
+        else:
+            # 没有合并结果（对话太短或调用失败）：单独生成标题和时间段
+            title = llm_service.generate_title(text) if text.strip() else "新回忆"
+            time_info = {"year_start": None, "year_end": None, "time_period": ""}
+            if text.strip():
+                time_info = llm_service.infer_time_period(text, context["birth_year"])
+
+        with _session() as db:
+            memoir = memoir_service.create_completed(db, user_id, conversation_id, title, content, time_info)
+            print(f"[PostConversation] 回忆录已保存: {memoir.id} {title} {time_info}")
+
+            stats = result["stats"]
+            if stats:
+                try:
+                    memoir_speculation.record_final(
+                        db, conversation_id, result["mode"],
+                        end_to_memoir_ms=int((time.time() - ended_at) * 1000) if ended_at else None,
+                        memoir_ms=stats["elapsed_ms"],
+                        prompt_tokens=stats["prompt_tokens"],
+                        completion_tokens=stats["completion_tokens"],
+                    )
+                except Exception as e:
+                    print(f"[PostConversation] 记录回忆录耗时失败: {e}")
+            return memoir.id
+
+    def _topics(self, user_id: str):
+        """根据已完成回忆录数量决定话题池操作"""
+        with _session() as db:
+            completed_memoir_count = db.query(Memoir).filter(
+                Memoir.user_id == user_id,
+                Memoir.status == "completed",
+                Memoir.deleted_at == None,
+            ).count()
+
+            if completed_memoir_count == 1:
+                # 刚完成第一篇回忆录，首次生成个性化话题
+                print("[PostConversation] 用户完成第一篇回忆录，生成个性化话题")
+                user = db.query(User).filter(User.id == user_id).first()
+                if user:
+                    topic_service.generate_topic_options(db, user)
+            elif completed_memoir_count > 1:
+                # 已有多篇回忆录，审查话题池
+                topic_service.review_topic_pool_async(user_id)
+            # completed_memoir_count == 0: 回忆录生成失败，不处理话题
+
+
+post_conversation = PostConversationPipeline()
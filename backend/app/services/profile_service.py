@@ -3,13 +3,26 @@
 - 从对话中提取用户基础信息
 - 更新用户资料
 """
-import json
 from typing import Optional, Dict
 from sqlalchemy.orm import Session
 from openai import OpenAI
+from pydantic import BaseModel
 
+from app.auth import auth_cache, bump_auth_version
 from app.config import settings
-from app.models import User, Conversation, Message
+from app.models import User, Conversation
+from app.services.llm_cache import llm_cache
+from app.services.job_queue import job_queue, PRIORITY_HIGH
+from app.services.rolling_digest import rolling_digest
+from app.services.transcript_service import transcript_service
+
+
+class ProfileExtractionResult(BaseModel):
+    preferred_name: Optional[str] = None
+    birth_year: Optional[int] = None
+    hometown: Optional[str] = None
+    main_city: Optional[str] = None
+    has_enough_info: bool = False
 
 
 def auto_set_preferred_name(user):
@@ -36,7 +49,26 @@ class ProfileService:
         )
         self.model = settings.dashscope_model
 
-    def extract_and_update_profile(self, db: Session, conversation_id: str, user_id: str) -> bool:
+    def _extract_from_transcript(self, db: Session, conversation_id: str, nickname: Optional[str], cache: bool) -> Dict:
+        """读整段对话，用 LLM 提取用户信息"""
+        conversation_text = transcript_service.text(db, conversation_id)
+
+        from app.prompts import profile_extraction
+        prompt = profile_extraction.build(conversation_text, nickname=nickname)
+
+        return llm_cache.complete(
+            self.client,
+            feature="profile_extraction",
+            version=profile_extraction.VERSION,
+            model=self.model,
+            prompt=prompt,
+            temperature=0.1,
+            max_tokens=200,
+            cache=cache,
+            schema=ProfileExtractionResult,
+        ).model_dump()
+
+    def extract_and_update_profile(self, db: Session, conversation_id: str, user_id: str, cache: bool = True) -> bool:
         """
         从对话中提取用户信息并更新数据库
 
@@ -45,12 +77,7 @@ class ProfileService:
         """
         print(f"[Profile] 开始从对话 {conversation_id} 提取用户信息")
 
-        # 获取对话消息
-        messages = db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(Message.created_at).all()
-
-        if not messages:
+        if not len(transcript_service.get(db, conversation_id)):
             print(f"[Profile] 对话消息为空")
             return False
 
@@ -60,34 +87,13 @@ class ProfileService:
             print(f"[Profile] 用户不存在: {user_id}")
             return False
 
-        # 构建对话文本
-        conversation_text = "\n".join([
-            f"{'用户' if msg.role == 'user' else '记录师'}: {msg.content}"
-            for msg in messages
-        ])
-
-        # 使用 LLM 提取信息
-        from app.prompts import profile_extraction
-        prompt = profile_extraction.build(conversation_text, nickname=user.nickname)
-
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1,
-                max_tokens=200
-            )
-
-            content = response.choices[0].message.content.strip()
-
-            # 处理可能的 markdown 代码块
-            if content.startswith("```"):
-                content = content.split("```")[1]
-                if content.startswith("json"):
-                    content = content[4:]
-                content = content.strip()
-
-            result = json.loads(content)
+            # 优先用滚动摘要里已经提取的信息：只需合并最后几轮
+            digest = rolling_digest.fold(db, conversation_id, nickname=user.nickname) if cache else None
+            if digest is not None:
+                result = {k: digest.get(k) for k in ProfileExtractionResult.model_fields}
+            else:
+                result = self._extract_from_transcript(db, conversation_id, user.nickname, cache)
             print(f"[Profile] 提取结果: {result}")
 
             updated = False
@@ -127,7 +133,9 @@ class ProfileService:
             # 如果收集到了足够信息，标记为完成（需要有称呼）
             if result.get("has_enough_info") or user.preferred_name:
                 user.profile_completed = True
+                bump_auth_version(user)
                 db.commit()
+                auth_cache.invalidate(user.id)
                 print(f"[Profile] 用户信息收集完成")
 
                 # 异步生成时代记忆
@@ -172,78 +180,78 @@ class ProfileService:
         }
 
     def _generate_era_memories_async(self, user_id: str, birth_year: int, hometown: str = None, main_city: str = None):
-        """异步生成时代记忆"""
-        import threading
+        """异步生成时代记忆（任务队列）"""
+        job_queue.enqueue(
+            "era_memories",
+            {"user_id": user_id, "birth_year": birth_year, "hometown": hometown, "main_city": main_city},
+            dedup_key=f"era_memories:{user_id}",
+        )
 
-        def _generate():
-            from app.database import SessionLocal
-            from app.services.llm_service import llm_service
+    def _generate_era_memories(
+        self, user_id: str, birth_year: int, hometown: str = None, main_city: str = None, lane: str = None
+    ) -> Optional[str]:
+        """生成并保存时代记忆；失败时标记状态后抛出，由任务队列重试"""
+        from app.database import SessionLocal
+        from app.services.llm_service import llm_service
+        from app.services.llm_ledger import llm_context
 
-            db = SessionLocal()
-            try:
-                # 标记为生成中
-                user = db.query(User).filter(User.id == user_id).first()
-                if user:
-                    user.era_memories_status = 'generating'
-                    db.commit()
+        db = SessionLocal()
+        try:
+            # 标记为生成中
+            user = db.query(User).filter(User.id == user_id).first()
+            if user:
+                user.era_memories_status = 'generating'
+                db.commit()
 
-                print(f"[Profile] 开始为用户 {user_id} 生成时代记忆...")
+            print(f"[Profile] 开始为用户 {user_id} 生成时代记忆...")
+            with llm_context(user_id=user_id, lane=lane):
                 era_memories = llm_service.generate_era_memories(birth_year, hometown, main_city)
 
+            user = db.query(User).filter(User.id == user_id).first()
+            if user:
+                user.era_memories = era_memories
+                user.era_memories_status = 'completed'
+                db.commit()
+                print(f"[Profile] 时代记忆生成完成，已保存")
+            else:
+                print(f"[Profile] 用户不存在: {user_id}")
+            return era_memories
+        except Exception as e:
+            print(f"[Profile] 生成时代记忆失败: {e}")
+            # 标记为失败
+            try:
+                db.rollback()
                 user = db.query(User).filter(User.id == user_id).first()
                 if user:
-                    user.era_memories = era_memories
-                    user.era_memories_status = 'completed'
+                    user.era_memories_status = 'failed'
                     db.commit()
-                    print(f"[Profile] 时代记忆生成完成，已保存")
-                else:
-                    print(f"[Profile] 用户不存在: {user_id}")
-            except Exception as e:
-                print(f"[Profile] 生成时代记忆失败: {e}")
-                import traceback
-                traceback.print_exc()
-                # 标记为失败
-                try:
-                    user = db.query(User).filter(User.id == user_id).first()
-                    if user:
-                        user.era_memories_status = 'failed'
-                        db.commit()
-                except:
-                    pass
-            finally:
-                db.close()
-
-        thread = threading.Thread(target=_generate)
-        thread.start()
-
-    def regenerate_era_memories(self, db: Session, user_id: str) -> Optional[str]:
-        """重新生成时代记忆（同步）"""
-        from app.services.llm_service import llm_service
-
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            return None
-
-        if not user.birth_year:
-            return None
-
-        # 标记为生成中
-        user.era_memories_status = 'generating'
-        db.commit()
-
-        try:
-            print(f"[Profile] 为用户 {user_id} 重新生成时代记忆...")
-            era_memories = llm_service.generate_era_memories(user.birth_year, user.hometown, user.main_city)
-            user.era_memories = era_memories
-            user.era_memories_status = 'completed'
-            db.commit()
-            print(f"[Profile] 时代记忆重新生成完成")
-            return era_memories
-        except Exception as e:
-            print(f"[Profile] 重新生成时代记忆失败: {e}")
-            user.era_memories_status = 'failed'
-            db.commit()
+            except:
+                pass
             raise
+        finally:
+            db.close()
+
+    def regenerate_era_memories(self, user: User) -> str:
+        """重新生成时代记忆（用户手动触发，提交任务），返回任务 ID；重复提交合并进已有任务"""
+        return job_queue.enqueue(
+            "era_memories",
+            {
+                "user_id": user.id, "birth_year": user.birth_year,
+                "hometown": user.hometown, "main_city": user.main_city, "lane": "interactive",
+            },
+            priority=PRIORITY_HIGH,
+            dedup_key=f"era_memories:{user.id}",
+            coalesce_running=True,
+        )
 
 
 profile_service = ProfileService()
+
+
+@job_queue.handler("era_memories")
+def _run_era_memories(payload: dict):
+    era_memories = profile_service._generate_era_memories(
+        payload["user_id"], payload["birth_year"], payload.get("hometown"), payload.get("main_city"),
+        lane=payload.get("lane"),
+    )
+    return {"era_memories": era_memories}
@@ -0,0 +1,182 @@
+"""
+对话滚动摘要
+实时对话进行中，每保存 N 条消息就在后台用快速模型把新增的几轮合并进 conversations.digest：
+摘要、主题标签、标题、时间段，以及从对话中提取的用户信息。
+
+对话结束后的任务（摘要、信息提取、时间段推断、信息收集完成度检查）调用 fold()：
+只把还没合并的最后几轮发给模型，不再每个任务各自加载并发送整段对话。
+
+digest 结构：
+    {
+        "summary", "topics", "title", "year_start", "year_end", "time_period",
+        "preferred_name", "birth_year", "hometown", "main_city", "has_enough_info", "profile_complete",
+        "covered": 已合并的消息条数（按时间顺序的前 N 条，之后的就是待合并的尾部）,
+        "last_message_id": 第 N 条消息的 ID（对不上说明消息有变化，从头重新合并）,
+        "updated_at": ...
+    }
+"""
+import json
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from openai import OpenAI
+from pydantic import BaseModel
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Conversation, User
+from app.services.job_queue import job_queue, PRIORITY_LOW
+from app.services.llm_cache import llm_cache
+from app.services.llm_ledger import llm_context
+from app.services.transcript_service import transcript_service
+
+# 合并进摘要的字段（不含位置信息）
+DIGEST_FIELDS = (
+    "summary", "topics", "title", "year_start", "year_end", "time_period",
+    "preferred_name", "birth_year", "hometown", "main_city", "has_enough_info", "profile_complete",
+)
+
+
+class RollingDigestResult(BaseModel):
+    summary: str = ""
+    topics: List[str] = []
+    title: str = ""
+    year_start: Optional[int] = None
+    year_end: Optional[int] = None
+    time_period: Optional[str] = ""
+    preferred_name: Optional[str] = None
+    birth_year: Optional[int] = None
+    hometown: Optional[str] = None
+    main_city: Optional[str] = None
+    has_enough_info: bool = False
+    profile_complete: bool = False
+
+
+class RollingDigest:
+    """对话滚动摘要"""
+
+    def __init__(self):
+        self.client = OpenAI(
+            api_key=settings.dashscope_api_key,
+            base_url=settings.dashscope_base_url
+        )
+        self.model = settings.dashscope_model_fast
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}  # conversation_id -> 上次触发后新保存的消息数
+
+    # ---------- 触发（实时对话） ----------
+
+    async def on_message_saved(self, conversation_id: str):
+        """实时对话保存一条消息后调用，累计到 N 条在后台合并一次"""
+        if not settings.rolling_digest_enabled or not conversation_id:
+            return
+        with self._lock:
+            count = self._counts.get(conversation_id, 0) + 1
+            trigger = count >= settings.rolling_digest_every_messages
+            self._counts[conversation_id] = 0 if trigger else count
+        if not trigger:
+            return
+        try:
+            await job_queue.aenqueue(
+                "rolling_digest",
+                {"conversation_id": conversation_id},
+                priority=PRIORITY_LOW,
+                dedup_key=f"rolling_digest:{conversation_id}",
+                max_attempts=1,
+            )
+        except Exception as e:
+            print(f"[RollingDigest] 入队失败: {e}")
+
+    def forget(self, conversation_id: str):
+        """实时连接断开时清理计数"""
+        with self._lock:
+            self._counts.pop(conversation_id, None)
+
+    # ---------- 合并 ----------
+
+    def fold(
+        self,
+        db: Session,
+        conversation_id: str,
+        birth_year: Optional[int] = None,
+        nickname: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        把还没合并的消息合并进摘要，返回最新摘要
+
+        Returns:
+            摘要 dict；未开启、对话没有消息或模型调用失败时返回 None（调用方退回读取整段对话）
+        """
+        if not settings.rolling_digest_enabled:
+            return None
+
+        conversation = db.query(Conversation.user_id, Conversation.digest).filter(
+            Conversation.id == conversation_id
+        ).first()
+        if not conversation:
+            return None
+        digest = conversation.digest or None
+
+        transcript = transcript_service.get(db, conversation_id)
+        covered = (digest or {}).get("covered") or 0
+        if covered > len(transcript) or (covered and transcript.message_ids[covered - 1] != digest.get("last_message_id")):
+            digest, covered = None, 0
+        if covered == len(transcript):
+            return digest
+
+        if birth_year is None or nickname is None:
+            user = db.query(User.birth_year, User.nickname).filter(User.id == conversation.user_id).first()
+            if user:
+                birth_year = user.birth_year if birth_year is None else birth_year
+                nickname = user.nickname if nickname is None else nickname
+
+        from app.prompts import rolling_digest as rolling_digest_prompt
+
+        previous = json.dumps({k: digest.get(k) for k in DIGEST_FIELDS}, ensure_ascii=False) if digest else ""
+        text = transcript.slice(covered)
+        try:
+            with llm_context(user_id=conversation.user_id, conversation_id=conversation_id):
+                result = llm_cache.complete(
+                    self.client,
+                    feature="rolling_digest",
+                    version=rolling_digest_prompt.VERSION,
+                    model=self.model,
+                    prompt=rolling_digest_prompt.build(previous, text, birth_year, nickname),
+                    temperature=0.2,
+                    max_tokens=600,
+                    schema=RollingDigestResult,
+                )
+        except Exception as e:
+            print(f"[RollingDigest] 合并失败: {e}")
+            return None
+
+        new_digest = result.model_dump()
+        new_digest["covered"] = len(transcript)
+        new_digest["last_message_id"] = transcript.message_ids[-1]
+        new_digest["updated_at"] = datetime.utcnow().isoformat()
+
+        # 不改动 updated_at（对话列表按它排序）
+        db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(digest=new_digest, updated_at=Conversation.updated_at)
+        )
+        db.commit()
+        print(f"[RollingDigest] {conversation_id} 合并 {len(transcript) - covered} 条消息，共 {new_digest['covered']} 条: {new_digest['summary'][:40]}...")
+        return new_digest
+
+
+rolling_digest = RollingDigest()
+
+
+@job_queue.handler("rolling_digest")
+def _run_rolling_digest(payload: dict):
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        rolling_digest.fold(db, payload["conversation_id"])
+    finally:
+        db.close()
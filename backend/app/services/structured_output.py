@@ -0,0 +1,240 @@
+"""
+LLM 结构化输出解析
+- 去掉 ```json 代码块、前后多余文字
+- 修复常见格式问题：尾逗号、Python 字面量、被 max_tokens 截断的括号
+- 按 pydantic schema 校验
+- 流式输出的增量解析：数组中的对象每闭合一个就产出一个
+"""
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, Optional, Type, TypeVar, Union
+
+from pydantic import BaseModel, ValidationError
+
+T = TypeVar("T", bound=BaseModel)
+
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+class StructuredOutputError(ValueError):
+    """LLM 输出无法解析或不符合 schema"""
+
+    def __init__(self, message: str, raw: str = ""):
+        super().__init__(message)
+        self.raw = raw
+
+
+def strip_code_fence(text: str) -> str:
+    """去掉 markdown 代码块包裹"""
+    text = (text or "").strip()
+    if text.startswith("```"):
+        parts = text.split("```")
+        text = parts[1] if len(parts) > 1 else text.lstrip("`")
+        if text.startswith("json"):
+            text = text[4:]
+        text = text.strip()
+    return text
+
+
+def _extract_json_span(text: str) -> str:
+    """截取第一个 { 或 [ 开始的部分（去掉模型在 JSON 前面加的说明文字）"""
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return text
+    return text[min(starts):]
+
+
+def _scan(text: str):
+    """
+    扫描 JSON 文本，返回 (未闭合括号栈, 是否停在字符串内, 顶层结束位置)
+    顶层结束位置为 -1 表示第一个顶层值尚未闭合
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return stack, False, i + 1
+    return stack, in_string, -1
+
+
+def _replace_py_literals(text: str) -> str:
+    """把字符串外的 True/False/None 换成 JSON 字面量"""
+    out = []
+    in_string = False
+    escaped = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            i += 1
+            continue
+        if ch == '"':
+            in_string = True
+            out.append(ch)
+            i += 1
+            continue
+        for py, js in _PY_LITERALS.items():
+            if text.startswith(py, i) and not (i > 0 and text[i - 1].isalnum()):
+                out.append(js)
+                i += len(py)
+                break
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+
+def repair_json(text: str) -> str:
+    """尽量把模型输出修成合法 JSON 文本"""
+    text = _extract_json_span(strip_code_fence(text))
+
+    stack, in_string, end = _scan(text)
+    if end != -1:
+        # 顶层值已闭合，丢掉后面多余的文字
+        text = text[:end]
+    else:
+        # 被截断：补齐字符串引号和括号
+        if in_string:
+            text += '"'
+        text = text.rstrip().rstrip(",")
+        closers = {"{": "}", "[": "]"}
+        text += "".join(closers[c] for c in reversed(stack))
+
+    text = _replace_py_literals(text)
+    text = _TRAILING_COMMA.sub(r"\1", text)
+    return text
+
+
+def loads(text: str) -> Any:
+    """解析 JSON，失败时尝试修复后再解析"""
+    cleaned = strip_code_fence(text)
+    try:
+        return json.loads(cleaned)
+    except (json.JSONDecodeError, TypeError):
+        pass
+
+    try:
+        return json.loads(repair_json(cleaned))
+    except (json.JSONDecodeError, TypeError) as e:
+        raise StructuredOutputError(f"JSON 解析失败: {e}", raw=text or "")
+
+
+def parse(text: str, schema: Type[T]) -> T:
+    """解析并按 schema 校验"""
+    data = loads(text)
+    try:
+        return schema.model_validate(data)
+    except ValidationError as e:
+        raise StructuredOutputError(f"输出不符合 {schema.__name__}: {e}", raw=text or "")
+
+
+class IncrementalArrayParser:
+    """
+    流式增量解析：从 {"<key>": [ {...}, {...} ]} 形式的输出中，
+    每当数组里的一个对象闭合就产出一个 dict
+
+    用法：
+        parser = IncrementalArrayParser("options")
+        for chunk in stream:
+            for item in parser.feed(chunk):
+                ...
+    """
+
+    def __init__(self, key: str, schema: Optional[Type[BaseModel]] = None):
+        self.key = key
+        self.schema = schema
+        self._buffer = ""
+        self._pos = 0
+        self._array_started = False
+        self._in_string = False
+        self._escaped = False
+        self._depth = 0        # 相对数组的深度，1 表示在数组元素对象内
+        self._item_start = -1
+        self.item_count = 0
+        self.errors = 0
+
+    def feed(self, chunk: str) -> Iterator[Union[Dict, BaseModel]]:
+        self._buffer += chunk or ""
+
+        if not self._array_started:
+            match = re.search(r'"%s"\s*:\s*\[' % re.escape(self.key), self._buffer)
+            if not match:
+                return
+            self._array_started = True
+            self._pos = match.end()
+
+        buf = self._buffer
+        while self._pos < len(buf):
+            ch = buf[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0 and ch == "{":
+                    self._item_start = self._pos
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # 数组本身闭合，后续内容不再关心
+                    self._pos = len(buf)
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._item_start != -1:
+                    item = self._emit(buf[self._item_start:self._pos + 1])
+                    self._item_start = -1
+                    if item is not None:
+                        yield item
+            self._pos += 1
+
+    def _emit(self, raw: str) -> Optional[Union[Dict, BaseModel]]:
+        try:
+            data = loads(raw)
+            if self.schema is not None:
+                data = self.schema.model_validate(data)
+        except (StructuredOutputError, ValidationError) as e:
+            self.errors += 1
+            print(f"[StructuredOutput] 跳过无法解析的数组元素: {e}")
+            return None
+        self.item_count += 1
+        return data
+
+
+def iter_array_items(
+    chunks: Iterable[str],
+    key: str,
+    schema: Optional[Type[BaseModel]] = None,
+) -> Iterator[Union[Dict, BaseModel]]:
+    """对流式文本块做增量解析，逐个产出数组元素"""
+    parser = IncrementalArrayParser(key, schema)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
@@ -6,10 +6,19 @@
 from typing import Optional, List, Tuple
 from sqlalchemy.orm import Session
 from openai import OpenAI
-import json
+from pydantic import BaseModel
 
 from app.config import settings
-from app.models import Conversation, Message
+from app.models import Conversation
+from app.services.llm_cache import llm_cache
+from app.services.transcript_service import transcript_service
+
+PROMPT_VERSION = 1  # 修改下方 prompt 后递增，使旧缓存失效
+
+
+class SummaryResult(BaseModel):
+    summary: str = ""
+    topics: List[str] = []
 
 
 class SummaryService:
@@ -20,26 +29,14 @@ class SummaryService:
         )
         self.model = settings.dashscope_model
 
-    def generate_summary(self, db: Session, conversation_id: str) -> Tuple[Optional[str], Optional[List[str]]]:
+    def generate_summary(self, db: Session, conversation_id: str, cache: bool = True) -> Tuple[Optional[str], Optional[List[str]]]:
         """
         生成对话摘要和主题标签
 
         Returns:
             (summary, topics) - 摘要文本和主题列表
         """
-        # 获取对话消息
-        messages = db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(Message.created_at).all()
-
-        if not messages:
-            return None, None
-
-        # 构建对话文本
-        conversation_text = "\n".join([
-            f"{'用户' if msg.role == 'user' else '记录师'}: {msg.content}"
-            for msg in messages
-        ])
+        conversation_text = transcript_service.text(db, conversation_id)
 
         if len(conversation_text) < 50:
             return None, None
@@ -63,42 +60,24 @@ class SummaryService:
 """
 
         try:
-            response = self.client.chat.completions.create(
+            result = llm_cache.complete(
+                self.client,
+                feature="summary_topics",
+                version=PROMPT_VERSION,
                 model=self.model,
-                messages=[{"role": "user", "content": prompt}],
+                prompt=prompt,
                 temperature=0.3,
-                max_tokens=500
+                max_tokens=500,
+                cache=cache,
+                schema=SummaryResult,
             )
-
-            content = response.choices[0].message.content.strip()
-
-            # 解析 JSON
-            # 处理可能的 markdown 代码块
-            if content.startswith("```"):
-                content = content.split("```")[1]
-                if content.startswith("json"):
-                    content = content[4:]
-                content = content.strip()
-
-            result = json.loads(content)
-            summary = result.get("summary", "")
-            topics = result.get("topics", [])
+            summary = result.summary
+            topics = result.topics
 
             print(f"[Summary] 生成摘要: {summary[:50]}...")
             print(f"[Summary] 主题标签: {topics}")
 
-            # 更新数据库
-            conversation = db.query(Conversation).filter(
-                Conversation.id == conversation_id
-            ).first()
-
-            if conversation:
-                conversation.summary = summary
-                conversation.topics = topics
-                if topics:
-                    conversation.topic = topics[0]  # 主要主题
-                db.commit()
-
+            self.save(db, conversation_id, summary, topics)
             return summary, topics
 
         except Exception as e:
@@ -107,5 +86,18 @@ class SummaryService:
             traceback.print_exc()
             return None, None
 
+    def save(self, db: Session, conversation_id: str, summary: Optional[str], topics: Optional[List[str]]):
+        """把摘要和主题标签写回对话"""
+        conversation = db.query(Conversation).filter(
+            Conversation.id == conversation_id
+        ).first()
+
+        if conversation:
+            conversation.summary = summary
+            conversation.topics = topics
+            if topics:
+                conversation.topic = topics[0]  # 主要主题
+            db.commit()
+
 
 summary_service = SummaryService()
@@ -4,16 +4,30 @@
 - 对话结束后异步审查和更新话题池
 - 获取话题选项供用户选择
 """
-import json
-import threading
 from typing import List, Optional, Dict
 from sqlalchemy.orm import Session
 from openai import OpenAI
+from pydantic import BaseModel
 
 from app.config import settings
 from app.models import User, TopicCandidate, Memoir
 from app.models.user import PresetTopic
 from app.services.era_memory_service import era_memory_service
+from app.services import structured_output
+from app.services import llm_gateway
+from app.services.job_queue import job_queue, PRIORITY_LOW
+
+
+class TopicOptionItem(BaseModel):
+    topic: str = ""
+    greeting: str = ""
+    context: Optional[str] = ""
+    age_start: Optional[int] = None
+    age_end: Optional[int] = None
+
+
+class TopicReviewResult(BaseModel):
+    actions: List[Dict] = []
 
 
 class TopicService:
@@ -117,43 +131,44 @@ class TopicService:
             option_count=settings.topic_option_count
         )
 
+        saved_options = []
         try:
-            response = self.client.chat.completions.create(
+            stream = llm_gateway.chat_completion(
+                self.client,
+                feature="topic_options",
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.8,
-                max_tokens=3000
+                max_tokens=3000,
+                stream=True
             )
 
-            content = response.choices[0].message.content.strip()
-
-            # 处理可能的 markdown 代码块
-            if content.startswith("```"):
-                content = content.split("```")[1]
-                if content.startswith("json"):
-                    content = content[4:]
-                content = content.strip()
-
-            result = json.loads(content)
-            options = result.get("options", [])
+            def _chunks():
+                try:
+                    for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
+                finally:
+                    stream.close()
+
+            # 流式增量解析：每解析出一个选项就落库，单个选项格式错误不影响其他选项
+            for opt in structured_output.iter_array_items(_chunks(), "options", TopicOptionItem):
+                if not saved_options:
+                    # 第一个选项到达时才清空旧话题，避免请求失败时池子被清空
+                    db.query(TopicCandidate).filter(
+                        TopicCandidate.user_id == user.id
+                    ).delete()
 
-            # 清空旧的，保存新的
-            db.query(TopicCandidate).filter(
-                TopicCandidate.user_id == user.id
-            ).delete()
-
-            saved_options = []
-            for opt in options:
                 candidate = TopicCandidate(
                     user_id=user.id,
-                    topic=opt.get("topic", ""),
-                    greeting=opt.get("greeting", ""),
-                    chat_context=opt.get("context", ""),
-                    age_start=opt.get("age_start"),
-                    age_end=opt.get("age_end")
+                    topic=opt.topic,
+                    greeting=opt.greeting,
+                    chat_context=opt.context or "",
+                    age_start=opt.age_start,
+                    age_end=opt.age_end
                 )
                 db.add(candidate)
-                db.flush()
+                db.commit()
                 saved_options.append({
                     "id": candidate.id,
                     "topic": candidate.topic,
@@ -163,106 +178,106 @@ class TopicService:
                     "age_end": candidate.age_end
                 })
 
-            db.commit()
-
-            print(f"[Topic] 生成了 {len(saved_options)} 个话题选项")
-            return saved_options
-
         except Exception as e:
             print(f"[Topic] 生成话题选项失败: {e}")
             import traceback
             traceback.print_exc()
+            db.rollback()
+
+        if saved_options:
+            print(f"[Topic] 生成了 {len(saved_options)} 个话题选项")
+            return saved_options
 
-            # 返回默认话题
-            default_options = self._get_default_options()
-            return self._save_default_options(db, user.id, default_options)
+        # 一个选项都没拿到，返回默认话题
+        default_options = self._get_default_options()
+        return self._save_default_options(db, user.id, default_options)
 
     def review_topic_pool_async(self, user_id: str):
-        """异步审查和更新话题池（对话结束后调用）"""
-        thread = threading.Thread(target=self._review_topic_pool_sync, args=(user_id,))
-        thread.start()
+        """异步审查和更新话题池（对话结束后调用）；同一用户排队中的审查只保留一个"""
+        job_queue.enqueue(
+            "topic_review",
+            {"user_id": user_id},
+            priority=PRIORITY_LOW,
+            dedup_key=f"topic_review:{user_id}",
+        )
 
     def _review_topic_pool_sync(self, user_id: str):
-        """同步执行话题池审查"""
+        """同步执行话题池审查（异常向上抛，由任务队列重试）"""
         from app.database import SessionLocal
-        from app.prompts import topic_review
+        from app.services.llm_ledger import llm_context
 
         db = SessionLocal()
         try:
-            print(f"[Topic] 开始审查用户 {user_id} 的话题池")
-
-            user = db.query(User).filter(User.id == user_id).first()
-            if not user:
-                print(f"[Topic] 用户不存在: {user_id}")
-                return
-
-            # 构建审查所需的数据
-            profile = self._build_user_profile(user)
-            era_memories = ""
-            if user.birth_year:
-                era_memories = era_memory_service.get_for_user(db, user.birth_year)
-            if not era_memories:
-                era_memories = user.era_memories or ""
-            all_memoirs = self._get_all_memoirs_summary(db, user_id)
-
-            # 最多尝试 2 次，确保池子不为空
-            for attempt in range(2):
-                candidates = db.query(TopicCandidate).filter(
-                    TopicCandidate.user_id == user_id
-                ).all()
-                current_topics = self._format_current_topics(candidates)
-
-                prompt = topic_review.build(
-                    user_profile=profile,
-                    era_memories=era_memories,
-                    all_memoirs=all_memoirs,
-                    current_topics=current_topics
-                )
+            with llm_context(user_id=user_id):
+                self._review_topic_pool(db, user_id)
+        finally:
+            db.close()
 
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7,
-                    max_tokens=3000
-                )
+    def _review_topic_pool(self, db: Session, user_id: str):
+        """话题池审查主体"""
+        from app.prompts import topic_review
+
+        print(f"[Topic] 开始审查用户 {user_id} 的话题池")
 
-                content = response.choices[0].message.content.strip()
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            print(f"[Topic] 用户不存在: {user_id}")
+            return
 
-                # 处理可能的 markdown 代码块
-                if content.startswith("```"):
-                    content = content.split("```")[1]
-                    if content.startswith("json"):
-                        content = content[4:]
-                    content = content.strip()
+        # 构建审查所需的数据
+        profile = self._build_user_profile(user)
+        era_memories = ""
+        if user.birth_year:
+            era_memories = era_memory_service.get_for_user(db, user.birth_year)
+        if not era_memories:
+            era_memories = user.era_memories or ""
+        all_memoirs = self._get_all_memoirs_summary(db, user_id)
+
+        # 最多尝试 2 次，确保池子不为空
+        for attempt in range(2):
+            candidates = db.query(TopicCandidate).filter(
+                TopicCandidate.user_id == user_id
+            ).all()
+            current_topics = self._format_current_topics(candidates)
+
+            prompt = topic_review.build(
+                user_profile=profile,
+                era_memories=era_memories,
+                all_memoirs=all_memoirs,
+                current_topics=current_topics
+            )
+
+            response = llm_gateway.chat_completion(
+                self.client,
+                feature="topic_review",
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                max_tokens=3000
+            )
 
-                result = json.loads(content)
-                actions = result.get("actions", [])
+            content = response.choices[0].message.content.strip()
 
-                self._apply_review_actions(db, user_id, candidates, actions)
+            actions = structured_output.parse(content, TopicReviewResult).actions
 
-                # 检查池子是否为空
-                remaining = db.query(TopicCandidate).filter(
-                    TopicCandidate.user_id == user_id
-                ).count()
+            self._apply_review_actions(db, user_id, candidates, actions)
 
-                if remaining > 0:
-                    print(f"[Topic] 话题池审查完成，执行了 {len(actions)} 个操作，剩余 {remaining} 个话题")
-                    break
+            # 检查池子是否为空
+            remaining = db.query(TopicCandidate).filter(
+                TopicCandidate.user_id == user_id
+            ).count()
 
-                if attempt == 0:
-                    print(f"[Topic] 审查后话题池为空，重试一次...")
-                else:
-                    # 两次都为空，回退到默认安全话题
-                    print(f"[Topic] 重试后话题池仍为空，使用默认话题兜底")
-                    default_options = self._get_default_options()
-                    self._save_default_options(db, user_id, default_options)
+            if remaining > 0:
+                print(f"[Topic] 话题池审查完成，执行了 {len(actions)} 个操作，剩余 {remaining} 个话题")
+                break
 
-        except Exception as e:
-            print(f"[Topic] 话题池审查失败: {e}")
-            import traceback
-            traceback.print_exc()
-        finally:
-            db.close()
+            if attempt == 0:
+                print(f"[Topic] 审查后话题池为空，重试一次...")
+            else:
+                # 两次都为空，回退到默认安全话题
+                print(f"[Topic] 重试后话题池仍为空，使用默认话题兜底")
+                default_options = self._get_default_options()
+                self._save_default_options(db, user_id, default_options)
 
     def _apply_review_actions(self, db: Session, user_id: str, candidates: List[TopicCandidate], actions: List[Dict]):
         """应用审查结果"""
@@ -441,3 +456,12 @@ class TopicService:
 
 
 topic_service = TopicService()
+
+
+@job_queue.handler("topic_review")
+def _run_topic_review(payload: dict):
+    try:
+        topic_service._review_topic_pool_sync(payload["user_id"])
+    except llm_gateway.LLMBudgetExceeded as e:
+        # 预算当天不会恢复，重试没有意义
+        print(f"[Topic] 跳过话题池审查: {e}")
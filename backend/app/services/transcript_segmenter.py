@@ -0,0 +1,102 @@
+"""
+访谈记录分段
+长访谈按话题 / 时期切成若干段，供回忆录分段整理（map-reduce）使用。
+只用本地规则，不调用 LLM：
+- 只在记录师发言处切分，不拆开一轮问答
+- 记录师换话题（"聊聊"、"后来"、"那时候"……）或提到新的人生阶段、年份时优先切分
+- 每段尽量接近目标长度，超过上限时在最近的记录师发言处强制切分
+"""
+import re
+from typing import List, Tuple
+
+from app.services.transcript_service import ROLE_LABELS
+
+# 访谈记录每行的角色前缀
+INTERVIEWER_PREFIX = f"{ROLE_LABELS['assistant']}:"
+USER_PREFIX = f"{ROLE_LABELS['user']}:"
+
+# 记录师换话题的说法
+TOPIC_SHIFT_WORDS = (
+    "聊聊", "说说", "讲讲", "谈谈", "换个", "接下来", "另外", "还有",
+    "后来", "之后", "那时候", "那会儿", "再往后", "回到",
+)
+
+# 人生阶段
+LIFE_STAGE_WORDS = (
+    "小时候", "童年", "上学", "读书", "小学", "中学", "高中", "大学", "当兵", "参军",
+    "下乡", "插队", "工作", "上班", "单位", "结婚", "成家", "孩子", "退休", "老伴",
+)
+
+_YEAR_RE = re.compile(r"(1[89]\d{2}|20\d{2})年|[五六七八九]十年代|[5-9]0年代")
+
+
+def _split_turns(transcript: str) -> List[Tuple[bool, str]]:
+    """按发言切分：(是否记录师发言, 原文)。不带角色前缀的续行并入上一条发言"""
+    turns: List[Tuple[bool, str]] = []
+    for line in transcript.split("\n"):
+        is_interviewer = line.startswith(INTERVIEWER_PREFIX)
+        if turns and not is_interviewer and not line.startswith(USER_PREFIX):
+            prev_role, prev_text = turns[-1]
+            turns[-1] = (prev_role, f"{prev_text}\n{line}")
+        else:
+            turns.append((is_interviewer, line))
+    return turns
+
+
+def _boundary_score(text: str) -> int:
+    """记录师这句话作为分段起点的合适程度（0=普通提问）"""
+    score = 0
+    if any(w in text for w in TOPIC_SHIFT_WORDS):
+        score += 2
+    if any(w in text for w in LIFE_STAGE_WORDS):
+        score += 1
+    if _YEAR_RE.search(text):
+        score += 1
+    return score
+
+
+def segment_transcript(transcript: str, target_chars: int, max_chars: int) -> List[str]:
+    """
+    把访谈记录切成若干段
+
+    Args:
+        transcript: "用户: ...\\n记录师: ..." 格式的访谈记录
+        target_chars: 每段目标长度，达到后遇到换话题的提问就切
+        max_chars: 每段上限，超过后遇到任何记录师发言都切
+
+    Returns:
+        各段文本（按原顺序）；不需要分段时返回只含原文的列表
+    """
+    if len(transcript) <= max_chars:
+        return [transcript]
+
+    turns = _split_turns(transcript)
+    segments: List[str] = []
+    current: List[str] = []
+    size = 0
+
+    for is_interviewer, text in turns:
+        if current and is_interviewer:
+            if size >= max_chars:
+                cut = True
+            elif size >= target_chars:
+                cut = _boundary_score(text) > 0
+            elif size >= target_chars * 0.6:
+                cut = _boundary_score(text) >= 3
+            else:
+                cut = False
+            if cut:
+                segments.append("\n".join(current))
+                current, size = [], 0
+        current.append(text)
+        size += len(text) + 1
+
+    if current:
+        tail = "\n".join(current)
+        # 末段太短就并到前一段，避免出现只有一两句话的段落
+        if segments and len(tail) < target_chars * 0.3:
+            segments[-1] = f"{segments[-1]}\n{tail}"
+        else:
+            segments.append(tail)
+
+    return segments
@@ -0,0 +1,140 @@
+"""
+访谈记录（对话文本）
+所有 LLM 流水线（回忆录、摘要、信息提取、时间段推断、滚动摘要、预先起草……）共用的对话文本：
+按时间顺序把消息渲染成"用户: ... / 记录师: ..."，统一角色前缀，并记录每条消息在文本中的位置。
+
+渲染结果按对话缓存在进程内：
+- 版本号 = (消息条数, 最后一条消息时间)，每次读取先用一条聚合查询核对版本，对不上才重新加载
+- 本进程保存消息时调用 invalidate() 立即作废
+对话结束时多个任务读同一段对话，只有第一次真正加载消息。
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Message
+
+# 角色前缀（transcript_segmenter 按此切分发言）
+ROLE_LABELS = {"user": "用户", "assistant": "记录师"}
+
+
+def format_line(role: str, content: str) -> str:
+    """一条消息渲染成一行"""
+    return f"{ROLE_LABELS.get(role, '记录师')}: {content}"
+
+
+def render(messages: Iterable) -> str:
+    """把消息（有 role / content 属性）渲染成访谈记录"""
+    return "\n".join(format_line(m.role, m.content) for m in messages)
+
+
+@dataclass(frozen=True)
+class Transcript:
+    """渲染好的访谈记录（只读，可在线程间共享）"""
+    conversation_id: str
+    version: Tuple[int, Optional[datetime]]   # (消息条数, 最后一条消息时间)
+    text: str
+    message_ids: Tuple[str, ...]
+    roles: Tuple[str, ...]
+    created_at: Tuple[datetime, ...]
+    offsets: Tuple[Tuple[int, int], ...]       # 每条消息在 text 中的 [start, end)
+
+    def __len__(self) -> int:
+        return len(self.message_ids)
+
+    def slice(self, start: int, end: Optional[int] = None) -> str:
+        """第 start 到 end 条消息（不含 end）的访谈记录"""
+        end = len(self) if end is None else min(end, len(self))
+        if start >= end:
+            return ""
+        return self.text[self.offsets[start][0]:self.offsets[end - 1][1]]
+
+    def line(self, index: int) -> str:
+        """第 index 条消息"""
+        start, end = self.offsets[index]
+        return self.text[start:end]
+
+
+class TranscriptService:
+    """访谈记录（带进程内缓存）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Transcript]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session, conversation_id: str) -> Transcript:
+        """读取对话的访谈记录（版本没变时直接用缓存）"""
+        version = self._version(db, conversation_id)
+        with self._lock:
+            cached = self._cache.get(conversation_id)
+            if cached is not None and cached.version == version:
+                self._cache.move_to_end(conversation_id)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        transcript = self._load(db, conversation_id)
+        if settings.transcript_cache_max_entries > 0:
+            with self._lock:
+                self._cache[conversation_id] = transcript
+                self._cache.move_to_end(conversation_id)
+                while len(self._cache) > settings.transcript_cache_max_entries:
+                    self._cache.popitem(last=False)
+        return transcript
+
+    def text(self, db: Session, conversation_id: str) -> str:
+        """访谈记录文本"""
+        return self.get(db, conversation_id).text
+
+    def invalidate(self, conversation_id: str):
+        """对话有新消息（或消息被删除）时调用"""
+        with self._lock:
+            self._cache.pop(conversation_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+    # ---------- 内部 ----------
+
+    @staticmethod
+    def _version(db: Session, conversation_id: str) -> Tuple[int, Optional[datetime]]:
+        count, last = db.query(func.count(Message.id), func.max(Message.created_at)).filter(
+            Message.conversation_id == conversation_id
+        ).one()
+        return count or 0, last
+
+    @staticmethod
+    def _load(db: Session, conversation_id: str) -> Transcript:
+        rows = db.query(Message.id, Message.role, Message.content, Message.created_at).filter(
+            Message.conversation_id == conversation_id
+        ).order_by(Message.created_at).all()
+
+        lines, offsets = [], []
+        position = 0
+        for m in rows:
+            line = format_line(m.role, m.content)
+            offsets.append((position, position + len(line)))
+            lines.append(line)
+            position += len(line) + 1  # 换行符
+
+        return Transcript(
+            conversation_id=conversation_id,
+            version=(len(rows), max((m.created_at for m in rows), default=None)),
+            text="\n".join(lines),
+            message_ids=tuple(m.id for m in rows),
+            roles=tuple(m.role for m in rows),
+            created_at=tuple(m.created_at for m in rows),
+            offsets=tuple(offsets),
+        )
+
+
+transcript_service = TranscriptService()
@@ -0,0 +1,128 @@
+"""
+回忆录 Agent 对比测试
+
+用库里已有的对话记录跑 MemoirAgent，对比输入/输出 token 和耗时：
+- baseline：agent 模式，不压缩上下文
+- compact：agent 模式，压缩上下文
+- staged：分步流水线（分析/检查用快速模型）
+各模式都显式指定给 MemoirAgent，不会因访谈长短改走单次生成或 map-reduce；
+表中“实际”一列是统计里记录的实际运行模式。
+会真实调用 LLM，注意费用。
+
+用法:
+    cd backend
+    python scripts/bench_memoir_agent.py --limit 5
+    python scripts/bench_memoir_agent.py --conversation-id <id> --budget 60000
+    python scripts/bench_memoir_agent.py --modes baseline,staged
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import func
+
+from app.database import SessionLocal
+from app.models import Conversation, Message
+from app.services.memoir_agent import MemoirGenerationError, memoir_agent
+from app.services.memoir_service import memoir_service
+
+
+def load_transcripts(conversation_id: str = None, limit: int = 5, min_messages: int = 10):
+    """取最近的若干条对话记录（消息数不少于 min_messages）"""
+    db = SessionLocal()
+    try:
+        if conversation_id:
+            ids = [conversation_id]
+        else:
+            rows = db.query(Message.conversation_id).join(
+                Conversation, Conversation.id == Message.conversation_id
+            ).group_by(
+                Message.conversation_id, Conversation.created_at
+            ).having(
+                func.count(Message.id) >= min_messages
+            ).order_by(
+                Conversation.created_at.desc()
+            ).limit(limit).all()
+            ids = [r[0] for r in rows]
+
+        return [(cid, memoir_service._get_conversation_text(db, cid)) for cid in ids]
+    finally:
+        db.close()
+
+
+# 模式名 -> (agent 模式, 是否压缩)
+MODES = {
+    "baseline": ("agent", False),
+    "compact": ("agent", True),
+    "staged": ("staged", True),
+}
+
+
+def run(transcript: str, mode: str, budget: int):
+    agent_mode, compact = MODES[mode]
+    _, stats = memoir_agent.generate_with_stats(
+        transcript, compact=compact, token_budget=budget, mode=agent_mode
+    )
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MemoirAgent 对比测试")
+    parser.add_argument("--conversation-id", help="只测指定对话")
+    parser.add_argument("--limit", type=int, default=5, help="测试的对话数")
+    parser.add_argument("--min-messages", type=int, default=10, help="对话最少消息数")
+    parser.add_argument("--budget", type=int, default=0, help="非 baseline 模式的 token 上限（0=不限）")
+    parser.add_argument("--modes", default="baseline,compact,staged", help="逗号分隔: " + ",".join(MODES))
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip() in MODES]
+    if not modes:
+        print(f"--modes 仅支持: {', '.join(MODES)}")
+        return
+
+    transcripts = load_transcripts(args.conversation_id, args.limit, args.min_messages)
+    if not transcripts:
+        print("没有符合条件的对话")
+        return
+
+    header = f"{'对话':<10} {'字数':>6} | {'模式':<8} {'实际':<8} {'轮数':>4} {'输入':>8} {'输出':>7} {'耗时(s)':>8}  各步骤"
+    print(header)
+    print("-" * len(header))
+
+    totals = {mode: [0, 0, 0] for mode in modes}
+    for cid, text in transcripts:
+        for mode in modes:
+            try:
+                stats = run(text, mode, 0 if mode == "baseline" else args.budget)
+            except MemoirGenerationError as e:
+                print(f"{cid[:8]:<10} {len(text):>6} | {mode:<8} 生成失败: {e}")
+                continue
+            totals[mode][0] += stats["prompt_tokens"]
+            totals[mode][1] += stats["completion_tokens"]
+            totals[mode][2] += stats["elapsed_ms"]
+            stages = " ".join(f"{st['stage']}:{st['ms'] / 1000:.1f}s" for st in stats["stages"])
+            print(
+                f"{cid[:8]:<10} {len(text):>6} | {mode:<8} {stats['mode']:<8} {stats['iterations']:>4} "
+                f"{stats['prompt_tokens']:>8} {stats['completion_tokens']:>7} "
+                f"{stats['elapsed_ms'] / 1000:>8.1f}  {stages}"
+            )
+
+    print("-" * len(header))
+    for mode, (p, c, ms) in totals.items():
+        print(f"{'合计':<10} {'':>6} | {mode:<8} {'':<8} {'':>4} {p:>8} {c:>7} {ms / 1000:>8.1f}")
+
+    base = totals.get("baseline")
+    if base and base[0]:
+        print()
+        for mode in modes:
+            if mode == "baseline":
+                continue
+            p, _, ms = totals[mode]
+            print(f"{mode}: 输入 token 减少 {(1 - p / base[0]) * 100:.1f}%，"
+                  f"耗时变化 {(ms / base[2] - 1) * 100 if base[2] else 0:+.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+测试环境：临时 SQLite 库，同步查询一旦跑在事件循环线程上就抛 LoopBlockingQuery
+
+用法:
+    cd backend
+    python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+
+# 必须在导入 app 之前设置（settings 在导入时读取环境变量）
+_tmpdir = tempfile.mkdtemp(prefix="biography-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmpdir}/test.db"
+os.environ["DB_LOOP_BLOCK_CHECK"] = "raise"
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest  # noqa: E402
+
+from app.database import Base, engine  # noqa: E402
+import app.models  # noqa: E402,F401
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _create_tables():
+    Base.metadata.create_all(bind=engine)
+    yield
+    engine.dispose()
@@ -0,0 +1,240 @@
+"""
+事件循环阻塞检测（db_loop_block_check=raise，见 conftest）
+
+驱动 achat_completion、干预判断和两个实时对话 WebSocket，
+其中任何一处在事件循环线程上用了同步会话，都会抛 LoopBlockingQuery 导致断言失败
+（实时接口里的异常会被吞掉，所以这里检查的是结果：消息已保存、干预已注入）
+"""
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api import realtime, realtime_enhanced
+from app.auth import create_token
+from app.config import settings
+from app.database import SessionLocal
+from app.main import app
+from app.models import Conversation, LLMUsage, Message, User
+from app.services import llm_gateway
+from app.services.intervention_service import intervention_service
+from app.services.llm_ledger import llm_context, llm_ledger
+
+GUIDANCE = "追问一下弄堂里的邻居"
+
+
+class FakeCompletions:
+    """AsyncOpenAI chat.completions 的替身，固定返回一条干预建议"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(
+            choices=[SimpleNamespace(
+                message=SimpleNamespace(content=json.dumps({"guidance": GUIDANCE}, ensure_ascii=False)),
+                finish_reason="stop",
+            )],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+        )
+
+
+class FakeAsyncClient:
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=FakeCompletions())
+
+
+class FakeDoubaoClient:
+    """豆包实时语音客户端的替身：连接后按脚本回调一轮“用户说话 → AI 回复”"""
+
+    def __init__(self, **kwargs):
+        self.on_text = kwargs["on_text"]
+        self.on_event = kwargs["on_event"]
+        self.on_asr_ended = kwargs.get("on_asr_ended")
+        self.injected = []
+
+    async def connect(self) -> bool:
+        return True
+
+    async def say_hello(self, content: str = None):
+        pass
+
+    async def send_audio(self, audio_data: bytes):
+        pass
+
+    async def inject_guidance(self, guidance: str, mechanism: str = "instruction", intervention_type: str = ""):
+        self.injected.append(guidance)
+
+    async def receive_loop(self):
+        await asyncio.sleep(0.05)
+        self.on_text("asr", "我小时候住在上海的弄堂里")
+        await asyncio.sleep(0.05)
+        if self.on_asr_ended:
+            self.on_asr_ended("我小时候住在上海的弄堂里")
+        else:
+            self.on_event(459, {})
+        await asyncio.sleep(0.2)
+        self.on_event(350, {})
+        await asyncio.sleep(0.05)
+        self.on_text("response", "弄堂里都住着些什么样的邻居？")
+        await asyncio.sleep(0.05)
+        self.on_event(359, {})
+        await asyncio.Event().wait()
+
+    async def finish_session(self):
+        pass
+
+    async def finish_connection(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def user():
+    """已完成信息收集的用户 + 一个进行中的对话"""
+    db = SessionLocal()
+    try:
+        u = User(id=str(uuid.uuid4()), phone=f"138{uuid.uuid4().int % 10 ** 8:08d}", nickname="张三",
+                 preferred_name="张老师", birth_year=1950, profile_completed=True)
+        db.add(u)
+        db.flush()
+        c = Conversation(user_id=u.id, title="童年")
+        db.add(c)
+        db.commit()
+        yield SimpleNamespace(id=u.id, conversation_id=c.id)
+    finally:
+        db.close()
+
+
+@pytest.fixture(autouse=True)
+def _settings(monkeypatch):
+    # 打开预算（预算检查要查今日用量）和各个按消息数触发的后台任务（异步入队）
+    monkeypatch.setattr(settings, "llm_user_daily_token_budget", 1_000_000)
+    monkeypatch.setattr(settings, "intervention_enabled", True)
+    monkeypatch.setattr(settings, "rolling_digest_enabled", True)
+    monkeypatch.setattr(settings, "rolling_digest_every_messages", 1)
+    monkeypatch.setattr(settings, "memoir_speculation_enabled", True)
+    monkeypatch.setattr(settings, "memoir_speculation_every_messages", 1)
+    monkeypatch.setattr(intervention_service, "client", FakeAsyncClient())
+    # 清掉用量缓存，保证预算检查真的查库
+    llm_ledger._usage.clear()
+
+
+def _saved_messages(conversation_id: str):
+    db = SessionLocal()
+    try:
+        return [
+            (m.role, m.content)
+            for m in db.query(Message).filter(Message.conversation_id == conversation_id).order_by(Message.created_at)
+        ]
+    finally:
+        db.close()
+
+
+def test_achat_completion_budget_check_off_loop(user):
+    client = FakeAsyncClient()
+
+    async def call():
+        with llm_context(user_id=user.id):
+            return await llm_gateway.achat_completion(
+                client, feature="intervention_stagnation", model="qwen-test",
+                messages=[{"role": "user", "content": "你好"}], max_tokens=200,
+            )
+
+    response = asyncio.run(call())
+    assert client.chat.completions.calls == 1
+    assert GUIDANCE in response.choices[0].message.content
+
+
+def test_achat_completion_over_budget(user):
+    db = SessionLocal()
+    try:
+        db.add(LLMUsage(feature="memoir_agent", model="qwen-test", prompt_tokens=1_000_000, completion_tokens=0,
+                        user_id=user.id, outcome="ok", created_at=datetime.utcnow()))
+        db.commit()
+    finally:
+        db.close()
+
+    async def call():
+        with llm_context(user_id=user.id):
+            return await llm_gateway.achat_completion(
+                FakeAsyncClient(), feature="intervention_stagnation", model="qwen-test",
+                messages=[{"role": "user", "content": "你好"}], max_tokens=200,
+            )
+
+    with pytest.raises(llm_gateway.LLMBudgetExceeded):
+        asyncio.run(call())
+
+
+def test_intervention_judges(user):
+    async def judge():
+        with llm_context(user_id=user.id, conversation_id=user.conversation_id):
+            return await intervention_service.judge_and_intervene(
+                topic="童年",
+                recent_messages=[
+                    {"role": "user", "content": "我小时候住在上海的弄堂里"},
+                    {"role": "assistant", "content": "弄堂里都住着些什么样的邻居？"},
+                ],
+                era_memories="1950 年代：弄堂、煤球炉",
+                timeout_ms=5000,
+            )
+
+    result = asyncio.run(judge())
+    assert result is not None
+    assert result["guidance"] == GUIDANCE
+
+
+def _run_dialog(path: str, user, until, saved: int = 2):
+    """连上实时对话 WebSocket，收消息直到 until(message) 为真、且已保存 saved 条消息，然后发 stop"""
+    client = TestClient(app)
+    token = create_token(user.id)
+    with client.websocket_connect(f"{path}?token={token}&conversation_id={user.conversation_id}") as ws:
+        for _ in range(50):
+            message = ws.receive_json()
+            assert message.get("status") != "error", message
+            if until(message):
+                break
+        else:
+            pytest.fail("没有收到预期的消息")
+        # 事件先转发给前端再保存消息，等保存完成（或失败）再断开
+        deadline = time.monotonic() + 5
+        while len(_saved_messages(user.conversation_id)) < saved and time.monotonic() < deadline:
+            time.sleep(0.05)
+        ws.send_json({"type": "stop"})
+
+
+def test_realtime_dialog(user, monkeypatch):
+    monkeypatch.setattr(realtime, "DoubaoRealtimeClient", FakeDoubaoClient)
+
+    def tts_ended(message):
+        return message.get("type") == "event" and message.get("event") == 359
+
+    _run_dialog("/api/realtime/dialog", user, tts_ended)
+    assert _saved_messages(user.conversation_id) == [
+        ("user", "我小时候住在上海的弄堂里"),
+        ("assistant", "弄堂里都住着些什么样的邻居？"),
+    ]
+
+
+def test_realtime_enhanced_dialog(user, monkeypatch):
+    monkeypatch.setattr(realtime_enhanced, "DoubaoRealtimeEnhancedClient", FakeDoubaoClient)
+
+    def intervention(message):
+        return message.get("type") == "intervention"
+
+    received = []
+    _run_dialog("/api/realtime-enhanced/dialog", user, lambda m: received.append(m) or intervention(m))
+    assert received[-1]["triggered"] is True
+    assert received[-1]["guidance"] == GUIDANCE
+    assert _saved_messages(user.conversation_id) == [
+        ("user", "我小时候住在上海的弄堂里"),
+        ("assistant", "弄堂里都住着些什么样的邻居？"),
+    ]
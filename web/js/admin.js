@@ -2,6 +2,9 @@
 const API_BASE = '/api';
 let adminKey = '';
 let usersData = [];
+let usersNextCursor = null;
+let logsData = [];
+let logsNextCursor = null;
 let logsLoaded = false;
 
 // ========== Admin Key 验证 ==========
@@ -15,7 +18,7 @@ function setAdminKey(key) {
     sessionStorage.setItem('adminKey', key);
 }
 
-async function adminRequest(endpoint, options = {}) {
+async function adminRequest(endpoint, { onResponse, ...options } = {}) {
     const url = `${API_BASE}${endpoint}`;
     const key = getAdminKey().replace(/[^\x00-\xff]/g, '');
     const headers = {
@@ -30,9 +33,26 @@ async function adminRequest(endpoint, options = {}) {
         const err = await response.json().catch(() => ({ detail: '请求失败' }));
         throw new Error(err.detail || '请求失败');
     }
+    if (onResponse) onResponse(response);
     return response.json();
 }
 
+// 数组形式的分页列表：下一页游标在 X-Next-Cursor 头
+// 必须带 limit：不带 limit 和 cursor 时接口返回完整列表
+async function adminRequestPage(endpoint, limit, cursor = null) {
+    let url = `${endpoint}?limit=${limit}`;
+    if (cursor) url += `&cursor=${encodeURIComponent(cursor)}`;
+    let nextCursor = null;
+    const items = await adminRequest(url, {
+        onResponse: response => { nextCursor = response.headers.get('X-Next-Cursor'); },
+    });
+    return { items, nextCursor };
+}
+
+function loadMoreRow(colspan, handler) {
+    return `<tr><td colspan="${colspan}"><button class="admin-btn admin-btn-sm admin-load-more" onclick="${handler}()">加载更多</button></td></tr>`;
+}
+
 async function verifyKey() {
     const input = document.getElementById('adminKeyInput');
     const key = input.value.trim();
@@ -54,6 +74,9 @@ function logout() {
     adminKey = '';
     sessionStorage.removeItem('adminKey');
     usersData = [];
+    usersNextCursor = null;
+    logsData = [];
+    logsNextCursor = null;
     logsLoaded = false;
     document.getElementById('mainSection').style.display = 'none';
     document.getElementById('authSection').style.display = 'flex';
@@ -101,10 +124,22 @@ function switchTab(tab) {
 
 // ========== 用户列表 ==========
 
-async function loadUsers() {
-    const users = await adminRequest('/admin/users');
-    usersData = users;
-    renderUserTable(users);
+const USERS_PAGE_SIZE = 50;
+
+async function loadUsers(cursor = null) {
+    const page = await adminRequestPage('/admin/users', USERS_PAGE_SIZE, cursor);
+    usersData = cursor ? usersData.concat(page.items) : page.items;
+    usersNextCursor = page.nextCursor;
+    renderUserTable(usersData);
+}
+
+async function loadMoreUsers() {
+    if (!usersNextCursor) return;
+    try {
+        await loadUsers(usersNextCursor);
+    } catch (e) {
+        alert('加载失败：' + e.message);
+    }
 }
 
 function renderUserTable(users) {
@@ -133,7 +168,7 @@ function renderUserTable(users) {
                 <button class="admin-btn admin-btn-sm" onclick="resetPassword('${u.id}', '${label}')">重置密码</button>
             </td>
         </tr>`;
-    }).join('');
+    }).join('') + (usersNextCursor ? loadMoreRow(8, 'loadMoreUsers') : '');
 }
 
 // ========== 操作日志 ==========
@@ -152,17 +187,25 @@ const ACTION_LABELS = {
     delete_welcome_message: '删除激励语',
 };
 
-async function loadLogs() {
+const LOGS_PAGE_SIZE = 100;
+
+async function loadLogs(cursor = null) {
     try {
-        const logs = await adminRequest('/admin/logs');
+        const page = await adminRequestPage('/admin/logs', LOGS_PAGE_SIZE, cursor);
+        logsData = cursor ? logsData.concat(page.items) : page.items;
+        logsNextCursor = page.nextCursor;
         logsLoaded = true;
-        renderLogTable(logs);
+        renderLogTable(logsData);
     } catch (e) {
         document.getElementById('logTableBody').innerHTML =
             '<tr><td colspan="4" class="admin-table-empty">加载失败</td></tr>';
     }
 }
 
+function loadMoreLogs() {
+    if (logsNextCursor) loadLogs(logsNextCursor);
+}
+
 function renderLogTable(logs) {
     const tbody = document.getElementById('logTableBody');
     if (!logs.length) {
@@ -182,7 +225,7 @@ function renderLogTable(logs) {
                 <td class="admin-log-detail">${log.detail || '-'}</td>
             </tr>
         `;
-    }).join('');
+    }).join('') + (logsNextCursor ? loadMoreRow(4, 'loadMoreLogs') : '');
 }
 
 // ========== 创建用户 ==========
@@ -840,18 +883,49 @@ function closeRetentionModal() {
 
 let currentUserDetail = null;
 let currentMemoirDetail = null;
+// 回忆录按页加载，已加载的累积在这里
+let currentUserMemoirs = [];
+let memoirNextCursor = null;
 
 async function viewUserDetail(userId) {
     try {
+        // 先拿概要（资料 + 统计），回忆录列表随后分页加载
         const detail = await adminRequest(`/admin/user/${userId}/detail`);
         currentUserDetail = detail;
+        currentUserMemoirs = [];
+        memoirNextCursor = null;
         renderUserDetail(detail);
         showUserDetailTab();
+        loadUserMemoirs(userId);
     } catch (e) {
         alert('加载用户详情失败：' + e.message);
     }
 }
 
+async function loadUserMemoirs(userId, cursor = null) {
+    const container = document.getElementById('memoirListContainer');
+    if (!cursor) {
+        container.innerHTML = '<div class="admin-empty-state">加载中...</div>';
+    }
+    try {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const page = await adminRequest(`/admin/user/${userId}/memoirs${query}`);
+        // 加载期间切换到了别的用户
+        if (!currentUserDetail || currentUserDetail.id !== userId) return;
+        currentUserMemoirs = currentUserMemoirs.concat(page.items);
+        memoirNextCursor = page.next_cursor;
+        renderMemoirList(currentUserMemoirs);
+    } catch (e) {
+        container.innerHTML = '<div class="admin-empty-state">加载失败</div>';
+    }
+}
+
+function loadMoreMemoirs() {
+    if (currentUserDetail && memoirNextCursor) {
+        loadUserMemoirs(currentUserDetail.id, memoirNextCursor);
+    }
+}
+
 function showUserDetailTab() {
     // 隐藏所有面板
     document.querySelectorAll('.admin-tab-panel').forEach(panel => {
@@ -867,6 +941,8 @@ function showUserDetailTab() {
 
 function backToUserList() {
     currentUserDetail = null;
+    currentUserMemoirs = [];
+    memoirNextCursor = null;
     switchTab('users');
 }
 
@@ -893,12 +969,11 @@ function renderUserDetail(detail) {
     document.getElementById('detailProfileBadge').textContent = detail.profile_completed ? '资料完整' : '资料未完成';
 
     // 统计数据
-    document.getElementById('detailConvCount').textContent = detail.conversations ? detail.conversations.length : 0;
-    document.getElementById('detailMemoirCount').textContent = detail.memoirs ? detail.memoirs.length : 0;
+    document.getElementById('detailConvCount').textContent = detail.conversation_count || 0;
+    document.getElementById('detailMemoirCount').textContent = detail.memoir_count || 0;
 
-    // 计算活跃天数
-    const activeDays = calculateActiveDays(detail.conversations);
-    document.getElementById('detailDaysActive').textContent = activeDays;
+    // 活跃天数
+    document.getElementById('detailDaysActive').textContent = detail.active_days || 0;
 
     // 账号信息
     document.getElementById('detailPhone').textContent = detail.phone || '-';
@@ -907,8 +982,9 @@ function renderUserDetail(detail) {
         : '-';
 
     // 最后活跃时间
-    const lastActive = getLastActiveTime(detail.conversations);
-    document.getElementById('detailLastActive').textContent = lastActive;
+    document.getElementById('detailLastActive').textContent = detail.last_active_at
+        ? new Date(detail.last_active_at).toLocaleString('zh-CN')
+        : '暂无活动';
 
     // 基础信息
     document.getElementById('detailNickname').textContent = detail.nickname || '-';
@@ -918,9 +994,8 @@ function renderUserDetail(detail) {
     document.getElementById('detailHometown').textContent = detail.hometown || '-';
     document.getElementById('detailMainCity').textContent = detail.main_city || '-';
 
-    // 回忆列表
-    document.getElementById('memoirCount').textContent = detail.memoirs.length;
-    renderMemoirList(detail.memoirs, detail.conversations);
+    // 回忆列表（数量先显示，列表由 loadUserMemoirs 分页加载）
+    document.getElementById('memoirCount').textContent = detail.memoir_count || 0;
 
     // 使用统计
     renderUserStats(detail.stats);
@@ -1049,28 +1124,7 @@ function toggleEraMemory() {
     toggle.textContent = isHidden ? '收起' : '展开';
 }
 
-function calculateActiveDays(conversations) {
-    if (!conversations || conversations.length === 0) return 0;
-    const days = new Set();
-    conversations.forEach(c => {
-        if (c.created_at) {
-            const date = new Date(c.created_at).toLocaleDateString('zh-CN');
-            days.add(date);
-        }
-    });
-    return days.size;
-}
-
-function getLastActiveTime(conversations) {
-    if (!conversations || conversations.length === 0) return '暂无活动';
-    const sorted = [...conversations].sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
-    if (sorted[0] && sorted[0].created_at) {
-        return new Date(sorted[0].created_at).toLocaleString('zh-CN');
-    }
-    return '暂无活动';
-}
-
-function renderMemoirList(memoirs, conversations) {
+function renderMemoirList(memoirs) {
     const container = document.getElementById('memoirListContainer');
 
     if (!memoirs.length) {
@@ -1078,10 +1132,6 @@ function renderMemoirList(memoirs, conversations) {
         return;
     }
 
-    // 创建会话ID到会话的映射
-    const convMap = {};
-    conversations.forEach(c => { convMap[c.id] = c; });
-
     // 按年代分组
     const grouped = {};
     memoirs.forEach(m => {
@@ -1131,7 +1181,8 @@ function renderMemoirList(memoirs, conversations) {
                 </div>
             </div>
         `).join('')}
-    </div>`;
+    </div>
+    ${memoirNextCursor ? '<button class="admin-btn admin-btn-sm admin-load-more" onclick="loadMoreMemoirs()">加载更多</button>' : ''}`;
 }
 
 function formatYearRange(yearStart, yearEnd, timePeriod) {
@@ -1170,16 +1221,11 @@ function formatTimeRange(start, end) {
 function showMemoirDetail(memoirId) {
     if (!currentUserDetail) return;
 
-    const memoir = currentUserDetail.memoirs.find(m => m.id === memoirId);
+    const memoir = currentUserMemoirs.find(m => m.id === memoirId);
     if (!memoir) return;
 
     currentMemoirDetail = memoir;
 
-    // 查找关联的会话
-    const conversation = memoir.conversation_id
-        ? currentUserDetail.conversations.find(c => c.id === memoir.conversation_id)
-        : null;
-
     // 设置标题
     document.getElementById('memoirDetailTitle').textContent = memoir.title;
 
@@ -1194,9 +1240,30 @@ function showMemoirDetail(memoirId) {
     // 设置回忆录内容
     document.getElementById('memoirText').textContent = memoir.content || '（内容为空）';
 
-    // 设置对话记录
-    if (conversation && conversation.messages && conversation.messages.length > 0) {
-        document.getElementById('transcriptList').innerHTML = conversation.messages.map(msg => {
+    // 对话记录按页加载
+    if (memoir.conversation_id) {
+        document.getElementById('transcriptList').innerHTML = '<div class="admin-empty-state">加载中...</div>';
+        loadTranscript(memoir.conversation_id);
+    } else {
+        document.getElementById('transcriptList').innerHTML = '<div class="admin-empty-state">暂无对话记录</div>';
+    }
+
+    // 默认显示回忆录标签
+    switchMemoirTab('memoir');
+
+    // 显示弹窗
+    document.getElementById('memoirDetailModal').style.display = 'flex';
+}
+
+async function loadTranscript(conversationId, cursor = null) {
+    const list = document.getElementById('transcriptList');
+    try {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const page = await adminRequest(`/admin/conversation/${conversationId}/messages${query}`);
+        // 加载期间弹窗已关闭或换了一篇
+        if (!currentMemoirDetail || currentMemoirDetail.conversation_id !== conversationId) return;
+
+        const html = page.items.map(msg => {
             const roleText = msg.role === 'user' ? '用户' : '记录师';
             const roleClass = msg.role === 'user' ? 'user' : 'assistant';
             return `
@@ -1206,15 +1273,21 @@ function showMemoirDetail(memoirId) {
                 </div>
             `;
         }).join('');
-    } else {
-        document.getElementById('transcriptList').innerHTML = '<div class="admin-empty-state">暂无对话记录</div>';
-    }
-
-    // 默认显示回忆录标签
-    switchMemoirTab('memoir');
+        const more = page.next_cursor
+            ? `<button class="admin-btn admin-btn-sm admin-load-more" onclick="loadTranscript('${conversationId}', '${page.next_cursor}')">加载更多</button>`
+            : '';
 
-    // 显示弹窗
-    document.getElementById('memoirDetailModal').style.display = 'flex';
+        if (!cursor) {
+            list.innerHTML = html ? html + more : '<div class="admin-empty-state">暂无对话记录</div>';
+        } else {
+            list.querySelector('.admin-load-more')?.remove();
+            list.insertAdjacentHTML('beforeend', html + more);
+        }
+    } catch (e) {
+        if (!cursor) {
+            list.innerHTML = '<div class="admin-empty-state">加载失败</div>';
+        }
+    }
 }
 
 function closeMemoirDetailModal() {
@@ -5,6 +5,12 @@ const API_BASE_URL = '/api';
 const api = {
     // 通用请求方法
     async request(endpoint, options = {}) {
+        const response = await api.send(endpoint, options);
+        return response && response.json();
+    },
+
+    // 发送请求，返回成功的 Response（401 时跳转登录页）
+    async send(endpoint, options = {}) {
         const url = `${API_BASE_URL}${endpoint}`;
         const token = storage.get('token');
         const headers = {
@@ -33,13 +39,97 @@ const api = {
                 const error = await response.json();
                 throw new Error(error.detail || '请求失败');
             }
-            return await response.json();
+            return response;
         } catch (error) {
             console.error('API Error:', error);
             throw error;
         }
     },
 
+    // 订阅 SSE：dispatch(event, data)，收到 done 事件后结束
+    // 返回 AbortController，controller.done 在收到 done 时 resolve，连接失败或异常断开时 reject
+    subscribe(endpoint, dispatch, brokenMessage = '连接中断') {
+        const controller = new AbortController();
+        const token = storage.get('token');
+        const headers = {};
+        if (token) {
+            headers['Authorization'] = `Bearer ${token}`;
+        }
+
+        controller.done = (async () => {
+            const response = await fetch(`${API_BASE_URL}${endpoint}`, {
+                headers,
+                signal: controller.signal,
+            });
+            if (!response.ok) {
+                throw new Error('订阅失败');
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                // 事件之间以空行分隔，最后一段可能不完整，留到下次
+                const blocks = buffer.split('\n\n');
+                buffer = blocks.pop();
+                for (const block of blocks) {
+                    let event = 'message';
+                    let data = '';
+                    for (const line of block.split('\n')) {
+                        if (line.startsWith('event: ')) event = line.slice(7);
+                        else if (line.startsWith('data: ')) data += line.slice(6);
+                    }
+                    if (!data) continue;  // 心跳注释
+                    const parsed = JSON.parse(data);
+                    dispatch(event, parsed);
+                    if (event === 'done') return parsed;
+                }
+            }
+            throw new Error(brokenMessage);
+        })();
+
+        return controller;
+    },
+
+    // 后台任务（提交类接口返回 { job_id, status }）
+    job: {
+        async get(jobId) {
+            return api.request(`/job/${jobId}`);
+        },
+
+        // 订阅任务状态（SSE），onStatus 在状态变化时调用
+        stream(jobId, onStatus) {
+            return api.subscribe(`/job/${jobId}/stream`, (event, data) => {
+                if (event === 'status' && onStatus) onStatus(data);
+            }, '任务状态连接中断');
+        },
+
+        // 等待任务结束，返回任务（含 result）；任务失败时抛出。SSE 不可用时改为轮询
+        async wait(jobId, onStatus = null) {
+            let job;
+            try {
+                job = await api.job.stream(jobId, onStatus).done;
+            } catch (error) {
+                console.warn('任务状态订阅失败，改为轮询:', error);
+                while (true) {
+                    job = await api.job.get(jobId);
+                    if (job.status === 'succeeded' || job.status === 'failed') break;
+                    if (onStatus) onStatus(job);
+                    await new Promise(resolve => setTimeout(resolve, 2000));
+                }
+            }
+            if (job.status !== 'succeeded') {
+                throw new Error(job.error || '任务失败');
+            }
+            return job;
+        },
+    },
+
     // 认证相关
     auth: {
         async login(phone, password) {
@@ -83,6 +173,7 @@ const api = {
             return api.request('/user/me/era-memories');
         },
 
+        // 提交重新生成任务，返回 { job_id, status }
         async regenerateEraMemories() {
             return api.request('/user/me/era-memories/regenerate', {
                 method: 'POST',
@@ -100,8 +191,10 @@ const api = {
             return api.request('/user/welcome-messages');
         },
 
+        // 导出为 zip（NDJSON 数据 + Markdown 访谈记录 + 回忆录成书），返回 Blob
         async exportData() {
-            return api.request('/user/me/export');
+            const response = await api.send('/user/me/export?format=zip&book=true');
+            return response && response.blob();
         },
     },
 
@@ -171,6 +264,7 @@ const api = {
             return fullText;
         },
 
+        // 提交结束对话（生成摘要）任务，返回 { job_id, status }
         async end(conversationId) {
             return api.request(`/conversation/${conversationId}/end`, {
                 method: 'POST',
@@ -225,6 +319,7 @@ const api = {
 
     // 回忆录相关
     memoir: {
+        // 提交生成任务，返回 { job_id, status }；完成后 result.memoir_id
         async generate(conversationId, title = null, perspective = '第一人称') {
             return api.request('/memoir/generate', {
                 method: 'POST',
@@ -267,6 +362,18 @@ const api = {
             });
         },
 
+        // 订阅回忆录生成进度（SSE），handlers: { onStage, onDraft, onError, onDone }
+        // 返回 AbortController，调用 abort() 断开；连接失败或异常断开时 reject
+        stream(memoirId, handlers = {}) {
+            return api.subscribe(`/memoir/${memoirId}/stream`, (event, data) => {
+                if (event === 'stage' && handlers.onStage) handlers.onStage(data);
+                else if (event === 'draft' && handlers.onDraft) handlers.onDraft(data);
+                else if (event === 'error' && handlers.onError) handlers.onError(data);
+                else if (event === 'done' && handlers.onDone) handlers.onDone(data);
+            }, '生成进度连接中断');
+        },
+
+        // 提交重新生成任务，返回 { job_id, status }
         async regenerate(memoirId, perspective = '第一人称') {
             return api.request(`/memoir/${memoirId}/regenerate`, {
                 method: 'POST',
@@ -316,12 +316,11 @@ async function exportMyData() {
     dropdown.classList.remove('show');
 
     try {
-        const data = await api.user.exportData();
-        const blob = new Blob([JSON.stringify(data, null, 2)], { type: 'application/json' });
+        const blob = await api.user.exportData();
         const url = URL.createObjectURL(blob);
         const a = document.createElement('a');
         a.href = url;
-        a.download = '我的回忆录数据.json';
+        a.download = '我的回忆录数据.zip';
         document.body.appendChild(a);
         a.click();
         document.body.removeChild(a);
@@ -664,19 +663,9 @@ async function regenerateEraMemories() {
     regenerateBtn.textContent = '生成中...';
 
     try {
-        const data = await api.user.regenerateEraMemories();
-
-        if (data.era_memories) {
-            contentEl.textContent = data.era_memories;
-            updateEraMemoriesStatus('completed');
-            regenerateBtn.disabled = false;
-            regenerateBtn.textContent = '重新生成';
-        } else {
-            contentEl.innerHTML = '<p class="empty-text">生成失败，请确保已填写出生年份</p>';
-            updateEraMemoriesStatus('failed');
-            regenerateBtn.disabled = false;
-            regenerateBtn.textContent = '重新生成';
-        }
+        const { job_id } = await api.user.regenerateEraMemories();
+        await api.job.wait(job_id);
+        await loadEraMemories();
     } catch (error) {
         console.error('重新生成时代记忆失败:', error);
         contentEl.innerHTML = '<p class="empty-text">生成失败: ' + error.message + '</p>';
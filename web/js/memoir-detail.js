@@ -156,7 +156,9 @@ async function regenerateMemoir() {
     `;
 
     try {
-        const memoir = await api.memoir.regenerate(currentMemoir.id, currentPerspective);
+        const { job_id } = await api.memoir.regenerate(currentMemoir.id, currentPerspective);
+        await api.job.wait(job_id);
+        const memoir = await api.memoir.get(currentMemoir.id);
 
         // 更新显示
         document.getElementById('memoirContent').textContent = memoir.content;
@@ -1,6 +1,17 @@
 // 回忆录页面逻辑
 
 let refreshTimer = null;
+// 撰写中的回忆录 -> 进度订阅（SSE）
+const progressStreams = {};
+
+// 生成步骤对应的提示
+const STAGE_TEXT = {
+    analyzing: '正在梳理内容...',
+    drafting: '正在撰写...',
+    checking: '正在核对...',
+    revising: '正在修改...',
+    merging: '正在合并章节...',
+};
 
 // 页面加载
 window.onload = async function() {
@@ -14,11 +25,12 @@ window.onload = async function() {
     await loadMemoirs();
 };
 
-// 页面卸载时清除定时器
+// 页面卸载时清除定时器和进度订阅
 window.onbeforeunload = function() {
     if (refreshTimer) {
         clearInterval(refreshTimer);
     }
+    Object.values(progressStreams).forEach(stream => stream.abort());
 };
 
 // 加载回忆录列表
@@ -34,11 +46,10 @@ async function loadMemoirs() {
 
         renderMemoirs(memoirs);
 
-        // 如果有撰写中的回忆录，启动自动刷新
-        const hasGenerating = memoirs.some(m => m.status === 'generating');
-        if (hasGenerating) {
-            startAutoRefresh();
-        } else {
+        // 撰写中的回忆录订阅生成进度；订阅失败时退回定时刷新
+        const generating = memoirs.filter(m => m.status === 'generating');
+        generating.forEach(m => watchProgress(m.id));
+        if (generating.length === 0) {
             stopAutoRefresh();
         }
     } catch (error) {
@@ -47,6 +58,45 @@ async function loadMemoirs() {
     }
 }
 
+// 订阅一篇回忆录的生成进度：显示当前步骤和正在写出的文字，完成后刷新列表
+function watchProgress(memoirId) {
+    if (progressStreams[memoirId]) return;
+
+    let draft = '';
+    const stream = api.memoir.stream(memoirId, {
+        onStage(data) {
+            const status = document.querySelector(`[data-memoir-id="${memoirId}"] .memoir-status`);
+            if (status) status.textContent = STAGE_TEXT[data.stage] || '撰写中...';
+        },
+        onDraft(data) {
+            draft = data.reset ? data.text : draft + data.text;
+            const preview = document.querySelector(`[data-memoir-id="${memoirId}"] .memoir-draft-preview`);
+            if (preview) {
+                // 只显示最新写出的一小段
+                preview.textContent = draft.length > 80 ? '…' + draft.slice(-80) : draft;
+                preview.style.display = draft ? 'block' : 'none';
+            }
+        },
+        onError() {
+            const status = document.querySelector(`[data-memoir-id="${memoirId}"] .memoir-status`);
+            if (status) status.textContent = '遇到问题，正在重试...';
+        },
+    });
+    progressStreams[memoirId] = stream;
+
+    stream.done
+        .then(() => {
+            delete progressStreams[memoirId];
+            loadMemoirs();
+        })
+        .catch(error => {
+            delete progressStreams[memoirId];
+            if (error.name === 'AbortError') return;
+            console.error('订阅生成进度失败:', error);
+            startAutoRefresh();
+        });
+}
+
 // 启动自动刷新
 function startAutoRefresh() {
     if (refreshTimer) return;
@@ -74,7 +124,7 @@ function renderMemoirs(memoirs) {
         const yearText = formatYearRange(memoir.year_start, memoir.year_end, memoir.time_period);  // 内容年份
 
         return `
-            <div class="memoir-item ${isGenerating ? 'generating' : ''}"
+            <div class="memoir-item ${isGenerating ? 'generating' : ''}" data-memoir-id="${memoir.id}"
                  ${isGenerating ? '' : `onclick="viewMemoir('${memoir.id}')"`}>
                 <div class="memoir-item-content">
                     <div class="memoir-item-header">
@@ -83,6 +133,7 @@ function renderMemoirs(memoirs) {
                     </div>
                     ${yearText ? `<p class="memoir-year">${yearText}</p>` : ''}
                     ${timeText ? `<p class="memoir-time">${timeText}</p>` : ''}
+                    ${isGenerating ? '<p class="memoir-draft-preview" style="display: none;"></p>' : ''}
                 </div>
                 <button class="btn-delete" onclick="deleteMemoir(event, '${memoir.id}')" title="删除">
                     <svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">